@@ -0,0 +1,262 @@
+"""
+Author: Rafael Gomes Alves
+Description: Behaviour checks of the local climate control of the gateways.
+Each check creates a ClimateController with a stub DHT22 and stub outputs (see fakes.py for
+the setup of the gateway modules), feeds it samples at given times on the monotonic clock, and
+asserts on the decisions of decide() and switch():
+- hysteresis: crossing the band and staying inside it
+- minimum on time: a change held until holdUntil
+- stale samples: the outputs turned off after staleTimeout, or with a stale sample
+- pid: the duty saturating at 1 without the integral winding up, and the time proportioning
+- commands: malformed setSetpoint, setPid and setMode answered with an error
+Usage (from the repository folder):
+- python benchmarks/climate_checks.py
+- python benchmarks/climate_checks.py -k pid --gateway rasp2
+"""
+
+import argparse
+import logging
+import sys
+
+import fakes
+
+CHECKS = {}
+
+
+def check(function):
+    """Register a check. The function receives a factory of controllers and raises AssertionError on failure."""
+    CHECKS[function.__name__] = function
+    return function
+
+
+class StubSensor:
+    """Stub for the DHT22: the controller reads its last sample and its collect interval."""
+
+    def __init__(self, collectInterval=60):
+        self.temperature = None
+        self.humidity = None
+        self.stale = False
+        self.collectInterval = collectInterval
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+
+class StubOutput:
+    """Stub for a Pump or a Cold fixture, recording the states set by the controller."""
+
+    def __init__(self):
+        self.states = []
+
+    def set_control(self, on):
+        self.states.append(on)
+
+
+def make_controller(collectInterval=60, **settings):
+    """Create a controller cooling the temperature, with a setpoint of 24 and the given settings."""
+    from lib.climate import ClimateController
+
+    sensor, output = StubSensor(collectInterval), StubOutput()
+    controller = ClimateController(fakes.StubMqttClient(), "climate_key", "climate:001", sensor, [output])
+    controller.acknowledgements = []
+    controller.reporter.acknowledge = controller.acknowledgements.append
+    controller.setpoint = 24.0
+    for name, value in settings.items():
+        setattr(controller, name, value)
+    return controller, sensor, output
+
+
+def step(controller, now, value=None):
+    """Feed a sample (if any) at a time on the monotonic clock, and apply the decision as run_async does."""
+    if value is not None:
+        controller.sensor.temperature = value
+        for listener in controller.sensor.listeners:
+            listener(controller.sensor)
+    output, reason = controller.decide(now)
+    controller.switch(output, reason, now)
+    return controller.output
+
+
+# --- Hysteresis ---
+@check
+def hysteresis_band(make):
+    controller, _, output = make(hysteresis=1.0)
+
+    assert output.states == [False]  # Off until the first sample
+    assert step(controller, 0, 24.6) is True and "above the band" in controller.reason
+    assert step(controller, 60, 24.2) is True and "inside the band" in controller.reason
+    assert step(controller, 120, 23.9) is True
+    assert step(controller, 180, 23.4) is False and "below the band" in controller.reason
+    assert step(controller, 240, 24.3) is False and "inside the band" in controller.reason
+    assert output.states == [False, True, False]
+
+
+@check
+def hysteresis_heat(make):
+    controller, _, output = make(hysteresis=1.0, action="heat")
+
+    assert step(controller, 0, 23.4) is True
+    assert step(controller, 60, 24.6) is False
+    assert output.states == [False, True, False]
+
+
+# --- Minimum on and off times ---
+@check
+def minimum_on_time(make):
+    controller, _, output = make(hysteresis=1.0, minOnTime=90.0)
+
+    assert step(controller, 0, 26) is True and controller.lastSwitch == 0
+    # Below the band after 30 seconds, the outputs stay on until the end of the minimum on time
+    assert step(controller, 30, 22) is True
+    assert controller.holdUntil == 90 and "held for the minimum on time of 90.0 seconds" in controller.reason
+    assert controller.next_check(30) == 90
+    assert output.states == [False, True]
+    # At holdUntil the decision is taken again with the last sample
+    assert step(controller, 90) is False and controller.holdUntil is None
+    assert output.states == [False, True, False]
+
+
+@check
+def minimum_off_time(make):
+    controller, _, output = make(hysteresis=1.0, minOffTime=120.0)
+
+    step(controller, 0, 26)
+    step(controller, 60, 22)
+    assert step(controller, 100, 26) is False and controller.holdUntil == 180
+    assert step(controller, 180) is True
+    assert output.states == [False, True, False, True]
+
+
+# --- Stale samples ---
+@check
+def stale_timeout(make):
+    controller, _, output = make(hysteresis=1.0, staleTimeout=30.0)
+
+    assert step(controller, 0, 26) is True
+    assert controller.next_check(0) == 30
+    assert step(controller, 29.9) is True
+    assert step(controller, 30) is False and controller.reason == "no recent sample, outputs off"
+    assert output.states == [False, True, False]
+    # A new sample gives the control back
+    assert step(controller, 31, 26) is True
+
+
+@check
+def stale_sample(make):
+    controller, sensor, output = make(hysteresis=1.0)
+
+    assert step(controller, 0, 26) is True
+    sensor.stale = True
+    assert step(controller, 60, 26) is False and controller.duty is None
+    assert output.states == [False, True, False]
+
+
+@check
+def stale_held_by_minimum_on_time(make):
+    controller, _, _ = make(hysteresis=1.0, staleTimeout=30.0, minOnTime=600.0)
+
+    step(controller, 0, 26)
+    # The fail-safe is still held by the minimum on time of the outputs
+    assert step(controller, 30) is True and controller.holdUntil == 600
+    assert step(controller, 600) is False
+
+
+# --- PID ---
+@check
+def pid_saturation_without_windup(make):
+    controller, _, output = make(collectInterval=10, mode="pid", kp=0.5, ki=0.01, kd=0.0)
+
+    # Far above the setpoint: the duty saturates at 1 and the integral does not grow
+    for now in range(0, 100, 10):
+        assert step(controller, now, 40) is True
+        assert controller.duty == 1.0 and controller.pulseEnd is None
+    assert controller.integral == 0.0
+    assert output.states == [False, True]
+
+    # Close to the setpoint, the duty follows the error at once: kp * 0.5 + ki * 0.5 * 10
+    assert step(controller, 100, 24.5) is True
+    assert controller.duty == 0.3 and controller.integral == 5.0
+    assert controller.pulseEnd == 103.0 and controller.next_check(100) == 103.0
+
+
+@check
+def pid_time_proportioning(make):
+    controller, _, output = make(collectInterval=10, mode="pid", kp=0.2, ki=0.0, kd=0.0)
+
+    # On for the duty of the sample period, then off until the next sample
+    assert step(controller, 0, 26) is True and controller.duty == 0.4
+    assert step(controller, 3.9) is True
+    assert step(controller, 4) is False and "end of the pulse" in controller.reason
+    assert step(controller, 10, 26) is True
+    # Below the setpoint, the duty is 0
+    assert step(controller, 20, 23) is False and controller.duty == 0.0
+    assert output.states == [False, True, False, True, False]
+
+
+# --- Commands ---
+@check
+def malformed_commands(make):
+    controller, _, _ = make()
+    settings = (controller.mode, controller.setpoint, controller.kp, controller.ki, controller.kd)
+
+    for command, value in (
+        ("setSetpoint", "abc"),
+        ("setSetpoint", "nan"),
+        ("setPid", [1, 2]),
+        ("setPid", "1,2,x"),
+        ("setMode", "auto"),
+    ):
+        controller.commands = {command: value}
+        controller.apply_commands()
+        assert controller.acknowledgements[-1][f"{command}_status"] == "ERROR", (command, value)
+
+    assert (controller.mode, controller.setpoint, controller.kp, controller.ki, controller.kd) == settings
+    assert len(controller.acknowledgements) == 5
+
+    # The loop keeps applying the valid commands
+    controller.commands = {"setSetpoint": "30", "setPid": [1, 0.1, 0]}
+    controller.apply_commands()
+    assert controller.setpoint == 30.0 and (controller.kp, controller.ki, controller.kd) == (1.0, 0.1, 0.0)
+    assert [ack[key] for ack in controller.acknowledgements[-2:] for key in ack if key.endswith("_status")] == ["OK", "OK"]
+
+
+@check
+def setpoint_limits(make):
+    controller, _, _ = make()
+
+    controller.commands = {"setSetpoint": 100}
+    controller.apply_commands()
+    assert controller.setpoint == controller.maxSetpoint
+    assert "limited to" in controller.acknowledgements[-1]["setSetpoint_info"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the decisions of the local climate control")
+    parser.add_argument("-k", "--filter", default="", help="Only run the checks containing this text")
+    parser.add_argument("--gateway", default="rasp1", choices=["rasp1", "rasp2"], help="Gateway whose modules are checked")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.CRITICAL, format="%(asctime)s [%(levelname)s] %(message)s")
+    fakes.install(args.gateway)
+
+    failures = []
+    for name, function in CHECKS.items():
+        if args.filter not in name:
+            continue
+        try:
+            function(make_controller)
+        except Exception as e:
+            failures.append(name)
+            print(f"{name:40s} FAILED  {type(e).__name__}: {e}")
+            continue
+        print(f"{name:40s} ok")
+
+    if failures:
+        print(f"{len(failures)} check(s) failed: {', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Author: Rafael Gomes Alves
+Description: Behaviour checks of the dispatch of populations to the light fixtures.
+Each check drives ga.orion.OrionDispatcher or ga.fleet.FleetDispatcher against the local
+stand-in for Orion (ga.fake_orion.FakeOrion) and asserts on the requests received and on
+the report of each entity:
+- OrionDispatcher: one batch update, the PATCH fallback (batch=False, or a 404 to the batch)
+  and the delta dispatch
+- FleetDispatcher: the retry on 503, the errors not retried, the timeout of each request and
+  the bounded number of requests in flight
+Usage (from the repository folder):
+- python benchmarks/dispatch_checks.py
+- python benchmarks/dispatch_checks.py -k fleet_
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "geneticAlgorithm"))
+
+from ga.fake_orion import FakeOrion  # noqa: E402
+from ga.fleet import FixtureRegistry, FleetDispatcher  # noqa: E402
+from ga.orion import SLOTS, OrionDispatcher  # noqa: E402
+
+POPULATION = [[index * 40, 255 - index * 40, 128] for index in range(len(SLOTS))]
+ENTITY_IDS = list(dict.fromkeys(entity_id for entity_id, _ in SLOTS))
+
+CHECKS = {}
+
+
+def check(function):
+    """Register a check. The function receives a running FakeOrion and raises AssertionError on failure."""
+    CHECKS[function.__name__] = function
+    return function
+
+
+def requests_of(orion, method):
+    return [request for request in orion.requests if request["method"] == method]
+
+
+# --- OrionDispatcher ---
+@check
+def orion_batch(orion):
+    with OrionDispatcher(orion.url) as dispatcher:
+        reports = dispatcher.dispatch(POPULATION)
+
+    assert [report["entity_id"] for report in reports] == ENTITY_IDS
+    assert all(report["status_code"] == 204 for report in reports)
+    assert len(orion.requests) == 1 and orion.requests[0]["path"] == "/v2/op/update"
+    entities = orion.requests[0]["body"]["entities"]
+    assert entities[0]["id"] == ENTITY_IDS[0]
+    assert entities[0]["setLeftColor"] == {"type": "command", "value": POPULATION[0]}
+    assert entities[0]["setRightColor"] == {"type": "command", "value": POPULATION[1]}
+
+
+@check
+def orion_patch_without_batch(orion):
+    with OrionDispatcher(orion.url, batch=False) as dispatcher:
+        reports = dispatcher.dispatch(POPULATION)
+
+    assert sorted(report["entity_id"] for report in reports) == ENTITY_IDS
+    assert all(report["status_code"] == 204 for report in reports)
+    assert not requests_of(orion, "POST")
+    patches = requests_of(orion, "PATCH")
+    assert sorted(request["path"].split("?")[0] for request in patches) == [f"/v2/entities/{entity_id}/attrs" for entity_id in ENTITY_IDS]
+    # The left and right colors of a fixture travel in a single request
+    assert all(set(request["body"]) == {"setLeftColor", "setRightColor"} for request in patches)
+
+
+@check
+def orion_fallback_on_404(orion):
+    orion.batch = False
+    with OrionDispatcher(orion.url) as dispatcher:
+        reports = dispatcher.dispatch(POPULATION)
+        assert not dispatcher.batch
+
+        # The next dispatch goes straight to the PATCH requests
+        population = [[0, 0, 0]] + POPULATION[1:]
+        later = dispatcher.dispatch(population)
+
+    assert all(report["status_code"] == 204 for report in reports)
+    assert [request["method"] for request in orion.requests[:1]] == ["POST"]
+    assert len(requests_of(orion, "POST")) == 1
+    assert [report["entity_id"] for report in later] == [ENTITY_IDS[0]]
+    assert orion.requests[-1]["body"] == {"setLeftColor": {"type": "command", "value": [0, 0, 0]}}
+
+
+@check
+def orion_batch_error(orion):
+    orion.fail_next(500)
+    with OrionDispatcher(orion.url) as dispatcher:
+        reports = dispatcher.dispatch(POPULATION)
+        # Only a batch operation that is not available disables the batch
+        assert dispatcher.batch
+
+    # The commands of a failed batch are sent to each entity
+    assert [request["method"] for request in orion.requests] == ["POST"] + ["PATCH"] * len(ENTITY_IDS)
+    assert sorted(report["entity_id"] for report in reports) == ENTITY_IDS
+    assert all(report["status_code"] == 204 for report in reports)
+
+
+@check
+def orion_error_not_applied(orion):
+    with OrionDispatcher(orion.url, batch=False, workers=1) as dispatcher:
+        orion.fail_next(500)
+        reports = dispatcher.dispatch(POPULATION)
+        [failed] = [report for report in reports if report["status_code"] == 500]
+        # A failed entity is not recorded in the applied state, it is the only one sent again
+        [report] = dispatcher.dispatch(POPULATION)
+
+    assert report["entity_id"] == failed["entity_id"] and report["status_code"] == 204
+
+
+@check
+def orion_delta(orion):
+    with OrionDispatcher(orion.url) as dispatcher:
+        dispatcher.dispatch(POPULATION)
+        assert dispatcher.dispatch(POPULATION) == []
+        assert len(dispatcher.dispatch(POPULATION, force=True)) == len(ENTITY_IDS)
+    assert len(orion.requests) == 2
+
+
+# --- FleetDispatcher ---
+def fleet_registry(orion, size=len(ENTITY_IDS)):
+    return FixtureRegistry([{"entity_id": f"urn:ngsi-ld:light_fixture:{index:03d}"} for index in range(1, size + 1)], orion.url)
+
+
+@check
+def fleet_retry_on_503(orion):
+    orion.fail_next(503, 503)
+    dispatcher = FleetDispatcher(fleet_registry(orion), concurrency=1, retries=3, backoff=0.01)
+    reports = dispatcher.dispatch(POPULATION)
+
+    assert [report["entity_id"] for report in reports] == ENTITY_IDS
+    assert all(report["status"] == "ok" and report["status_code"] == 204 for report in reports)
+    assert sum(report["attempts"] for report in reports) == len(ENTITY_IDS) + 2
+    assert len(orion.requests) == len(ENTITY_IDS) + 2
+
+
+@check
+def fleet_retries_exhausted(orion):
+    orion.fail_next(503, 503, 503)
+    dispatcher = FleetDispatcher(fleet_registry(orion, 1), retries=2, backoff=0.01)
+    [report] = dispatcher.dispatch(POPULATION[:2])
+
+    assert report["status"] == "failed" and report["status_code"] == 503 and report["attempts"] == 3
+    # The failed fixture is not recorded in the applied state, it is sent again
+    [report] = dispatcher.dispatch(POPULATION[:2])
+    assert report["status"] == "ok" and report["attempts"] == 1
+
+
+@check
+def fleet_error_not_retried(orion):
+    orion.fail_next(400)
+    dispatcher = FleetDispatcher(fleet_registry(orion), concurrency=1, backoff=0.01)
+    reports = dispatcher.dispatch(POPULATION)
+
+    failed = [report for report in reports if report["status"] == "failed"]
+    assert len(failed) == 1 and failed[0]["status_code"] == 400 and failed[0]["attempts"] == 1
+    assert len(orion.requests) == len(ENTITY_IDS)
+
+
+@check
+def fleet_timeout(orion):
+    orion.latency = 0.5
+    dispatcher = FleetDispatcher(fleet_registry(orion, 1), timeout=0.1, retries=1, backoff=0.01)
+    start = time.perf_counter()
+    [report] = dispatcher.dispatch(POPULATION[:2])
+
+    assert report["status"] == "failed" and report["status_code"] is None
+    assert report["attempts"] == 2 and "TimeoutError" in report["error"]
+    assert time.perf_counter() - start < 0.5
+
+
+@check
+def fleet_bounded_concurrency(orion):
+    orion.latency = 0.05
+    registry = fleet_registry(orion, 12)
+    dispatcher = FleetDispatcher(registry, concurrency=3)
+    reports = dispatcher.dispatch([[index, index, index] for index in range(len(registry.slots))])
+
+    assert len(reports) == 12 and all(report["status"] == "ok" for report in reports)
+    assert 1 < orion.max_in_flight <= 3
+
+
+@check
+def fleet_delta(orion):
+    dispatcher = FleetDispatcher(fleet_registry(orion))
+    dispatcher.dispatch(POPULATION)
+    population = POPULATION[:5] + [[1, 2, 3]]
+    [report] = dispatcher.dispatch(population)
+
+    assert report["entity_id"] == ENTITY_IDS[-1] and report["commands"] == ["setRightColor"]
+    assert orion.requests[-1]["body"] == {"setRightColor": {"type": "command", "value": [1, 2, 3]}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the dispatch of populations against a local stand-in for Orion")
+    parser.add_argument("-k", "--filter", default="", help="Only run the checks containing this text")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    failures = []
+    for name, function in CHECKS.items():
+        if args.filter not in name:
+            continue
+        # Each check gets a new server, with no request recorded
+        with FakeOrion() as orion:
+            try:
+                function(orion)
+            except Exception as e:
+                failures.append(name)
+                print(f"{name:40s} FAILED  {type(e).__name__}: {e}")
+                continue
+        print(f"{name:40s} ok")
+
+    if failures:
+        print(f"{len(failures)} check(s) failed: {', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Author: Rafael Gomes Alves
+Description: Setup used to benchmark the Raspberry Pi modules on any computer.
+The device modules import the other modules from the `lib` folder used in the gateways, and
+get their hardware from lib.hal. install() selects the simulated hardware of lib.hal and maps
+`lib` to the modules of a gateway, so the device classes can be imported and measured.
+"""
+
+import os
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StubMqttClient:
+    """Stub for MqttClient (device side) and for paho's client (MqttClient side)."""
+
+    def __init__(self):
+        self.connected = True
+        self.published = 0
+
+    def connect(self, *args, **kwargs):
+        pass
+
+    def subscribe(self, topic, *args, **kwargs):
+        pass
+
+    def message_callback_add(self, topic, callback):
+        pass
+
+    def publish(self, topic, payload=None, *args, **kwargs):
+        self.published += 1
+        return types.SimpleNamespace(rc=0)
+
+    def publish_measures(self, topic, measures):
+        self.published += 1
+
+    def flush_measures(self):
+        return 0
+
+
+def install(gateway="rasp1"):
+    """
+    Select the simulated hardware and map `lib` to the modules of a gateway.
+
+    args:
+        gateway (str): The gateway folder in raspberry/. Default is 'rasp1'.
+    """
+    # Simulated hardware, with no latency, so the benchmarks measure the code of the gateway
+    os.environ.setdefault("HARDWARE", "simulated")
+    os.environ.setdefault("SIM_SEED", "42")
+    os.environ.setdefault("SIM_DHT22_LATENCY", "0")
+    os.environ.setdefault("SIM_DHT22_FAILURE_RATE", "0")
+    os.environ.setdefault("SIM_STRIP_PIXEL_TIME", "0")
+
+    # The gateways import their modules from the `lib` folder
+    lib = types.ModuleType("lib")
+    lib.__path__ = [os.path.join(ROOT, "raspberry", gateway, "modules")]
+    sys.modules["lib"] = lib
+
+    # The devices save their data and their MQTT outbox in a temporary folder
+    folder = tempfile.mkdtemp()
+    os.environ.setdefault("DATABASE_FILE", os.path.join(folder, "data.db"))
+    os.environ.setdefault("OUTBOX_FILE", os.path.join(folder, "outbox.db"))
+    os.environ.setdefault("DOTENV_FILE", os.path.join(folder, ".env"))
+    os.environ.setdefault("BROKER_HOST", "localhost")
+    os.environ.setdefault("BROKER_PORT", "1883")
+
+    # The GA package lives next to the notebook
+    sys.path.insert(0, os.path.join(ROOT, "geneticAlgorithm"))
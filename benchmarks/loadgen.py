@@ -0,0 +1,265 @@
+"""
+Author: Rafael Gomes Alves
+Description: Load generator for the MQTT broker and the IoT Agent, with a fleet of virtual devices.
+The virtual devices are the device classes of a gateway (DHT22, Pump, LightFixture, Cold) on the
+simulated hardware of lib.hal, run by the device runtime and spread over several MQTT clients,
+one per virtual gateway. They use the same topics as the real devices:
+- the measures are published in /json/<api_key>/<device_id>/attrs
+- the commands are received in /<api_key>/<device_id>/cmd, and acknowledged in the attrs topic
+A monitor client subscribed to every attrs topic counts the messages received, and sends
+commands to random devices, measuring the time until their acknowledgement (round trip).
+At the end, the publish throughput, the round trip percentiles, and the messages and commands
+lost are reported, as text or JSON.
+The broker is the Mosquitto of the platform, started locally with the configuration of
+platform/mosquitto (Ex. `docker compose up mosquitto` in the platform folder), whose listener
+port is used by default.
+Usage (from the repository folder):
+- python benchmarks/loadgen.py --dht22 1000 --fixtures 100 --pumps 100 --duration 60
+- python benchmarks/loadgen.py --gateway rasp2 --dht22 500 --colds 50 --interval 1 --command-rate 20 --json
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import paho.mqtt.client as mqtt
+
+import fakes
+
+BROKER_CONFIG = os.path.join(fakes.ROOT, "platform", "mosquitto", "mosquitto.conf")
+
+# Device classes of each gateway, and a command acknowledged by each one
+DEVICES = {
+    "dht22": ("lib.dht22", "DHT22", "dht22_key", "setCollectInterval"),
+    "pump": ("lib.pump", "Pump", "pump_key", "setOnInterval"),
+    "fixture": ("lib.rgb_fixture", "LightFixture", "light_fixture_key", "setRightColor"),
+    "cold": ("lib.cold_fixture", "Cold", "light_fixture_key", "setStartTime"),
+}
+
+
+def broker_port(config=BROKER_CONFIG):
+    """Read the listener port of a Mosquitto configuration file, 1883 if not found."""
+    try:
+        with open(config) as file:
+            for line in file:
+                words = line.split("#")[0].split()
+                if len(words) >= 2 and words[0] == "listener":
+                    return int(words[1])
+    except OSError:
+        pass
+    return 1883
+
+
+def command_value(kind, device, rng):
+    """A command for a device, keeping its behaviour, Ex. the same collect interval."""
+    if kind == "dht22":
+        return device.collectInterval
+    if kind == "pump":
+        return device.onInterval
+    if kind == "fixture":
+        return [rng.randint(0, 255) for _ in range(3)]
+    return device.startTime
+
+
+class Monitor:
+    """Client counting the messages of every device, and sending the commands."""
+
+    def __init__(self, host, port, timeout=10):
+        self.timeout = timeout
+        self.received = 0
+        self.pending = {}  # Device id -> (command, time sent)
+        self.round_trips = []
+        self.commands = 0
+        self.lock = threading.Lock()
+        self.connected = threading.Event()
+
+        self.client = mqtt.Client()
+        self.client.on_connect = lambda client, userdata, flags, rc: rc == 0 and self.connected.set()
+        self.client.on_message = self.on_message
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+        if not self.connected.wait(10):
+            raise OSError(f"Could not connect to the broker at {host}:{port}")
+        self.client.subscribe("/json/+/+/attrs")
+
+    def on_message(self, client, userdata, message):
+        now = time.monotonic()
+        device_id = message.topic.split("/")[3]
+        with self.lock:
+            self.received += 1
+            if device_id in self.pending:
+                command, sent = self.pending[device_id]
+                if f"{command}_status".encode() in message.payload:
+                    del self.pending[device_id]
+                    self.round_trips.append(now - sent)
+
+    def send(self, kind, key, device, rng):
+        command = DEVICES[kind][3]
+        with self.lock:
+            if device.sensor_id in self.pending:
+                return
+            self.pending[device.sensor_id] = (command, time.monotonic())
+            self.commands += 1
+        payload = json.dumps({command: command_value(kind, device, rng)})
+        self.client.publish(f"/{key}/{device.sensor_id}/cmd", payload)
+
+    def lost_commands(self):
+        now = time.monotonic()
+        with self.lock:
+            return sum(now - sent > self.timeout for _, sent in self.pending.values())
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def create_devices(args, folder):
+    """Create the virtual devices, spread over args.clients MQTT clients."""
+    import importlib
+
+    from lib.mqtt_client import MqttClient
+
+    counts = {"dht22": args.dht22, "pump": args.pumps, "fixture": args.fixtures, "cold": args.colds}
+    clients = []
+    for index in range(args.clients):
+        # Each virtual gateway has its own outbox
+        os.environ["OUTBOX_FILE"] = os.path.join(folder, f"outbox-{index}.db")
+        clients.append(MqttClient())
+        clients[-1].connect()
+
+    devices = []
+    for kind, count in counts.items():
+        if not count:
+            continue
+        module, name, key, _ = DEVICES[kind]
+        try:
+            device_class = getattr(importlib.import_module(module), name)
+        except ModuleNotFoundError:
+            raise ValueError(f"The gateway {args.gateway} has no {kind} devices")
+        for number in range(count):
+            sensor_id = f"{kind}:{number:05d}"
+            for attribute in ("collectInterval", "onInterval", "offInterval"):
+                os.environ[f"{sensor_id}_{attribute}"] = str(args.interval)
+            if args.heartbeat is not None:
+                os.environ[f"{sensor_id}_heartbeat"] = str(args.heartbeat)
+            device = device_class(clients[len(devices) % len(clients)], key, sensor_id)
+            devices.append((kind, key, device))
+    return clients, devices
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    result = {f"p{q}": round(float(np.percentile(values, q)) * 1000, 2) for q in (50, 90, 99)}
+    result["max"] = round(max(values) * 1000, 2)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the MQTT broker with a fleet of virtual devices")
+    parser.add_argument("--gateway", default="rasp1", choices=["rasp1", "rasp2"], help="Gateway whose device classes are used")
+    parser.add_argument("--dht22", type=int, default=100, help="Number of DHT22 sensors")
+    parser.add_argument("--pumps", type=int, default=0, help="Number of pumps (rasp1)")
+    parser.add_argument("--fixtures", type=int, default=0, help="Number of light fixtures")
+    parser.add_argument("--colds", type=int, default=0, help="Number of cold fixtures (rasp2)")
+    parser.add_argument("--clients", type=int, default=4, help="Number of MQTT clients (virtual gateways)")
+    parser.add_argument("--interval", type=int, default=5, help="Collect interval of the devices in seconds")
+    parser.add_argument("--heartbeat", type=float, help="Heartbeat of the devices in seconds, 0 publishes every measure")
+    parser.add_argument("--command-rate", type=float, default=5, help="Commands sent per second")
+    parser.add_argument("--duration", type=float, default=30, help="Duration of the test in seconds")
+    parser.add_argument("--read-latency", type=float, default=0.0, help="Latency of the simulated DHT22 reads in seconds")
+    parser.add_argument("--host", default=os.environ.get("BROKER_HOST", "localhost"), help="Broker host")
+    parser.add_argument("--port", type=int, default=None, help="Broker port. Default is the listener of platform/mosquitto")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the simulation and of the commands")
+    parser.add_argument("--json", help="Print the report as JSON", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s")
+    port = args.port or broker_port()
+    os.environ["BROKER_HOST"], os.environ["BROKER_PORT"] = args.host, str(port)
+    os.environ.setdefault("SIM_DHT22_LATENCY", str(args.read_latency))
+    os.environ.setdefault("SIM_DHT22_FAILURE_RATE", "0")
+    os.environ["SIM_SEED"] = str(args.seed)
+    fakes.install(args.gateway)
+    from lib.config_store import close_stores
+    from lib.runtime import DeviceRuntime
+    from lib.sqlite_writer import close_writers
+
+    folder = tempfile.mkdtemp()
+    try:
+        monitor = Monitor(args.host, port)
+        clients, devices = create_devices(args, folder)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    runtime = DeviceRuntime()
+    for _, _, device in devices:
+        runtime.add(device)
+
+    rng = random.Random(args.seed)
+    stop = threading.Event()
+
+    def send_commands():
+        next_time = time.monotonic()
+        while args.command_rate > 0 and not stop.is_set():
+            next_time += 1 / args.command_rate
+            stop.wait(max(0, next_time - time.monotonic()))
+            monitor.send(*rng.choice(devices), rng)
+
+    def stop_runtime():
+        stop.wait(args.duration)
+        stop.set()
+        runtime.stop()
+
+    commander = threading.Thread(target=send_commands, daemon=True)
+    timer = threading.Thread(target=stop_runtime, daemon=True)
+    start = time.monotonic()
+    commander.start()
+    timer.start()
+    runtime.run()
+    elapsed = time.monotonic() - start
+
+    # Wait for the messages in flight
+    time.sleep(2)
+    published = sum(client.published for client in clients)
+    outbox = sum(len(client.outbox) for client in clients)
+    report = {
+        "devices": len(devices),
+        "clients": len(clients),
+        "duration": round(elapsed, 2),
+        "published": published,
+        "received": monitor.received,
+        "publish_rate": round(published / elapsed, 1),
+        "receive_rate": round(monitor.received / elapsed, 1),
+        "dropped": max(0, published - outbox - monitor.received),
+        "outbox": outbox,
+        "commands": monitor.commands,
+        "acknowledged": len(monitor.round_trips),
+        "lost_commands": monitor.lost_commands(),
+        "round_trip_ms": percentiles(monitor.round_trips),
+        "scheduler_wakeups": runtime.scheduler.wakeups,
+    }
+    monitor.close()
+    for client in clients:
+        client.disconnect()
+    close_writers()
+    close_stores()
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for name, value in report.items():
+            print(f"{name:20s} {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Author: Rafael Gomes Alves
+Description: Micro-benchmarks for the hot paths of the Genetic Algorithm and the Raspberry Pi gateways.
+Each benchmark uses fixed seeds and simulated hardware (see fakes.py), so the results are
+reproducible on any computer. The time per call of each benchmark can be saved as a
+baseline and compared with later runs to catch regressions before the code reaches the Pis.
+Usage (from the repository folder):
+- python benchmarks/run.py                   # Run and compare with benchmarks/baselines.json
+- python benchmarks/run.py --save            # Run and save the results as the new baseline
+- python benchmarks/run.py -k ga_ --threshold 0.3
+The baseline committed in benchmarks/baselines.json records the machine and the Python version
+it was measured with. The times depend on the computer, so a run on another machine shows a
+warning, and a baseline saved on the Pi (or the CI runner) should replace it there.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import timeit
+
+import fakes
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+SEED = 42
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    """Register a benchmark. The function receives a seed and returns the callable to measure."""
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+# --- Genetic Algorithm ---
+@benchmark
+def ga_decimal_to_binary(seed):
+    from ga.operators import decimal_to_binary
+
+    values = random.Random(seed).choices(range(256), k=90)
+    return lambda: [decimal_to_binary(value) for value in values]
+
+
+@benchmark
+def ga_generate_population(seed):
+    from ga.operators import generate_population
+
+    random.seed(seed)
+    return lambda: generate_population(30, 3)
+
+
+@benchmark
+def ga_crossover(seed):
+    from ga.operators import crossover, generate_population
+
+    random.seed(seed)
+    population = generate_population(30, 3)
+    return lambda: crossover(population[0], population)
+
+
+@benchmark
+def ga_mutation(seed):
+    from ga.operators import generate_population, mutation
+
+    random.seed(seed)
+    population = generate_population(30, 3)
+    return lambda: mutation(population)
+
+
+@benchmark
+def ga_generate_new_population(seed):
+    from ga.operators import generate_new_population, generate_population
+
+    random.seed(seed)
+    population = generate_population(6, 3)
+    fitness_values = [random.random() for _ in population]
+    return lambda: generate_new_population(population, fitness_values)
+
+
+@benchmark
+def ga_vectorized_crossover_mutation(seed):
+    import numpy as np
+    from ga import vectorized
+
+    rng = np.random.default_rng(seed)
+    population = vectorized.generate_population(30, 3, rng)
+    return lambda: vectorized.mutation(vectorized.crossover(population[0], population, rng), rng=rng)
+
+
+@benchmark
+def ga_vectorized_generate_new_population(seed):
+    import numpy as np
+    from ga import vectorized
+
+    rng = np.random.default_rng(seed)
+    population = vectorized.generate_population(6, 3, rng)
+    fitness_values = rng.random(6)
+    return lambda: vectorized.generate_new_population(population, fitness_values, rng=rng)
+
+
+# --- Raspberry Pi gateways ---
+@benchmark
+def fixture_actuate(seed):
+    from lib.rgb_fixture import LightFixture
+    from lib.schedule import photoperiod
+
+    fixture = LightFixture(fakes.StubMqttClient(), "light_fixture_key", "light_fixture:001")
+    fixture.schedule = photoperiod("00:00:00", "00:00:00")  # On all day, so the set colors are shown
+    rng = random.Random(seed)
+    colors = [tuple(rng.randint(0, 255) for _ in range(6)) for _ in range(2)]
+
+    def actuate():
+        # Alternate between two recipes, so every call repacks and shows a new frame, as in the device loop
+        colors.reverse()
+        (
+            fixture.setRightRed, fixture.setRightGreen, fixture.setRightBlue,
+            fixture.setLeftRed, fixture.setLeftGreen, fixture.setLeftBlue,
+        ) = colors[0]
+        fixture.update_current_color()
+        fixture.actuate()
+
+    return actuate
+
+
+@benchmark
+def fixture_redraw(seed):
+    from lib.rgb_fixture import LightFixture
+
+    fixture = LightFixture(fakes.StubMqttClient(), "light_fixture_key", "light_fixture:001")
+    rng = random.Random(seed)
+    colors = [tuple(rng.randint(0, 255) for _ in range(3)) for _ in range(2)]
+
+    def redraw():
+        # Alternate between two colors, so every call sends a new frame to the strip
+        colors.reverse()
+        fixture.frame.fill("right", colors[0])
+        fixture.frame.fill("left", colors[1])
+        fixture.frame.show(fixture.strip)
+
+    return redraw
+
+
+@benchmark
+def dht22_read_data(seed):
+    import lib.dht22
+
+    sensor = lib.dht22.DHT22(fakes.StubMqttClient(), "dht22_key", "dht22:001")
+    return lambda: sensor.update_readings(*sensor.read_data())
+
+
+@benchmark
+def dht22_save_data(seed):
+    import lib.dht22
+
+    sensor = lib.dht22.DHT22(fakes.StubMqttClient(), "dht22_key", "dht22:001")
+    rng = random.Random(seed)
+    sensor.humidity, sensor.temperature = rng.uniform(40, 80), rng.uniform(15, 30)
+    return sensor.save_data
+
+
+@benchmark
+def sqlite_writer_commit(seed):
+    from lib.sqlite_writer import get_writer
+
+    writer = get_writer(os.environ["DATABASE_FILE"])
+    writer.create_table("benchmark", "temperature REAL, humidity REAL")
+    rng = random.Random(seed)
+    rows = [{"temperature": rng.uniform(15, 30), "humidity": rng.uniform(40, 80)} for _ in range(100)]
+
+    def commit_rows():
+        for row in rows:
+            writer.insert("benchmark", row)
+        writer.flush()
+
+    return commit_rows
+
+
+@benchmark
+def mqtt_publish(seed):
+    from lib.mqtt_client import MqttClient
+
+    client = MqttClient()
+    client.client = fakes.StubMqttClient()
+    client.connected = True
+    payload = json.dumps({"t": 24.0, "rh": 55.0, "ci": 60, "timestamp": 0})
+    return lambda: client.publish("/json/dht22_key/dht22:001/attrs", payload)
+
+
+# --- Runner ---
+def measure(function, repeat=5, min_time=0.2):
+    """
+    Measure the time per call of a function.
+
+    args:
+        function (callable): The function to measure.
+        repeat (int): Number of measurements. Default value is 5.
+        min_time (float): Minimum duration of each measurement in seconds. Default value is 0.2.
+
+    Returns:
+        float: The best time per call in seconds.
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat, number)) / number
+
+
+def metadata():
+    """The machine and the versions a run was measured with."""
+    import numpy
+
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": numpy.__version__,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the micro-benchmarks of the GA and the gateways")
+    parser.add_argument("-k", "--filter", default="", help="Only run the benchmarks containing this text")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file")
+    parser.add_argument("--save", help="Save the results as the new baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Maximum slowdown allowed against the baseline. Ex. 0.2 is 20%%")
+    parser.add_argument("--gateway", default="rasp1", choices=["rasp1", "rasp2"], help="Gateway whose modules are measured")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s")
+    fakes.install(args.gateway)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            saved = json.load(file)
+        baseline = saved.get("results", {})
+        current = metadata()
+        different = {key: saved.get(key) for key in ("python", "machine", "system", "cpus") if saved.get(key) != current[key]}
+        if different and not args.save:
+            print(f"Warning: the baseline was measured on another setup {different}, the comparison is only indicative")
+
+    results = {}
+    regressions = []
+    for name, factory in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        per_call = measure(factory(SEED))
+        results[name] = per_call
+
+        line = f"{name:40s} {per_call * 1e6:12.2f} us"
+        if name in baseline:
+            change = per_call / baseline[name] - 1
+            line += f" {change:+8.1%}"
+            if change > args.threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+
+    if args.save:
+        with open(args.baseline, "w") as file:
+            json.dump({**metadata(), "results": {**baseline, **results}}, file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions and not args.save:
+        print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4 @@
+"""
+Author: Rafael Gomes Alves
+Description: Genetic Algorithm used to search for light recipes in the vertical farm.
+"""
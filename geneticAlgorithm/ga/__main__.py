@@ -0,0 +1,373 @@
+"""
+Author: Rafael Gomes Alves
+Description: Command line interface for the Genetic Algorithm.
+Usage (from the geneticAlgorithm folder):
+- python -m ga step --population '[[1, 2, 3], ...]' --fitness '[10.0, ...]'
+- python -m ga step --population '[[1, 2, 3], ...]' --fitness '[10.0, ...]' --surrogate
+- python -m ga simulate --generations 10000 --fitness-function ga.fitness:distance_to_target
+- python -m ga simulate --generations 10000 --model model.pkl
+- python -m ga simulate --generations 10000 --checkpoint experiment
+- python -m ga resume experiment
+- python -m ga replay run.jsonl
+- python -m ga islands --islands 8 --migration-interval 10 --generations 1000
+- python -m ga migrate --populations '[[[1, 2, 3], ...], ...]' --fitness '[[10.0, ...], ...]'
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+import requests
+
+from ga import operators, vectorized
+from ga.cache import CachedEvaluator, FitnessCache, POPULATION
+from ga.checkpoint import Checkpoint
+from ga.evaluation import PoolEvaluator
+from ga.fitness import ModelFitness, load_fitness_function
+from ga.fleet import FixtureRegistry, FleetDispatcher
+from ga.islands import TOPOLOGIES, migrate, run_islands
+from ga.orion import ORION_URL, AppliedState, OrionDispatcher
+from ga.rng import RandomStreams
+from ga.runner import ENGINES, evaluate_population, replay_run, run_simulation
+from ga.surrogate import COLLECTED_DATA, SurrogateScreen, load_training_data
+
+# Commands applied to the fixtures, kept in the checkpoint folder
+DISPATCH_STATE = "dispatch_state.json"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m ga", description="Run the Genetic Algorithm used to search for light recipes")
+    parser.add_argument("-d", "--debug", help="Enable debug mode", action="store_true")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # --- Common GA parameters ---
+    ga_parser = argparse.ArgumentParser(add_help=False)
+    ga_parser.add_argument("--engine", choices=ENGINES, default="vectorized", help="Engine used for the GA operators")
+    ga_parser.add_argument("--candidates-size", type=int, default=30, help="Number of random candidates per generation")
+    ga_parser.add_argument("--mutation-rate", type=float, default=0.05, help="Probability of flipping each bit")
+    ga_parser.add_argument("--cache", help="SQLite file used to cache the fitness of each recipe")
+    ga_parser.add_argument("--cache-tolerance", type=int, default=0, help="Maximum difference of each gene to reuse a cached fitness")
+    ga_parser.add_argument("--cache-memory-size", type=int, default=1024, help="Number of recipes kept in memory by the cache")
+
+    # --- Surrogate pre-screening ---
+    surrogate_parser = argparse.ArgumentParser(add_help=False)
+    surrogate_parser.add_argument("--surrogate", help="Pre-screen the candidates with a surrogate model", action="store_true")
+    surrogate_parser.add_argument("--surrogate-candidates", type=int, default=300, help="Number of candidates scored by the surrogate")
+    surrogate_parser.add_argument("--surrogate-alpha", type=float, default=0.01, help="Regularization strength of the surrogate")
+    surrogate_parser.add_argument("--surrogate-exploration", type=float, default=0.5, help="Fraction of the population sampled at random instead of the best predicted")
+
+    # --- Manual step, as done with the growth tower ---
+    step_parser = subparsers.add_parser("step", parents=[ga_parser, surrogate_parser], help="Generate the next population from measured fitness values")
+    step_parser.add_argument("--population", help="Current population as JSON, Ex. '[[1, 2, 3], [4, 5, 6]]'. Default is the population of the checkpoint")
+    step_parser.add_argument("--fitness", required=True, help="Fitness of each individual as JSON. Ex. '[10.0, 20.0]'")
+    step_parser.add_argument("--dispatch", help="Send the new population to the light fixtures through Orion", action="store_true")
+    step_parser.add_argument("--orion-url", default=ORION_URL, help="Orion Context Broker URL")
+    step_parser.add_argument("--fleet", help="JSON registry of the fixtures, to dispatch to a fleet of towers")
+    step_parser.add_argument("--dispatch-state", help="JSON file with the commands applied to the fixtures. Default is in the checkpoint folder")
+    step_parser.add_argument("--full-dispatch", help="Send every command, even the ones already applied", action="store_true")
+    step_parser.add_argument("--seed", type=int, help="Seed for the random generators of the first step")
+    step_parser.add_argument("--checkpoint", help="Folder of the checkpoint saved after each step")
+    step_parser.add_argument(
+        "--surrogate-data",
+        nargs="*",
+        default=[COLLECTED_DATA],
+        help="Collected data (.xlsx), run logs (.jsonl) or fitness caches used to train the surrogate",
+    )
+
+    # --- Simulation mode ---
+    simulate_parser = subparsers.add_parser("simulate", parents=[ga_parser, surrogate_parser], help="Run the GA with a simulated fitness")
+    fitness_group = simulate_parser.add_mutually_exclusive_group()
+    fitness_group.add_argument("--fitness-function", default="ga.fitness:distance_to_target", help="Fitness function as '<module or file>:<function>'")
+    fitness_group.add_argument("--model", help="Pickled regression model used as fitness")
+    simulate_parser.add_argument("--generations", type=int, default=1000, help="Number of generations")
+    simulate_parser.add_argument("--population-size", type=int, default=6, help="Number of individuals per generation")
+    simulate_parser.add_argument("--chromosome-size", type=int, default=3, help="Number of genes per individual")
+    simulate_parser.add_argument("--seed", type=int, help="Seed for the random generators")
+    simulate_parser.add_argument("--workers", type=int, help="Evaluate the population in a pool of processes (0 uses all CPU cores)")
+    simulate_parser.add_argument("--chunk-size", type=int, help="Number of individuals sent to a process at once")
+    simulate_parser.add_argument("--timeout", type=float, help="Maximum time in seconds to evaluate an individual")
+    simulate_parser.add_argument("--output", help="Save the result of the simulation to a JSON file")
+    simulate_parser.add_argument("--run-log", help="Record every generation in a JSON Lines file that can be replayed")
+    simulate_parser.add_argument("--checkpoint", help="Folder of the checkpoint saved during the simulation")
+    simulate_parser.add_argument("--checkpoint-interval", type=int, default=1, help="Number of generations between saves of the state to resume, the history records every generation")
+
+    # --- Island model ---
+    islands_parser = subparsers.add_parser("islands", parents=[ga_parser], help="Run the GA in simulation mode with the island model")
+    islands_parser.add_argument("--fitness-function", default="ga.fitness:distance_to_target", help="Fitness function as '<module or file>:<function>'")
+    islands_parser.add_argument("--generations", type=int, default=1000, help="Number of generations of each island")
+    islands_parser.add_argument("--islands", type=int, default=4, help="Number of islands")
+    islands_parser.add_argument("--migration-interval", type=int, default=10, help="Number of generations between migrations")
+    islands_parser.add_argument("--topology", choices=TOPOLOGIES, default="ring", help="Migration topology")
+    islands_parser.add_argument("--population-size", type=int, default=6, help="Number of individuals of each island")
+    islands_parser.add_argument("--chromosome-size", type=int, default=3, help="Number of genes per individual")
+    islands_parser.add_argument("--seed", type=int, help="Seed for the random generators")
+    islands_parser.add_argument("--workers", type=int, help="Number of processes")
+    islands_parser.add_argument("--output", help="Save the result of the simulation to a JSON file")
+
+    # --- Migration between towers ---
+    migrate_parser = subparsers.add_parser("migrate", help="Exchange the best recipes between the populations of several towers")
+    migrate_parser.add_argument("--populations", required=True, help="Population of each tower as JSON")
+    migrate_parser.add_argument("--fitness", required=True, help="Fitness values of each tower as JSON")
+    migrate_parser.add_argument("--topology", choices=TOPOLOGIES, default="ring", help="Migration topology")
+
+    # --- Resume from a checkpoint ---
+    resume_parser = subparsers.add_parser("resume", help="Resume an experiment from its checkpoint")
+    resume_parser.add_argument("checkpoint", help="Folder of the checkpoint")
+    resume_parser.add_argument("--generations", type=int, help="Total number of generations of a simulation. Default is the number of the run")
+    resume_parser.add_argument("--workers", type=int, help="Evaluate the population in a pool of processes (0 uses all CPU cores)")
+    resume_parser.add_argument("--dispatch", help="Send the population of the checkpoint to the fixtures if it was not sent", action="store_true")
+
+    # --- Replay of a run log ---
+    replay_parser = subparsers.add_parser("replay", help="Replay a run log and check that it is reproduced bit-for-bit")
+    replay_parser.add_argument("run_log", help="The JSON Lines run log")
+
+    return parser.parse_args(argv)
+
+
+def dispatch_population(args, population):
+    """Send a population to the fixtures and return the dispatch status saved in the checkpoints."""
+    # Keep the applied commands between steps, to send only the commands that changed
+    state_path = args.dispatch_state
+    if state_path is None and args.checkpoint:
+        state_path = os.path.join(args.checkpoint, DISPATCH_STATE)
+    state = AppliedState(state_path)
+
+    if args.fleet:
+        reports = FleetDispatcher(FixtureRegistry.from_file(args.fleet), state=state).dispatch(population, args.full_dispatch)
+        for report in reports:
+            logging.info(f"Entity: {report['entity_id']} | Status: {report['status']} | Attempts: {report['attempts']}")
+        failed = any(report["status"] != "ok" for report in reports)
+    else:
+        with OrionDispatcher(args.orion_url, state=state) as dispatcher:
+            reports = dispatcher.dispatch(population, args.full_dispatch)
+        failed = any(report["status_code"] >= 400 for report in reports)
+    return {"status": "failed" if failed else "ok", "reports": reports}
+
+
+def dispatch_checkpointed(args, population, checkpoint):
+    """Dispatch a population, keeping the dispatch status of the checkpoint up to date."""
+    if checkpoint is None:
+        return dispatch_population(args, population)
+    checkpoint.set_dispatch({"status": "pending"})
+    try:
+        dispatch = dispatch_population(args, population)
+    except requests.RequestException as e:
+        checkpoint.set_dispatch({"status": "failed", "error": str(e)})
+        raise
+    checkpoint.set_dispatch(dispatch)
+    return dispatch
+
+
+def step(args):
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    state = checkpoint.load() if checkpoint is not None and checkpoint.exists() else None
+
+    # The population waiting in the checkpoint is the one measured in the tower
+    if args.population:
+        population = json.loads(args.population)
+    elif state is not None and state["next_population"] is not None:
+        population = state["next_population"]
+    else:
+        raise ValueError("--population is required without a checkpoint")
+    fitness_values = json.loads(args.fitness)
+    if len(population) != len(fitness_values):
+        raise ValueError("The population and the fitness values must have the same size")
+
+    streams = None
+    if state is not None:
+        streams = state["streams"]
+    elif checkpoint is not None or args.seed is not None:
+        streams = RandomStreams(args.seed)
+
+    if args.surrogate:
+        # Train on every recipe measured so far, including the current population
+        recipes, surrogate_fitness = load_training_data(args.surrogate_data + ([args.cache] if args.cache else []))
+        surrogate = SurrogateScreen(
+            args.surrogate_candidates, args.surrogate_alpha, args.surrogate_exploration, recipes, surrogate_fitness
+        )
+        if state is not None:
+            for record in checkpoint.read_history():
+                surrogate.update(record["population"], record["fitness"])
+        surrogate.update(population, fitness_values)
+        new_population = surrogate.next_population(population, fitness_values, args.mutation_rate, streams)
+    elif args.engine == "vectorized":
+        new_population = vectorized.generate_new_population(
+            population, fitness_values, args.candidates_size, args.mutation_rate, streams=streams
+        ).tolist()
+    else:
+        new_population = operators.generate_new_population(
+            population, fitness_values, args.candidates_size, args.mutation_rate, streams
+        )
+
+    # Record the measured fitness and show the recipes that were already evaluated
+    if args.cache:
+        cache = FitnessCache(args.cache, args.cache_tolerance, args.cache_memory_size)
+        cache.set_many(population, fitness_values)
+        cache.set(population, fitness_values, POPULATION)
+        for index, individual in enumerate(new_population):
+            fitness = cache.get(individual)
+            if fitness is not None:
+                logging.info(f"Individual {index} {individual} was already evaluated | Fitness: {fitness}")
+        cache.close()
+
+    if checkpoint is not None:
+        best_index = fitness_values.index(max(fitness_values))
+        best_individual, best_fitness = population[best_index], fitness_values[best_index]
+        if state is not None and state["best_fitness"] >= best_fitness:
+            best_individual, best_fitness = state["best_individual"], state["best_fitness"]
+        if state is None:
+            checkpoint.save_parameters({key: value for key, value in vars(args).items() if key not in ("population", "fitness")})
+        generation = state["generation"] + 1 if state is not None else 0
+        checkpoint.save(generation, population, fitness_values, streams, best_individual, best_fitness, new_population)
+        logging.info(f"Checkpoint | Generation: {generation} | Best: {best_individual} | Fitness: {best_fitness}")
+
+    print(json.dumps(new_population))
+
+    if args.dispatch:
+        dispatch_checkpointed(args, new_population, checkpoint)
+
+
+def simulate(args, resume=False):
+    checkpoint = None
+    if args.checkpoint:
+        checkpoint = Checkpoint(args.checkpoint)
+        if not resume:
+            if checkpoint.exists():
+                raise ValueError(f"{args.checkpoint} already has a checkpoint, use 'python -m ga resume {args.checkpoint}'")
+            checkpoint.save_parameters(vars(args))
+
+    if args.model:
+        fitness_function = ModelFitness.from_file(args.model)
+    else:
+        fitness_function = load_fitness_function(args.fitness_function)
+
+    evaluator = None
+    if args.workers is not None:
+        evaluator = PoolEvaluator(fitness_function, args.workers or None, args.chunk_size, args.timeout)
+
+    evaluate = evaluator
+    cache = None
+    if args.cache:
+        cache = FitnessCache(args.cache, args.cache_tolerance, args.cache_memory_size)
+        if evaluate is None:
+            def evaluate(population):
+                return evaluate_population(fitness_function, population)
+        evaluate = CachedEvaluator(cache, evaluate)
+
+    try:
+        result = run_simulation(
+            fitness_function,
+            args.generations,
+            population_size=args.population_size,
+            chromosome_size=args.chromosome_size,
+            candidates_size=args.candidates_size,
+            mutation_rate=args.mutation_rate,
+            engine=args.engine,
+            seed=args.seed,
+            evaluate=evaluate,
+            run_log=args.run_log,
+            surrogate=SurrogateScreen(args.surrogate_candidates, args.surrogate_alpha, args.surrogate_exploration) if args.surrogate else None,
+            checkpoint=checkpoint,
+            checkpoint_interval=args.checkpoint_interval,
+            resume=resume,
+        )
+    finally:
+        if evaluator is not None:
+            evaluator.close()
+        if cache is not None:
+            logging.info(f"Fitness cache | Hits: {cache.hits} | Misses: {cache.misses}")
+            cache.close()
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file)
+    print(json.dumps({"seed": result["seed"], "best_individual": result["best_individual"], "best_fitness": result["overall_best_fitness"]}))
+
+
+def resume(args):
+    checkpoint = Checkpoint(args.checkpoint)
+    if not checkpoint.exists():
+        raise ValueError(f"{args.checkpoint} has no checkpoint")
+    run_args = argparse.Namespace(**checkpoint.load_parameters())
+
+    # A simulation continues where it stopped, with the same random streams
+    if run_args.command == "simulate":
+        if args.generations is not None:
+            run_args.generations = args.generations
+        if args.workers is not None:
+            run_args.workers = args.workers
+        simulate(run_args, resume=True)
+        return
+
+    # An experiment with the tower shows the population waiting to be measured
+    state = checkpoint.load()
+    dispatch = state["dispatch"] or {"status": "not sent"}
+    logging.info(f"Generation: {state['generation']} | Best: {state['best_individual']} | Fitness: {state['best_fitness']}")
+    logging.info(f"Population waiting to be measured: {state['next_population']} | Dispatch: {dispatch['status']}")
+    print(json.dumps(state["next_population"]))
+    if args.dispatch and dispatch["status"] != "ok":
+        dispatch_checkpointed(run_args, state["next_population"], checkpoint)
+
+
+def islands(args):
+    result = run_islands(
+        load_fitness_function(args.fitness_function),
+        args.generations,
+        islands=args.islands,
+        migration_interval=args.migration_interval,
+        topology=args.topology,
+        population_size=args.population_size,
+        chromosome_size=args.chromosome_size,
+        candidates_size=args.candidates_size,
+        mutation_rate=args.mutation_rate,
+        engine=args.engine,
+        seed=args.seed,
+        workers=args.workers,
+    )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file)
+    print(json.dumps({"seed": result["seed"], "best_individual": result["best_individual"], "best_fitness": result["best_fitness"]}))
+
+
+def migrate_towers(args):
+    populations, fitness_values = migrate(json.loads(args.populations), json.loads(args.fitness), args.topology)
+    print(json.dumps({"populations": populations, "fitness": fitness_values}))
+
+
+def replay(args):
+    result = replay_run(args.run_log)
+    print(json.dumps(result))
+    return 0 if result["matches"] else 1
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # --- Define the logger ---
+    log_level = logging.DEBUG if args.debug else logging.INFO
+    logging.basicConfig(level=log_level, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    try:
+        if args.command == "step":
+            step(args)
+        elif args.command == "simulate":
+            simulate(args)
+        elif args.command == "islands":
+            islands(args)
+        elif args.command == "migrate":
+            migrate_towers(args)
+        elif args.command == "resume":
+            resume(args)
+        elif args.command == "replay":
+            return replay(args)
+    except (ValueError, OSError, requests.RequestException) as e:
+        logging.error(e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Author: Rafael Gomes Alves
+Description: Persistent fitness cache keyed by light recipe.
+The GA often produces recipes that were already evaluated (the best individual is kept
+by elitism and the candidates are crossovered with it), and each evaluation costs a real
+growth cycle or an expensive simulation. The cache stores the fitness of each recipe in
+a SQLite database with the following schema:
+    - kind: text, 'chromosome' for a single (R, G, B) recipe or 'population' for the
+      assignment of recipes to all fixtures of the tower
+    - recipe: text, the genes separated by commas. Ex. '211,169,243'
+    - first_gene: integer, used to speed up the near-match lookup
+    - fitness: text, the fitness as JSON (a list of values for a population)
+    - timestamp: datetime, default current_timestamp
+The most recently used recipes are also kept in memory, and a recipe can optionally be
+matched to a cached recipe whose genes are all within a tolerance.
+"""
+
+import json
+import logging
+import math
+import sqlite3
+import threading
+from collections import OrderedDict
+
+CHROMOSOME = "chromosome"
+POPULATION = "population"
+
+
+def recipe_key(individual):
+    """
+    Convert an individual, or a population for the 'population' kind, to a tuple of genes.
+
+    args:
+        individual (list): The recipe. Ex. [211, 169, 243] or [[211, 169, 243], [10, 20, 30]]
+
+    Returns:
+        tuple: The genes. Ex. (211, 169, 243)
+    """
+    genes = []
+    for gene in individual:
+        if isinstance(gene, (list, tuple)) or getattr(gene, "ndim", 0) > 0:
+            genes.extend(int(value) for value in gene)
+        else:
+            genes.append(int(gene))
+    return tuple(genes)
+
+
+class FitnessCache:
+    """
+    Fitness cache backed by SQLite with an in-memory LRU tier.
+
+    args:
+        path (str): Path to the SQLite database. Default keeps the cache only in memory.
+        tolerance (int): Maximum difference of each gene for a near-match. Default value is 0 (exact match).
+        memory_size (int): Maximum number of recipes kept in memory. Default value is 1024.
+    """
+
+    def __init__(self, path=":memory:", tolerance=0, memory_size=1024):
+        self.tolerance = tolerance
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS fitness (
+                kind TEXT,
+                recipe TEXT,
+                first_gene INTEGER,
+                fitness TEXT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (kind, recipe)
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS fitness_first_gene ON fitness (kind, first_gene)")
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM fitness").fetchone()[0]
+
+    # --- In-memory tier ---
+    def _remember(self, kind, key, fitness):
+        self.memory[(kind, key)] = fitness
+        self.memory.move_to_end((kind, key))
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    # --- Main cache methods ---
+    def get(self, individual, kind=CHROMOSOME):
+        """
+        Get the fitness of a recipe.
+
+        args:
+            individual (list): The recipe, or the population for the 'population' kind.
+            kind (str): 'chromosome' or 'population'. Default is 'chromosome'.
+
+        Returns:
+            The cached fitness, or None if the recipe was never evaluated.
+        """
+        key = recipe_key(individual)
+        with self.lock:
+            fitness = self.memory.get((kind, key))
+            if fitness is None:
+                fitness = self._lookup(kind, key)
+            if fitness is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(kind, key, fitness)
+            return fitness
+
+    def _lookup(self, kind, key):
+        row = self.conn.execute(
+            "SELECT fitness FROM fitness WHERE kind = ? AND recipe = ?",
+            (kind, ",".join(map(str, key))),
+        ).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+        if not self.tolerance:
+            return None
+
+        # Near-match: every gene within the tolerance, choosing the closest recipe
+        rows = self.conn.execute(
+            "SELECT recipe, fitness FROM fitness WHERE kind = ? AND first_gene BETWEEN ? AND ?",
+            (kind, key[0] - self.tolerance, key[0] + self.tolerance),
+        )
+        best = None
+        for recipe, fitness in rows:
+            genes = tuple(int(gene) for gene in recipe.split(","))
+            if len(genes) != len(key) or any(abs(a - b) > self.tolerance for a, b in zip(genes, key)):
+                continue
+            distance = sum((a - b) ** 2 for a, b in zip(genes, key))
+            if best is None or distance < best[0]:
+                best = (distance, fitness)
+        if best is None:
+            return None
+        logging.debug(f"Near-match for {key} with distance {best[0] ** 0.5:.1f}")
+        return json.loads(best[1])
+
+    def set(self, individual, fitness, kind=CHROMOSOME):
+        """
+        Store the fitness of a recipe.
+
+        args:
+            individual (list): The recipe, or the population for the 'population' kind.
+            fitness: The fitness of the recipe, or the list of fitness values of the population.
+            kind (str): 'chromosome' or 'population'. Default is 'chromosome'.
+        """
+        self.set_many([individual], [fitness], kind)
+
+    def set_many(self, individuals, fitness_values, kind=CHROMOSOME):
+        """
+        Store the fitness of many recipes in a single transaction.
+
+        args:
+            individuals (list): The recipes. Ex. [[211, 169, 243], [10, 20, 30]]
+            fitness_values (list): The fitness of each recipe. Ex. [100.0, 20.0]
+            kind (str): 'chromosome' or 'population'. Default is 'chromosome'.
+        """
+        rows = []
+        with self.lock:
+            for individual, fitness in zip(individuals, fitness_values):
+                key = recipe_key(individual)
+                self._remember(kind, key, fitness)
+                rows.append((kind, ",".join(map(str, key)), key[0], json.dumps(fitness)))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO fitness (kind, recipe, first_gene, fitness) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class CachedEvaluator:
+    """
+    Evaluate a population reusing the cached fitness of repeated recipes.
+    Only the recipes missing from the cache are sent, in a single batch, to the evaluation
+    function, and their fitness is stored in the cache.
+
+    args:
+        cache (FitnessCache): The fitness cache.
+        evaluate (callable): Function receiving a population and returning the fitness of each
+            individual, Ex. a ga.evaluation.PoolEvaluator.
+    """
+
+    def __init__(self, cache, evaluate):
+        self.cache = cache
+        self.evaluate = evaluate
+
+    def __call__(self, population):
+        fitness_values = [self.cache.get(individual) for individual in population]
+        missing = [index for index, fitness in enumerate(fitness_values) if fitness is None]
+
+        # Recipes repeated inside the same population are evaluated only once
+        unique = list(OrderedDict((recipe_key(population[index]), index) for index in missing).values())
+        if unique:
+            evaluated = self.evaluate([population[index] for index in unique])
+
+            # Evaluations that timed out or failed are not cached
+            stored = [(population[index], fitness) for index, fitness in zip(unique, evaluated) if math.isfinite(fitness)]
+            if stored:
+                self.cache.set_many(*zip(*stored))
+            results = dict(zip((recipe_key(population[index]) for index in unique), evaluated))
+            for index in missing:
+                fitness_values[index] = results[recipe_key(population[index])]
+
+        return fitness_values
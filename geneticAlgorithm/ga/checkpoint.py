@@ -0,0 +1,180 @@
+"""
+Author: Rafael Gomes Alves
+Description: Crash-safe checkpoints of a Genetic Algorithm experiment.
+A checkpoint is a folder with three files:
+- latest.npz: the state after the last checkpointed generation (population, fitness values, best
+  individual, random streams, population waiting to be evaluated and dispatch status). It is written
+  to a temporary file and renamed over the previous one, so it is always complete, and it is the only
+  file read to resume, whatever the number of generations.
+- history.jsonl: one line appended per generation with its population, fitness values and
+  dispatch status, never rewritten.
+- parameters.json: the parameters of the experiment, written when it starts.
+An experiment with the growth tower can be stopped at any point, Ex. a kernel restart, and
+continued with `python -m ga resume <folder>`.
+"""
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from ga.rng import RandomStreams
+
+LATEST = "latest.npz"
+HISTORY = "history.jsonl"
+PARAMETERS = "parameters.json"
+
+
+class Checkpoint:
+    """
+    Save and load the checkpoints of an experiment.
+
+    args:
+        directory (str): Folder of the checkpoint, created if it does not exist.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.latest = os.path.join(directory, LATEST)
+        self.history = os.path.join(directory, HISTORY)
+        self.parameters = os.path.join(directory, PARAMETERS)
+        os.makedirs(directory, exist_ok=True)
+
+    def exists(self):
+        return os.path.exists(self.latest)
+
+    def _write_atomic(self, path, mode, write):
+        # Write to a temporary file in the same folder and rename it over the previous file
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, mode) as file:
+                write(file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    def save_parameters(self, parameters):
+        """Save the parameters needed to resume the experiment. Ex. {'command': 'simulate', 'generations': 1000}"""
+        self._write_atomic(self.parameters, "w", lambda file: json.dump(parameters, file))
+
+    def load_parameters(self):
+        with open(self.parameters) as file:
+            return json.load(file)
+
+    def save(
+        self,
+        generation,
+        population,
+        fitness_values,
+        streams,
+        best_individual,
+        best_fitness,
+        next_population=None,
+        dispatch=None,
+    ):
+        """
+        Save the state of the experiment after a generation was evaluated.
+
+        args:
+            generation (int): The index of the evaluated generation. Ex. 0
+            population (list): The evaluated population. Ex. [[211, 169, 243], ...]
+            fitness_values (list): The fitness of each individual. Ex. [100.0, ...]
+            streams (ga.rng.RandomStreams): The random streams, before generating the next population.
+            best_individual (list): The best individual found so far, None if every individual failed (fitness -inf).
+            best_fitness (float): The fitness of the best individual found so far.
+            next_population (list): The population generated but not evaluated yet, Ex. sent to the fixtures. Default is None.
+            dispatch (dict): The status of the dispatch of next_population. Default is None.
+        """
+        population = np.asarray(population, dtype=np.uint8)
+        if next_population is None:
+            next_population = np.empty((0, population.shape[1]), dtype=np.uint8)
+
+        def write(file):
+            np.savez_compressed(
+                file,
+                generation=generation,
+                population=population,
+                fitness=np.asarray(fitness_values, dtype=float),
+                best_individual=np.asarray(best_individual if best_individual is not None else [], dtype=np.uint8),
+                has_best=best_individual is not None,
+                best_fitness=best_fitness,
+                next_population=np.asarray(next_population, dtype=np.uint8),
+                streams=json.dumps(streams.get_state()),
+                dispatch=json.dumps(dispatch),
+            )
+
+        self._write_atomic(self.latest, "wb", write)
+        self.append_history(generation, population, fitness_values, next_population, dispatch)
+
+    def append_history(self, generation, population, fitness_values, next_population=None, dispatch=None):
+        """Append a generation to the history, Ex. a generation evaluated between two checkpoints."""
+        if next_population is None:
+            next_population = []
+        with open(self.history, "a") as file:
+            file.write(
+                json.dumps(
+                    {
+                        "generation": int(generation),
+                        "population": np.asarray(population).tolist(),
+                        "fitness": [float(fitness) for fitness in fitness_values],
+                        "next_population": np.asarray(next_population).tolist(),
+                        "dispatch": dispatch,
+                    }
+                )
+                + "\n"
+            )
+
+    def set_dispatch(self, dispatch):
+        """Update the dispatch status of the last checkpoint, Ex. once the fixtures answered."""
+        with np.load(self.latest) as data:
+            arrays = dict(data)
+        arrays["dispatch"] = json.dumps(dispatch)
+        self._write_atomic(self.latest, "wb", lambda file: np.savez_compressed(file, **arrays))
+
+    def load(self):
+        """
+        Load the last checkpoint.
+
+        Returns:
+            dict: The generation, population, fitness values, best individual and fitness, random
+            streams (ga.rng.RandomStreams), next population (None if empty) and dispatch status.
+        """
+        with np.load(self.latest) as data:
+            next_population = data["next_population"].tolist()
+            return {
+                "generation": int(data["generation"]),
+                "population": data["population"].tolist(),
+                "fitness": data["fitness"].tolist(),
+                # Older checkpoints have no has_best flag, their best individual is always set
+                "best_individual": data["best_individual"].tolist() if data.get("has_best", True) else None,
+                "best_fitness": float(data["best_fitness"]),
+                "streams": RandomStreams.from_state(json.loads(str(data["streams"]))),
+                "next_population": next_population or None,
+                "dispatch": json.loads(str(data["dispatch"])),
+            }
+
+    def truncate_history(self, generation):
+        """
+        Remove the generations recorded after a given generation, Ex. the generations recorded after
+        the last checkpoint of a run that stopped, so the resumed run does not record them twice.
+        """
+        if not os.path.exists(self.history):
+            return
+        kept = [record for record in self.read_history() if record["generation"] <= generation]
+        self._write_atomic(self.history, "w", lambda file: file.writelines(json.dumps(record) + "\n" for record in kept))
+
+    def read_history(self):
+        """Read every generation recorded in the history, ignoring a line truncated by a crash."""
+        generations = []
+        with open(self.history) as file:
+            for line in file:
+                try:
+                    generations.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return generations
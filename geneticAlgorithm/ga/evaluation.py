@@ -0,0 +1,131 @@
+"""
+Author: Rafael Gomes Alves
+Description: Parallel evaluation of a population in simulation mode.
+When the fitness comes from a simulated or model based function, the individuals of a
+population are independent from each other, so they are sent in chunks to a pool of
+processes. The pool is created once and reused for every generation, the results are
+returned in the same order as the population, and each individual can have a timeout.
+The fitness function must be picklable (Ex. a function defined at module level).
+"""
+
+import logging
+import math
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+# --- Worker state, set once per process by the pool initializer ---
+_fitness_function = None
+_timeout = None
+
+
+class IndividualTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise IndividualTimeout()
+
+
+def _init_worker(fitness_function, timeout):
+    global _fitness_function, _timeout
+    _fitness_function = fitness_function
+    _timeout = timeout
+    if _timeout and hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, _raise_timeout)
+
+
+def _evaluate_chunk(chunk):
+    """
+    Evaluate a chunk of individuals in a worker process.
+
+    args:
+        chunk (list): The individuals to evaluate. Ex. [[10, 20, 30], [40, 50, 60]]
+
+    Returns:
+        list: The fitness of each individual, or None when the evaluation timed out.
+    """
+    use_timer = bool(_timeout) and hasattr(signal, "setitimer")
+    results = []
+    for individual in chunk:
+        try:
+            if use_timer:
+                signal.setitimer(signal.ITIMER_REAL, _timeout)
+            results.append(float(_fitness_function(individual)))
+        except IndividualTimeout:
+            results.append(None)
+        finally:
+            if use_timer:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    return results
+
+
+class PoolEvaluator:
+    """
+    Evaluate populations with a fitness function in a pool of processes.
+
+    args:
+        fitness_function (callable): Function receiving an individual and returning its fitness.
+        workers (int): Number of processes. Default is the number of CPU cores.
+        chunk_size (int): Number of individuals sent to a process at once. Default splits the
+            population in 4 chunks per process.
+        timeout (float): Maximum time in seconds to evaluate an individual. Default is no timeout.
+        timeout_fitness (float): Fitness given to an individual that timed out. Default is -inf,
+            so it is never selected as the best individual.
+    """
+
+    def __init__(self, fitness_function, workers=None, chunk_size=None, timeout=None, timeout_fitness=float("-inf")):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.timeout_fitness = timeout_fitness
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(fitness_function, timeout),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __call__(self, population):
+        return self.evaluate(population)
+
+    def evaluate(self, population):
+        """
+        Evaluate each individual of a population.
+
+        args:
+            population (list): The population. Ex. [[10, 20, 30], [40, 50, 60]]
+
+        Returns:
+            list: The fitness of each individual, in the same order as the population.
+        """
+        population = [list(individual) for individual in population]
+        chunk_size = self.chunk_size or max(1, math.ceil(len(population) / (self.workers * 4)))
+        chunks = [population[i : i + chunk_size] for i in range(0, len(population), chunk_size)]
+        futures = [self.executor.submit(_evaluate_chunk, chunk) for chunk in chunks]
+
+        # Without SIGALRM (Ex. Windows) the timeout can only be enforced per chunk
+        chunk_timeout = None
+        if self.timeout and not hasattr(signal, "setitimer"):
+            chunk_timeout = self.timeout * chunk_size
+
+        fitness_values = []
+        for chunk, future in zip(chunks, futures):
+            try:
+                results = future.result(timeout=chunk_timeout)
+            except TimeoutError:
+                results = [None] * len(chunk)
+            for individual, fitness in zip(chunk, results):
+                if fitness is None:
+                    logging.warning(f"Evaluation of {individual} timed out after {self.timeout} seconds")
+                    fitness = self.timeout_fitness
+                fitness_values.append(fitness)
+        return fitness_values
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
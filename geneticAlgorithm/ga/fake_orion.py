@@ -0,0 +1,160 @@
+"""
+Author: Rafael Gomes Alves
+Description: Local HTTP stand-in for the Orion Context Broker, used to test the dispatch of
+populations without the IoT platform.
+The server accepts the NGSI v2 requests used to send commands to the light fixtures and
+keeps every request received, with the maximum number of requests handled at the same time:
+- POST /v2/op/update: batch update (can be disabled to test the fallback)
+- PATCH /v2/entities/<entity_id>/attrs: update of the attributes of one entity
+Usage: python -m ga.fake_orion --port 1026
+"""
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOrionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive connections, as Orion
+
+    def log_message(self, format, *args):
+        logging.debug(f"Fake Orion | {format % args}")
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else None
+
+    def _reply(self, status, body=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if payload:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method):
+        server = self.server
+        body = self._read_body()
+        path = self.path.split("?")[0]
+        server.record(method, self.path, dict(self.headers), body)
+
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            self._respond(server, method, path)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _respond(self, server, method, path):
+        if server.latency:
+            time.sleep(server.latency)
+
+        # Respond with a forced status, Ex. to test retries
+        status = server.next_status()
+        if status is not None:
+            self._reply(status, {"error": "FakeError", "description": f"Forced status {status}"})
+        elif method == "POST" and path == "/v2/op/update":
+            if server.batch:
+                self._reply(204)
+            else:
+                self._reply(404, {"error": "NotFound", "description": "Batch update not available"})
+        elif method == "PATCH" and path.startswith("/v2/entities/") and path.endswith("/attrs"):
+            self._reply(204)
+        else:
+            self._reply(404, {"error": "NotFound", "description": "Unknown request"})
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+
+class FakeOrion(ThreadingHTTPServer):
+    """
+    Fake Orion Context Broker running in a background thread.
+
+    args:
+        host (str): The host to listen on. Default is '127.0.0.1'.
+        port (int): The port to listen on. Default value is 0 (any free port).
+        batch (bool): Accept the batch update. Default is True.
+        latency (float): Delay in seconds added to each response. Default value is 0.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, batch=True, latency=0):
+        super().__init__((host, port), FakeOrionHandler)
+        self.batch = batch
+        self.latency = latency
+        self.requests = []
+        self.statuses = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, method, path, headers, body):
+        with self.lock:
+            self.requests.append({"method": method, "path": path, "headers": headers, "body": body})
+
+    def fail_next(self, *statuses):
+        """Respond to the next requests with the given status codes. Ex. fail_next(503, 503)"""
+        with self.lock:
+            self.statuses.extend(statuses)
+
+    def next_status(self):
+        with self.lock:
+            return self.statuses.pop(0) if self.statuses else None
+
+    def handle_error(self, request, client_address):
+        # A client that gave up waiting, Ex. to test the timeouts, is not an error of the server
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            logging.debug(f"Fake Orion | Client {client_address} closed the connection")
+            return
+        super().handle_error(request, client_address)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Orion Context Broker")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on")
+    parser.add_argument("--port", type=int, default=1026, help="Port to listen on")
+    parser.add_argument("--no-batch", help="Reject batch updates", action="store_true")
+    parser.add_argument("--latency", type=float, default=0, help="Delay in seconds added to each response")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG, format="%(asctime)s [%(levelname)s] %(message)s")
+    server = FakeOrion(args.host, args.port, not args.no_batch, args.latency)
+    logging.info(f"Fake Orion listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Exiting...")
@@ -0,0 +1,89 @@
+"""
+Author: Rafael Gomes Alves
+Description: Fitness functions used to run the Genetic Algorithm in simulation mode.
+In the growth tower the fitness of each light recipe is measured by hand. In simulation
+mode the fitness comes from a Python function or from a fitted model instead, so the
+algorithm can be tuned without spending real growth cycles.
+A fitness function receives an individual (list of genes, Ex. [211, 169, 243]) and
+returns its fitness as a float, where higher is better.
+"""
+
+import importlib
+import importlib.util
+import math
+import os
+import pickle
+import sys
+
+# Best recipe measured in the growth tower (fitness 100 on day 34, see collectedData)
+TARGET_RECIPE = (211, 169, 243)
+
+
+def distance_to_target(individual, target=TARGET_RECIPE):
+    """
+    Surrogate fitness based on the euclidean distance between a recipe and a target recipe.
+
+    args:
+        individual (list): The light recipe. Ex. [211, 169, 243]
+        target (tuple): The target recipe. Default is the best recipe measured in the tower.
+
+    Returns:
+        float: 100 for the target recipe, decreasing linearly to 0 at the maximum distance.
+    """
+    max_distance = math.sqrt(len(target) * 255**2)
+    distance = math.sqrt(sum((int(gene) - t) ** 2 for gene, t in zip(individual, target)))
+    return 100 * (1 - distance / max_distance)
+
+
+class ModelFitness:
+    """
+    Fitness function backed by a fitted regression model.
+    The model must have a `predict` method receiving a list of individuals, as the
+    scikit-learn regressors do.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, individual):
+        return float(self.model.predict([list(individual)])[0])
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Load a pickled model from a file.
+
+        args:
+            path (str): Path to the pickle file. Ex. 'model.pkl'
+
+        Returns:
+            ModelFitness: The fitness function using the loaded model.
+        """
+        with open(path, "rb") as file:
+            return cls(pickle.load(file))
+
+
+def load_fitness_function(spec):
+    """
+    Load a fitness function from a specification in the format `<module or file>:<function>`.
+
+    args:
+        spec (str): The function to load. Ex. 'ga.fitness:distance_to_target' or 'my_fitness.py:fitness'
+
+    Returns:
+        callable: The fitness function.
+    """
+    module_name, _, function_name = spec.rpartition(":")
+    if not module_name or not function_name:
+        raise ValueError(f"Invalid fitness function '{spec}', expected '<module>:<function>'")
+
+    if module_name.endswith(".py"):
+        name = os.path.splitext(os.path.basename(module_name))[0]
+        module_spec = importlib.util.spec_from_file_location(name, module_name)
+        module = importlib.util.module_from_spec(module_spec)
+        sys.modules[name] = module  # Allow the function to be pickled by reference
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+
+    return getattr(module, function_name)
@@ -0,0 +1,237 @@
+"""
+Author: Rafael Gomes Alves
+Description: Asynchronous dispatch of a population to a fleet of light fixtures.
+The fixtures are defined in a registry, so a single GA can drive many towers, each one
+with its own Orion Context Broker and FIWARE service. The registry is a JSON file with
+the following format:
+    {
+        "orion_url": "http://10.24.1.10:1026",
+        "service": "vfarm",
+        "servicepath": "/vfarm",
+        "fixtures": [
+            {"entity_id": "urn:ngsi-ld:light_fixture:001", "commands": ["setLeftColor", "setRightColor"]},
+            {"entity_id": "urn:ngsi-ld:light_fixture:101", "orion_url": "http://10.24.1.11:1026", "servicepath": "/tower2"}
+        ]
+    }
+The "type", "orion_url", "service", "servicepath" and "commands" of each fixture are optional
+and default to the values at the top of the file. The individuals of the population are
+assigned to the commands of the fixtures in the order of the registry. The commands of each
+fixture are sent concurrently, with a bounded number of requests in flight, a timeout per
+request and retries with exponential backoff. As with ga.orion.OrionDispatcher, only the
+commands that changed since the last dispatch are sent, in one request per fixture.
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+import aiohttp
+
+from ga.orion import ENTITY_TYPE, HEADERS, ORION_URL, SLOTS, AppliedState, count_commands
+
+COMMANDS = ["setLeftColor", "setRightColor"]
+
+# Status codes worth retrying, the remaining errors are reported at once
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class FixtureRegistry:
+    """
+    Registry of the light fixtures driven by the GA.
+
+    args:
+        fixtures (list): The fixtures as dictionaries with at least an 'entity_id'.
+        orion_url (str): Default Orion Context Broker URL. Default is ORION_URL.
+        service (str): Default FIWARE service. Default is 'vfarm'.
+        servicepath (str): Default FIWARE service path. Default is '/vfarm'.
+    """
+
+    def __init__(self, fixtures, orion_url=ORION_URL, service=HEADERS["fiware-service"], servicepath=HEADERS["fiware-servicepath"]):
+        self.fixtures = []
+        for fixture in fixtures:
+            self.fixtures.append(
+                {
+                    "entity_id": fixture["entity_id"],
+                    "type": fixture.get("type", ENTITY_TYPE),
+                    "orion_url": fixture.get("orion_url", orion_url).rstrip("/"),
+                    "service": fixture.get("service", service),
+                    "servicepath": fixture.get("servicepath", servicepath),
+                    "commands": list(fixture.get("commands", COMMANDS)),
+                }
+            )
+
+    def __len__(self):
+        return len(self.fixtures)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as file:
+            config = json.load(file)
+        return cls(
+            config["fixtures"],
+            config.get("orion_url", ORION_URL),
+            config.get("service", HEADERS["fiware-service"]),
+            config.get("servicepath", HEADERS["fiware-servicepath"]),
+        )
+
+    @classmethod
+    def default(cls, orion_url=ORION_URL):
+        """Registry with the three light fixtures of the growth tower."""
+        entity_ids = list(dict.fromkeys(entity_id for entity_id, _ in SLOTS))
+        return cls([{"entity_id": entity_id} for entity_id in entity_ids], orion_url)
+
+    @property
+    def slots(self):
+        """The (fixture, command) receiving each individual of the population."""
+        return [(fixture, command) for fixture in self.fixtures for command in fixture["commands"]]
+
+    @staticmethod
+    def key(fixture):
+        """Identify a fixture in the applied state, with the same key as ga.orion.OrionDispatcher."""
+        return AppliedState.key(fixture["orion_url"], fixture["service"], fixture["servicepath"], fixture["entity_id"])
+
+    def assign(self, population):
+        """
+        Assign the individuals of the population to the commands of the fixtures.
+
+        args:
+            population (list): The population. Ex. [[211, 169, 243], ...]
+
+        Returns:
+            list: The (fixture, commands) to send. Ex. [(fixture, {'setLeftColor': [211, 169, 243]})]
+        """
+        slots = self.slots
+        if len(population) > len(slots):
+            raise ValueError(f"The population has {len(population)} individuals but the registry has only {len(slots)} commands")
+
+        assignments = {}
+        for (fixture, command), individual in zip(slots, population):
+            assignments.setdefault(self.key(fixture), (fixture, {}))[1][command] = [int(gene) for gene in individual]
+        return list(assignments.values())
+
+
+class FleetDispatcher:
+    """
+    Send populations to a fleet of light fixtures with asyncio.
+
+    args:
+        registry (FixtureRegistry): The fixtures driven by the GA.
+        concurrency (int): Maximum number of requests in flight. Default value is 32.
+        timeout (float): Timeout of each request in seconds. Default value is 10.
+        retries (int): Number of retries after a failed request. Default value is 3.
+        backoff (float): Delay before the first retry in seconds, doubled at each retry. Default value is 0.5.
+        state (ga.orion.AppliedState): The commands already applied. Default is a new state in memory.
+        delta (bool): Send only the commands that changed since the last dispatch. Default is True.
+    """
+
+    def __init__(self, registry, concurrency=32, timeout=10, retries=3, backoff=0.5, state=None, delta=True):
+        self.registry = registry
+        self.state = state if state is not None else AppliedState()
+        self.delta = delta
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    def dispatch(self, population, force=False):
+        """
+        Blocking version of dispatch_async, for the CLI and the scripts. A Jupyter notebook already
+        runs an event loop, so use `await dispatcher.dispatch_async(population)` in its cells instead.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.dispatch_async(population, force))
+        raise RuntimeError("dispatch() cannot run inside an event loop (Ex. a notebook), use `await dispatcher.dispatch_async(population)`")
+
+    async def dispatch_async(self, population, force=False):
+        """
+        Send each individual of the population as a command to its light fixture.
+
+        args:
+            population (list): The population. Ex. [[211, 169, 243], ...]
+            force (bool): Send every command, even if it is already applied. Default is False.
+
+        Returns:
+            list: One report per fixture with changes, in the order of the registry, with the
+            entity id, the commands, the status ('ok' or 'failed'), the status code, the number
+            of attempts, the elapsed time in seconds and the last error.
+        """
+        assignments = self.registry.assign(population)
+        if self.delta and not force:
+            changed = self.state.diff({self.registry.key(fixture): commands for fixture, commands in assignments})
+            logging.info(
+                f"Delta dispatch | Commands: {count_commands(changed)} | "
+                f"Unchanged: {sum(len(commands) for _, commands in assignments) - count_commands(changed)}"
+            )
+            assignments = [
+                (fixture, changed[self.registry.key(fixture)])
+                for fixture, _ in assignments
+                if self.registry.key(fixture) in changed
+            ]
+        if not assignments:
+            return []
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            reports = await asyncio.gather(
+                *(self.send(session, semaphore, fixture, commands) for fixture, commands in assignments)
+            )
+
+        for (fixture, commands), report in zip(assignments, reports):
+            if report["status"] == "ok":
+                self.state.update(self.registry.key(fixture), commands)
+        self.state.save()
+
+        failed = sum(report["status"] != "ok" for report in reports)
+        logging.info(f"Fleet dispatch | Fixtures: {len(reports)} | Failed: {failed}")
+        return reports
+
+    async def send(self, session, semaphore, fixture, commands):
+        url = f"{fixture['orion_url']}/v2/entities/{fixture['entity_id']}/attrs"
+        headers = {
+            "Content-Type": "application/json",
+            "fiware-service": fixture["service"],
+            "fiware-servicepath": fixture["servicepath"],
+        }
+        payload = json.dumps({command: {"type": "command", "value": value} for command, value in commands.items()})
+        report = {
+            "entity_id": fixture["entity_id"],
+            "commands": list(commands),
+            "status": "failed",
+            "status_code": None,
+            "attempts": 0,
+            "elapsed": 0.0,
+            "error": None,
+        }
+
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            report["attempts"] = attempt + 1
+            try:
+                async with semaphore:
+                    async with session.patch(url, params={"type": fixture["type"]}, headers=headers, data=payload) as response:
+                        report["status_code"] = response.status
+                        text = await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                report["error"] = repr(e)
+                logging.warning(f"Entity: {fixture['entity_id']} | Attempt: {attempt + 1} | Error: {report['error']}")
+                continue
+
+            if response.status < 300:
+                report["status"] = "ok"
+                report["error"] = None
+                break
+            report["error"] = text
+            logging.warning(f"Entity: {fixture['entity_id']} | Attempt: {attempt + 1} | Status: {response.status} | {text}")
+            if response.status not in RETRY_STATUS:
+                break
+
+        report["elapsed"] = time.perf_counter() - start
+        return report
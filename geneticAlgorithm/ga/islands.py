@@ -0,0 +1,194 @@
+"""
+Author: Rafael Gomes Alves
+Description: Island model for the Genetic Algorithm.
+Each island runs its own sub-population, as a growth tower or a simulation shard does, and
+the islands exchange their best recipes every few generations. In simulation mode every
+island runs in its own process, so many cores are used at once instead of a single serial
+loop. The best individual of each island migrates to the islands connected to it by the
+migration topology, replacing their worst individual when it is better.
+A topology is a function receiving the number of islands and returning, for each island,
+the list of islands receiving its best individual. The available topologies are:
+- ring: island i sends its best individual to island i + 1
+- fully_connected: every island sends its best individual to every other island
+- star: island 0 exchanges its best individual with every other island
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ga.rng import RandomStreams
+from ga.runner import ENGINES, evaluate_population, first_population, next_population
+
+
+# --- Migration topologies ---
+def ring(islands):
+    return {island: [(island + 1) % islands] for island in range(islands)} if islands > 1 else {0: []}
+
+
+def fully_connected(islands):
+    return {island: [target for target in range(islands) if target != island] for island in range(islands)}
+
+
+def star(islands):
+    topology = {island: [0] for island in range(1, islands)}
+    topology[0] = list(range(1, islands))
+    return topology
+
+
+TOPOLOGIES = {"ring": ring, "fully_connected": fully_connected, "star": star}
+
+
+def migrate(populations, fitness_values, topology="ring"):
+    """
+    Send the best individual of each island to the islands connected to it.
+    A migrant replaces the worst individual of the target island if it is better, and keeps
+    its fitness, so the target island does not need to evaluate it again.
+
+    args:
+        populations (list): The population of each island. Ex. [[[211, 169, 243], ...], ...]
+        fitness_values (list): The fitness values of each island. Ex. [[100.0, ...], ...]
+        topology (str or callable): The migration topology. Default is 'ring'.
+
+    Returns:
+        tuple: The populations and the fitness values of each island after the migration.
+    """
+    if isinstance(topology, str):
+        topology = TOPOLOGIES[topology]
+    connections = topology(len(populations))
+
+    populations = [[list(individual) for individual in population] for population in populations]
+    fitness_values = [list(fitness) for fitness in fitness_values]
+
+    # Select every migrant before replacing any individual
+    migrants = []
+    for source, fitness in enumerate(fitness_values):
+        best_index = fitness.index(max(fitness))
+        migrants.append((populations[source][best_index], fitness[best_index]))
+
+    for source, targets in connections.items():
+        migrant, migrant_fitness = migrants[source]
+        for target in targets:
+            worst_index = fitness_values[target].index(min(fitness_values[target]))
+            if migrant_fitness > fitness_values[target][worst_index] and migrant not in populations[target]:
+                populations[target][worst_index] = list(migrant)
+                fitness_values[target][worst_index] = migrant_fitness
+                logging.debug(f"Migration | Island {source} -> {target} | Individual: {migrant} | Fitness: {migrant_fitness}")
+
+    return populations, fitness_values
+
+
+def run_epoch(fitness_function, engine, population, fitness_values, generations, candidates_size, mutation_rate, streams):
+    """
+    Run an island for a number of generations. Executed in a worker process.
+
+    Returns:
+        tuple: The population, its fitness values, the random streams and the best fitness of each generation.
+    """
+    if fitness_values is None:
+        fitness_values = evaluate_population(fitness_function, population)
+
+    best_fitness = []
+    for _ in range(generations):
+        population = next_population(engine, population, fitness_values, candidates_size, mutation_rate, streams)
+        fitness_values = evaluate_population(fitness_function, population)
+        best_fitness.append(max(fitness_values))
+
+    return population, fitness_values, streams, best_fitness
+
+
+def run_islands(
+    fitness_function,
+    generations,
+    islands=4,
+    migration_interval=10,
+    topology="ring",
+    population_size=6,
+    chromosome_size=3,
+    candidates_size=30,
+    mutation_rate=0.05,
+    engine="vectorized",
+    seed=None,
+    workers=None,
+):
+    """
+    Run the Genetic Algorithm with the island model, one process per island.
+
+    args:
+        fitness_function (callable): Picklable function receiving an individual and returning its fitness.
+        generations (int): The number of generations of each island. Ex. 1000
+        islands (int): The number of islands. Default value is 4.
+        migration_interval (int): The number of generations between migrations. Default value is 10.
+        topology (str or callable): The migration topology. Default is 'ring'.
+        population_size (int): The number of individuals of each island. Default value is 6.
+        chromosome_size (int): The number of genes in each individual. Default value is 3.
+        candidates_size (int): The number of random candidates per generation. Default value is 30.
+        mutation_rate (float): The probability of flipping each bit. Default value is 0.05.
+        engine (str): The engine used for the operators, 'vectorized' or 'string'.
+        seed (int): Seed of the run, each island uses its own streams derived from it.
+        workers (int): Number of processes. Default is one per island, up to the number of CPU cores.
+
+    Returns:
+        dict: The result with the seed, the population and fitness values of each island, the
+        best individual found and the best fitness of each island at each generation.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+    if isinstance(topology, str) and topology not in TOPOLOGIES:
+        raise ValueError(f"Unknown topology '{topology}', expected one of {tuple(TOPOLOGIES)}")
+
+    seed_sequence = np.random.SeedSequence(seed)
+    streams = [RandomStreams(child) for child in seed_sequence.spawn(islands)]
+    populations = [first_population(engine, population_size, chromosome_size, island_streams) for island_streams in streams]
+    fitness_values = [None] * islands
+    history = [[] for _ in range(islands)]
+
+    start = time.perf_counter()
+    workers = workers or min(islands, os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        done = 0
+        while done < generations:
+            epoch = min(migration_interval, generations - done)
+            futures = [
+                executor.submit(
+                    run_epoch,
+                    fitness_function,
+                    engine,
+                    populations[island],
+                    fitness_values[island],
+                    epoch,
+                    candidates_size,
+                    mutation_rate,
+                    streams[island],
+                )
+                for island in range(islands)
+            ]
+            for island, future in enumerate(futures):
+                populations[island], fitness_values[island], streams[island], best_fitness = future.result()
+                history[island].extend(best_fitness)
+            done += epoch
+
+            if done < generations:
+                populations, fitness_values = migrate(populations, fitness_values, topology)
+
+    # Best individual across all islands
+    best_island = max(range(islands), key=lambda island: max(fitness_values[island]))
+    best_index = fitness_values[best_island].index(max(fitness_values[best_island]))
+    elapsed = time.perf_counter() - start
+    logging.info(
+        f"Simulated {generations} generations on {islands} islands in {elapsed:.2f} seconds | "
+        f"Best: {populations[best_island][best_index]} | Fitness: {fitness_values[best_island][best_index]}"
+    )
+
+    return {
+        "seed": seed_sequence.entropy,
+        "populations": populations,
+        "fitness": fitness_values,
+        "best_individual": populations[best_island][best_index],
+        "best_fitness": fitness_values[best_island][best_index],
+        "history": history,
+        "elapsed": elapsed,
+    }
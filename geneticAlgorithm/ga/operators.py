@@ -0,0 +1,195 @@
+"""
+Author: Rafael Gomes Alves
+Description: Genetic Algorithm operators used in GA.ipynb.
+Each individual is a light recipe with 3 genes (R, G, B) from 0 to 255, and the genes are
+converted to 8 bit strings to perform crossover and mutation.
+The functions use the global `random` module unless a random.Random is given, and
+generate_new_population accepts ga.rng.RandomStreams to use one stream per stage.
+"""
+
+import random
+import logging
+
+from ga.rng import STREAMS
+
+
+def decimal_to_binary(value, num_bits=8):
+    """
+    Convert a decimal integer value to its binary representation with a specified number of bits.
+
+    args:
+        value (int): The decimal value to be converted to binary. Ex. 10
+        num_bits (int): The number of bits in the resulting binary number. Default value is 8.
+
+    Returns:
+        str: The binary representation of the decimal value, padded with zeroes to the specified number of bits. Ex. '00001010'
+    """
+    # Convert the decimal value to binary and remove the '0b' prefix
+    binary_value = bin(value)[2:]
+
+    # Pad the binary value with zeroes to the specified number of bits
+    padded_binary_value = binary_value.zfill(num_bits)
+
+    return padded_binary_value
+
+
+def binary_to_decimal(value):
+    """
+    Convert a binary value to its decimal representation.
+
+    args:
+        value (str): The binary value to be converted to decimal. Ex. '00001010'
+
+    Returns:
+        int: The decimal representation of the binary value. Ex. 10
+    """
+    return int(value, 2)
+
+
+def generate_chromosome(chromosome_size, rng=None):
+    """
+    Generate a chromosome consisting of genes with random values from 0 to 255.
+
+    args:
+        chromosome_size (int): The number of genes in the chromosome. Ex. 3
+        rng (random.Random): Random generator to use. Default is the random module.
+
+    Returns:
+        list: A list of random integers from 0 to 255. Ex. [10, 20, 30]
+    """
+    rng = random if rng is None else rng
+    return [rng.randint(0, 255) for _ in range(chromosome_size)]
+
+
+def generate_population(population_size, chromosome_size, rng=None):
+    """
+    Generate a population of chromosomes of a given size.
+
+    args:
+        population_size (int): The number of inividuals in the population.
+        chromosome_size (int): The number of chromosomes in each individual.
+        rng (random.Random): Random generator to use. Default is the random module.
+
+    Returns:
+        list: A list of inividuals, each consisting of chromosomes with random values from 0 to 255.
+    """
+    return [generate_chromosome(chromosome_size, rng) for _ in range(population_size)]
+
+
+def crossover(best, population, rng=None):
+    """
+    Perform one-point crossover between the best indivual and a population of individuals.
+    To do this, the genes are converted to binary, and a random crossover point is selected.
+    """
+    rng = random if rng is None else rng
+
+    # Convert the genes to binary
+    best_binary = [decimal_to_binary(gene) for gene in best]
+    population_binary = [
+        [decimal_to_binary(gene) for gene in individual] for individual in population
+    ]
+
+    # Perform one-point crossover for each gene in the chromosome
+    crossover_population = []
+    for individual in population_binary:
+        crossover_individual = []
+        for best_gene, individual_gene in zip(best_binary, individual):
+            # Select a random crossover point
+            crossover_point = rng.randint(0, len(best_gene))
+            # Perform crossover
+            crossover_gene = (
+                best_gene[:crossover_point] + individual_gene[crossover_point:]
+            )
+            crossover_individual.append(crossover_gene)
+        crossover_population.append(crossover_individual)
+
+    # Convert the binary genes back to decimal
+    crossover_population = [
+        [binary_to_decimal(gene) for gene in individual]
+        for individual in crossover_population
+    ]
+
+    return crossover_population
+
+
+def mutation(population, mutation_rate=0.05, rng=None):
+    """
+    Perform mutation on a population of individuals.
+    To do this, the genes are converted to binary, each bit is flipped with a probability of mutation_rate, and the genes are converted back to decimal.
+    """
+    rng = random if rng is None else rng
+
+    # Convert the genes to binary
+    population_binary = [
+        [decimal_to_binary(gene) for gene in individual] for individual in population
+    ]
+
+    # Perform mutation for each gene in the chromosome, flipping each bit with a probability of mutation_rate
+    mutated_population = []
+    for individual in population_binary:
+        mutated_individual = []
+        for gene in individual:
+            mutated_gene = "".join(
+                [
+                    str(int(bit) ^ 1) if rng.random() < mutation_rate else bit
+                    for bit in gene
+                ]
+            )
+            mutated_individual.append(mutated_gene)
+        mutated_population.append(mutated_individual)
+
+    # Convert the binary genes back to decimal
+    mutated_population = [
+        [binary_to_decimal(gene) for gene in individual]
+        for individual in mutated_population
+    ]
+
+    return mutated_population
+
+
+def generate_new_population(population, fitness_values, candidates_size=30, mutation_rate=0.05, streams=None):
+    """
+    Generate a new population from the current population and its fitness values.
+    The best individual is crossovered with a random population, the result is mutated, and
+    a sample of the same size as the current population is selected. The best individual
+    is kept in the same position of the new population.
+
+    args:
+        population (list): The current population. Ex. [[10, 20, 30], [40, 50, 60]]
+        fitness_values (list): The fitness of each individual. Ex. [10.0, 20.0]
+        candidates_size (int): The number of random candidates. Default value is 30.
+        mutation_rate (float): The probability of flipping each bit. Default value is 0.05.
+        streams (ga.rng.RandomStreams): Random streams to use. Default is the random module.
+
+    Returns:
+        list: The new population.
+    """
+    streams = streams.python if streams is not None else dict.fromkeys(STREAMS, random)
+
+    # Select the best individual
+    best_index = fitness_values.index(max(fitness_values))
+    best_individual = population[best_index]
+    logging.debug(f"Population: {population}")
+    logging.debug(f"Fitness: {fitness_values}")
+    logging.debug(f"Best: {best_individual}")
+
+    # Generate a random population
+    candidates = generate_population(candidates_size, len(best_individual), streams["init"])
+    logging.debug(f"Int Population: {candidates}")
+
+    # Perform crossover between the best individual and each individual in the population
+    crossovered_population = crossover(best_individual, candidates, streams["crossover"])
+    logging.debug(f"Crossover: {crossovered_population}")
+
+    # Mutate the crossovered population
+    mutated_population = mutation(crossovered_population, mutation_rate, streams["mutation"])
+    logging.debug(f"Mutated: {mutated_population}")
+
+    # Select as many individuals as the current population from the mutated population
+    new_population = streams["sampling"].sample(mutated_population, len(population))
+
+    # Replace the best individual in the same position in the new population
+    new_population[best_index] = best_individual
+    logging.debug(f"New Population: {new_population}")
+
+    return new_population
@@ -0,0 +1,266 @@
+"""
+Author: Rafael Gomes Alves
+Description: Dispatch a population of light recipes to the light fixtures through the Orion Context Broker.
+Each individual of the population is sent as a command to one side of a light fixture:
+- population[0] and population[1]: left and right colors of urn:ngsi-ld:light_fixture:001
+- population[2] and population[3]: left and right colors of urn:ngsi-ld:light_fixture:002
+- population[4] and population[5]: left and right colors of urn:ngsi-ld:light_fixture:003
+The whole population is sent as a single NGSI v2 batch update (/v2/op/update) over a
+pooled HTTP session. When the batch operation is not available, the commands are sent as
+concurrent PATCH requests, one per entity with its left and right colors.
+Only the commands that changed since the last dispatch are sent: the dispatcher keeps the
+last color applied to each fixture (AppliedState), optionally in a JSON file, so the best
+individual kept by elitism does not redraw its strip every generation.
+"""
+
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ORION_URL = "http://10.24.1.10:1026"
+ENTITY_TYPE = "light_fixture"
+
+HEADERS = {
+    "Content-Type": "application/json",
+    "fiware-service": "vfarm",
+    "fiware-servicepath": "/vfarm",
+}
+
+# Entity and command attribute receiving each individual of the population
+SLOTS = [
+    ("urn:ngsi-ld:light_fixture:001", "setLeftColor"),
+    ("urn:ngsi-ld:light_fixture:001", "setRightColor"),
+    ("urn:ngsi-ld:light_fixture:002", "setLeftColor"),
+    ("urn:ngsi-ld:light_fixture:002", "setRightColor"),
+    ("urn:ngsi-ld:light_fixture:003", "setLeftColor"),
+    ("urn:ngsi-ld:light_fixture:003", "setRightColor"),
+]
+
+# Status codes meaning that Orion does not accept the batch operation for these entities
+BATCH_UNAVAILABLE = (404, 405, 501)
+
+
+def build_commands(population, slots=SLOTS):
+    """
+    Map each individual of the population to the command of its light fixture.
+
+    args:
+        population (list): The population. Ex. [[211, 169, 243], ...]
+        slots (list): The (entity id, command) receiving each individual. Default is SLOTS.
+
+    Returns:
+        dict: The commands of each entity. Ex. {'urn:ngsi-ld:light_fixture:001': {'setLeftColor': [211, 169, 243]}}
+    """
+    if len(population) > len(slots):
+        raise ValueError(f"The population has {len(population)} individuals but only {len(slots)} fixtures are defined")
+
+    commands = {}
+    for (entity_id, attribute), individual in zip(slots, population):
+        commands.setdefault(entity_id, {})[attribute] = [int(gene) for gene in individual]
+    return commands
+
+
+def count_commands(commands):
+    return sum(len(attributes) for attributes in commands.values())
+
+
+class AppliedState:
+    """
+    Last command value applied to each entity, used to send only the commands that changed.
+
+    args:
+        path (str): JSON file where the state is kept between runs. Default is in memory only.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.applied = {}
+        if path and os.path.exists(path):
+            with open(path) as file:
+                self.applied = json.load(file)
+
+    @staticmethod
+    def key(orion_url, service, servicepath, entity_id):
+        """
+        Identify an entity in the state, since the same entity id can exist in several towers.
+        OrionDispatcher and ga.fleet.FleetDispatcher use the same key, so they share a state file.
+        """
+        return "|".join((orion_url.rstrip("/"), service, servicepath, entity_id))
+
+    def diff(self, commands):
+        """
+        Remove the commands whose value is already applied.
+
+        args:
+            commands (dict): The commands of each entity, by key. Ex. {AppliedState.key(...): {'setLeftColor': [211, 169, 243]}}
+
+        Returns:
+            dict: The commands to send, without the entities with no change.
+        """
+        changed = {}
+        for key, attributes in commands.items():
+            applied = self.applied.get(key, {})
+            attributes = {attribute: value for attribute, value in attributes.items() if applied.get(attribute) != value}
+            if attributes:
+                changed[key] = attributes
+        return changed
+
+    def update(self, key, attributes):
+        """Record the commands applied to an entity."""
+        self.applied.setdefault(key, {}).update(attributes)
+
+    def save(self):
+        if not self.path:
+            return
+        # Write to a temporary file and rename it, so the state is never left half written
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+        with os.fdopen(descriptor, "w") as file:
+            json.dump(self.applied, file)
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        """Forget the applied commands, Ex. after the fixtures were restarted."""
+        self.applied = {}
+        self.save()
+
+
+class OrionDispatcher:
+    """
+    Send populations to the light fixtures through the Orion Context Broker.
+
+    args:
+        orion_url (str): The Orion Context Broker URL. Default is ORION_URL.
+        headers (dict): The headers with the FIWARE service and service path. Default is HEADERS.
+        slots (list): The (entity id, command) receiving each individual. Default is SLOTS.
+        entity_type (str): The type of the entities. Default is 'light_fixture'.
+        batch (bool): Use the batch operation. Default is True.
+        workers (int): Maximum number of concurrent requests without batch. Default value is 6.
+        timeout (float): Timeout of each request in seconds. Default value is 10.
+        state (AppliedState): The commands already applied. Default is a new state in memory.
+        delta (bool): Send only the commands that changed since the last dispatch. Default is True.
+    """
+
+    def __init__(
+        self,
+        orion_url=ORION_URL,
+        headers=HEADERS,
+        slots=SLOTS,
+        entity_type=ENTITY_TYPE,
+        batch=True,
+        workers=6,
+        timeout=10,
+        state=None,
+        delta=True,
+    ):
+        self.orion_url = orion_url.rstrip("/")
+        self.slots = slots
+        self.entity_type = entity_type
+        self.batch = batch
+        self.workers = workers
+        self.timeout = timeout
+        self.state = state if state is not None else AppliedState()
+        self.delta = delta
+        self.service = headers.get("fiware-service", "")
+        self.servicepath = headers.get("fiware-servicepath", "")
+
+        # Keep-alive connections shared by every request
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def dispatch(self, population, force=False):
+        """
+        Send each individual of the population as a command to its light fixture.
+
+        args:
+            population (list): The population. Ex. [[211, 169, 243], ...]
+            force (bool): Send every command, even if it is already applied. Default is False.
+
+        Returns:
+            list: One report per request with the entity id, the attributes, the status code and
+            the response text. The entities without changes are not sent nor reported.
+        """
+        commands = build_commands(population, self.slots)
+        if self.delta and not force:
+            total = count_commands(commands)
+            changed = self.state.diff({self.key(entity_id): attributes for entity_id, attributes in commands.items()})
+            commands = {entity_id: changed[self.key(entity_id)] for entity_id in commands if self.key(entity_id) in changed}
+            logging.info(f"Delta dispatch | Commands: {count_commands(commands)} | Unchanged: {total - count_commands(commands)}")
+        if not commands:
+            return []
+
+        reports = self.send(commands)
+        for report in reports:
+            if report["status_code"] < 300:
+                self.state.update(self.key(report["entity_id"]), commands[report["entity_id"]])
+        self.state.save()
+        return reports
+
+    def key(self, entity_id):
+        return self.state.key(self.orion_url, self.service, self.servicepath, entity_id)
+
+    def send(self, commands):
+        if self.batch:
+            response = self.session.post(
+                f"{self.orion_url}/v2/op/update",
+                data=json.dumps(self.batch_payload(commands)),
+                timeout=self.timeout,
+            )
+            logging.info(f"Batch update | Status: {response.status_code} | {response.text}")
+            if response.ok:
+                return [self.report(entity_id, attributes, response) for entity_id, attributes in commands.items()]
+            if response.status_code in BATCH_UNAVAILABLE:
+                logging.warning("Batch update is not available, sending the commands to each entity")
+                self.batch = False
+
+        return self.patch_each(commands)
+
+    def batch_payload(self, commands):
+        entities = []
+        for entity_id, attributes in commands.items():
+            entity = {"id": entity_id, "type": self.entity_type}
+            for attribute, value in attributes.items():
+                entity[attribute] = {"type": "command", "value": value}
+            entities.append(entity)
+        return {"actionType": "update", "entities": entities}
+
+    def patch_each(self, commands):
+        # One request per entity, with the left and right colors together
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda request: self.patch(*request), commands.items()))
+
+    def patch(self, entity_id, attributes):
+        payload = {attribute: {"type": "command", "value": value} for attribute, value in attributes.items()}
+        response = self.session.patch(
+            f"{self.orion_url}/v2/entities/{entity_id}/attrs",
+            params={"type": self.entity_type},
+            data=json.dumps(payload),
+            timeout=self.timeout,
+        )
+        logging.info(f"Entity: {entity_id} | Attributes: {list(attributes)} | Status: {response.status_code} | {response.text}")
+        return self.report(entity_id, attributes, response)
+
+    @staticmethod
+    def report(entity_id, attributes, response):
+        return {
+            "entity_id": entity_id,
+            "attributes": list(attributes),
+            "status_code": response.status_code,
+            "text": response.text,
+        }
+
+    def close(self):
+        self.session.close()
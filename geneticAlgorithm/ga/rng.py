@@ -0,0 +1,65 @@
+"""
+Author: Rafael Gomes Alves
+Description: Seedable random streams for the Genetic Algorithm.
+Each stage of the algorithm draws from its own independent stream, so a run can be
+reproduced from its seed and changing one stage (Ex. the mutation rate) does not change
+the random numbers used by the other stages. The streams are:
+- init: random individuals (first population and candidates of each generation)
+- crossover: crossover points
+- mutation: bits flipped by the mutation
+- sampling: selection of the new population among the candidates
+Every stream is available as a random.Random, used by the string engine (ga.operators),
+and as a numpy.random.Generator, used by the vectorized engine (ga.vectorized).
+"""
+
+import random
+
+import numpy as np
+
+STREAMS = ("init", "crossover", "mutation", "sampling")
+
+
+class RandomStreams:
+    """
+    Independent random streams derived from a single seed.
+
+    args:
+        seed (int): The seed of the run. Default is a random seed, available in the `seed` attribute.
+            A numpy.random.SeedSequence is also accepted, Ex. one of the children spawned for the
+            islands of ga.islands.
+    """
+
+    def __init__(self, seed=None):
+        if isinstance(seed, np.random.SeedSequence):
+            seed_sequence = seed
+        else:
+            seed_sequence = np.random.SeedSequence(seed)
+        self.seed = seed_sequence.entropy
+        children = seed_sequence.spawn(len(STREAMS))
+
+        self.python = {}
+        self.numpy = {}
+        for name, child in zip(STREAMS, children):
+            self.numpy[name] = np.random.default_rng(child)
+            self.python[name] = random.Random(int(child.generate_state(1, np.uint64)[0]))
+
+    def get_state(self):
+        """Return the state of every stream as a JSON serializable dict, Ex. to save a checkpoint (ga.checkpoint)."""
+        return {
+            "seed": self.seed,
+            "numpy": {name: generator.bit_generator.state for name, generator in self.numpy.items()},
+            "python": {name: generator.getstate() for name, generator in self.python.items()},
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Restore the streams from a state returned by get_state, so the run continues exactly where it stopped."""
+        streams = cls(state["seed"])
+        for name in STREAMS:
+            streams.numpy[name].bit_generator.state = state["numpy"][name]
+            version, internal_state, gauss_next = state["python"][name]
+            streams.python[name].setstate((version, tuple(internal_state), gauss_next))
+        return streams
+
+    def __repr__(self):
+        return f"RandomStreams(seed={self.seed})"
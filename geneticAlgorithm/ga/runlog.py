@@ -0,0 +1,111 @@
+"""
+Author: Rafael Gomes Alves
+Description: Run log of a Genetic Algorithm experiment.
+The log is a JSON Lines file. The first line describes the run (seed, engine and parameters)
+and each following line records one generation with its population and fitness values:
+    {"type": "run", "seed": 42, "engine": "vectorized", "initial_population": "random", ...}
+    {"type": "generation", "generation": 0, "population": [[211, 169, 243], ...], "fitness": [100.0, ...]}
+Since every random number comes from ga.rng.RandomStreams, the seed and the recorded
+fitness values are enough to replay the whole experiment bit-for-bit (see ga.runner.replay_run).
+"""
+
+import json
+
+
+class RunLog:
+    """
+    Write the run log of an experiment.
+
+    args:
+        path (str): Path to the JSON Lines file. An existing file is overwritten.
+        append (bool): Append to an existing file instead, Ex. when a run is resumed from a checkpoint. Default is False.
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.file = open(path, "a" if append else "w")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def start(self, seed, engine, initial_population="random", **parameters):
+        """
+        Record the description of the run.
+
+        args:
+            seed (int): The seed of the random streams.
+            engine (str): The engine used for the operators, 'vectorized' or 'string'.
+            initial_population (str): 'random' if the first population was generated from the seed, 'given' otherwise.
+            parameters: The parameters of the GA. Ex. candidates_size=30, mutation_rate=0.05
+        """
+        self._write({"type": "run", "seed": seed, "engine": engine, "initial_population": initial_population, **parameters})
+
+    def generation(self, generation, population, fitness_values):
+        """Record a population and its fitness values."""
+        self._write(
+            {
+                "type": "generation",
+                "generation": generation,
+                "population": [[int(gene) for gene in individual] for individual in population],
+                "fitness": [float(fitness) for fitness in fitness_values],
+            }
+        )
+
+    def close(self):
+        self.file.close()
+
+
+def read_run_log(path):
+    """
+    Read a run log.
+
+    args:
+        path (str): Path to the JSON Lines file.
+
+    Returns:
+        tuple: The description of the run (dict) and the list of generations (list of dict).
+    """
+    run = None
+    generations = []
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record["type"] == "run":
+                run = record
+            elif record["type"] == "generation":
+                generations.append(record)
+    if run is None:
+        raise ValueError(f"{path} is not a run log")
+    return run, generations
+
+
+def truncate_run_log(path, generation):
+    """
+    Remove the generations recorded after a given generation, Ex. the generations recorded after
+    the last checkpoint of a run that stopped, so the resumed run does not record them twice.
+
+    args:
+        path (str): Path to the JSON Lines file.
+        generation (int): The last generation to keep.
+    """
+    kept = []
+    with open(path) as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Line truncated when the run stopped
+                continue
+            if record.get("generation", -1) <= generation:
+                kept.append(line)
+    with open(path, "w") as file:
+        file.writelines(kept)
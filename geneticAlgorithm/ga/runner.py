@@ -0,0 +1,281 @@
+"""
+Author: Rafael Gomes Alves
+Description: Headless runner for the Genetic Algorithm.
+The runner executes the same loop used with the growth tower (evaluate the population,
+generate a new population from the best individual, repeat), but the fitness comes from
+a fitness function instead of manual measurements. Two engines are available:
+- string: the operators of GA.ipynb (ga.operators)
+- vectorized: the NumPy engine (ga.vectorized), much faster for long simulations
+Every random number comes from ga.rng.RandomStreams, so a run is reproducible from its
+seed and can be recorded in a run log (ga.runlog) and replayed bit-for-bit.
+With a surrogate (ga.surrogate.SurrogateScreen), the next population is the best predicted
+among a large batch of candidates, generated with the vectorized operators whatever the
+engine, and the surrogate is fitted again after each generation.
+"""
+
+import logging
+import time
+
+from ga import operators, vectorized
+from ga.rng import RandomStreams
+from ga.runlog import RunLog, read_run_log, truncate_run_log
+from ga.surrogate import SurrogateScreen
+
+ENGINES = ("vectorized", "string")
+
+
+def evaluate_population(fitness_function, population):
+    """
+    Evaluate each individual of a population with a fitness function.
+
+    args:
+        fitness_function (callable): Function receiving an individual and returning its fitness.
+        population (list): The population. Ex. [[10, 20, 30], [40, 50, 60]]
+
+    Returns:
+        list: The fitness of each individual. Ex. [10.0, 20.0]
+    """
+    return [float(fitness_function(individual)) for individual in population]
+
+
+def first_population(engine, population_size, chromosome_size, streams):
+    """
+    Generate the first population from the init stream.
+
+    args:
+        engine (str): The engine used for the operators, 'vectorized' or 'string'.
+        population_size (int): The number of individuals. Ex. 6
+        chromosome_size (int): The number of genes in each individual. Ex. 3
+        streams (ga.rng.RandomStreams): The random streams of the run.
+
+    Returns:
+        list: The population.
+    """
+    if engine == "vectorized":
+        return vectorized.generate_population(population_size, chromosome_size, streams.numpy["init"]).tolist()
+    return operators.generate_population(population_size, chromosome_size, streams.python["init"])
+
+
+def next_population(engine, population, fitness_values, candidates_size, mutation_rate, streams, surrogate=None):
+    """
+    Generate the next population with the operators of the engine, or with the surrogate if given.
+
+    args:
+        engine (str): The engine used for the operators, 'vectorized' or 'string'.
+        population (list): The current population. Ex. [[10, 20, 30], [40, 50, 60]]
+        fitness_values (list): The fitness of each individual. Ex. [10.0, 20.0]
+        candidates_size (int): The number of random candidates. Ex. 30
+        mutation_rate (float): The probability of flipping each bit. Ex. 0.05
+        streams (ga.rng.RandomStreams): The random streams of the run.
+        surrogate (ga.surrogate.SurrogateScreen): Surrogate used to pre-screen the candidates. Default is None.
+
+    Returns:
+        list: The new population.
+    """
+    if surrogate is not None:
+        return surrogate.next_population(population, fitness_values, mutation_rate, streams)
+    if engine == "vectorized":
+        return vectorized.generate_new_population(
+            population, fitness_values, candidates_size, mutation_rate, streams=streams
+        ).tolist()
+    return operators.generate_new_population(
+        population, list(fitness_values), candidates_size, mutation_rate, streams
+    )
+
+
+def run_simulation(
+    fitness_function,
+    generations,
+    population_size=6,
+    chromosome_size=3,
+    candidates_size=30,
+    mutation_rate=0.05,
+    engine="vectorized",
+    seed=None,
+    initial_population=None,
+    evaluate=None,
+    run_log=None,
+    surrogate=None,
+    checkpoint=None,
+    checkpoint_interval=1,
+    resume=False,
+):
+    """
+    Run the Genetic Algorithm for a number of generations using a fitness function.
+
+    args:
+        fitness_function (callable): Function receiving an individual and returning its fitness.
+        generations (int): The number of generations to run. Ex. 10000
+        population_size (int): The number of individuals evaluated per generation. Default value is 6.
+        chromosome_size (int): The number of genes in each individual. Default value is 3.
+        candidates_size (int): The number of random candidates per generation. Default value is 30.
+        mutation_rate (float): The probability of flipping each bit. Default value is 0.05.
+        engine (str): The engine used for the operators, 'vectorized' or 'string'.
+        seed (int): Seed for the random generators. Default is a random seed.
+        initial_population (list): The first population. Default is a random population.
+        evaluate (callable): Function receiving a population and returning the fitness of each
+            individual, Ex. a ga.evaluation.PoolEvaluator. Default evaluates one individual at a time.
+        run_log (str): Path to a run log recording every generation. Default is no run log.
+        surrogate (ga.surrogate.SurrogateScreen): Surrogate used to pre-screen the candidates of
+            each generation. Default is no surrogate.
+        checkpoint (ga.checkpoint.Checkpoint): Checkpoint whose history records every evaluated generation. Default is None.
+        checkpoint_interval (int): The number of generations between saves of the state to resume. Default value is 1.
+        resume (bool): Continue the run from the checkpoint, with the same random streams. The
+            surrogate, if any, is trained again on the history of the checkpoint. Default is False.
+
+    Returns:
+        dict: The result of the simulation with the seed, the final population, its fitness,
+        the best individual found, its fitness, and the best fitness of each generation simulated by this call.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+    if generations < 1:
+        raise ValueError("At least one generation must be simulated")
+
+    if evaluate is None:
+        def evaluate(population):
+            return evaluate_population(fitness_function, population)
+
+    state = checkpoint.load() if resume and checkpoint is not None and checkpoint.exists() else None
+    if state is not None:
+        streams = state["streams"]
+        population, fitness_values = state["population"], state["fitness"]
+        best_individual, overall_best_fitness = state["best_individual"], state["best_fitness"]
+        first_generation = state["generation"] + 1
+        # The generations recorded after the state are evaluated again
+        checkpoint.truncate_history(state["generation"])
+        if surrogate is not None:
+            for record in checkpoint.read_history():
+                if record["generation"] < first_generation:
+                    surrogate.update(record["population"], record["fitness"])
+        logging.info(f"Resuming from generation {first_generation} | Best: {best_individual} | Fitness: {overall_best_fitness}")
+    else:
+        streams = RandomStreams(seed)
+        best_individual = None
+        overall_best_fitness = float("-inf")
+        first_generation = 0
+
+        # Generate the first population
+        if initial_population is not None:
+            population = [list(individual) for individual in initial_population]
+        else:
+            population = first_population(engine, population_size, chromosome_size, streams)
+
+    log = None
+    if run_log and state is not None:
+        truncate_run_log(run_log, state["generation"])
+        log = RunLog(run_log, append=True)
+    elif run_log:
+        log = RunLog(run_log)
+        log.start(
+            streams.seed,
+            engine,
+            "given" if initial_population is not None else "random",
+            population_size=len(population),
+            chromosome_size=len(population[0]),
+            candidates_size=candidates_size,
+            mutation_rate=mutation_rate,
+            **(
+                {
+                    "surrogate_candidates": surrogate.candidates_size,
+                    "surrogate_alpha": surrogate.model.alpha,
+                    "surrogate_exploration": surrogate.exploration,
+                }
+                if surrogate is not None
+                else {}
+            ),
+        )
+
+    best_fitness = []
+    start = time.perf_counter()
+
+    # The checkpoint holds an evaluated generation, continue with the next population
+    if state is not None and first_generation < generations:
+        population = next_population(engine, population, fitness_values, candidates_size, mutation_rate, streams, surrogate)
+
+    for generation in range(first_generation, generations):
+        fitness_values = evaluate(population)
+
+        # Keep track of the best individual found so far
+        best_index = fitness_values.index(max(fitness_values))
+        if fitness_values[best_index] > overall_best_fitness:
+            overall_best_fitness = fitness_values[best_index]
+            best_individual = list(population[best_index])
+        best_fitness.append(fitness_values[best_index])
+        logging.debug(f"Generation: {generation} | Best: {population[best_index]} | Fitness: {fitness_values[best_index]}")
+        if log is not None:
+            log.generation(generation, population, fitness_values)
+        if surrogate is not None:
+            surrogate.update(population, fitness_values)
+        if checkpoint is not None and (generation % checkpoint_interval == 0 or generation == generations - 1):
+            checkpoint.save(generation, population, fitness_values, streams, best_individual, overall_best_fitness)
+        elif checkpoint is not None:
+            checkpoint.append_history(generation, population, fitness_values)
+
+        # The last population is only evaluated
+        if generation == generations - 1:
+            break
+
+        population = next_population(engine, population, fitness_values, candidates_size, mutation_rate, streams, surrogate)
+
+    if log is not None:
+        log.close()
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Simulated {generations} generations in {elapsed:.2f} seconds | Best: {best_individual} | Fitness: {overall_best_fitness}")
+
+    return {
+        "seed": streams.seed,
+        "population": population,
+        "fitness": fitness_values,
+        "best_individual": best_individual,
+        "overall_best_fitness": overall_best_fitness,
+        "best_fitness": best_fitness,
+        "elapsed": elapsed,
+    }
+
+
+def replay_run(path):
+    """
+    Replay an experiment from its run log, using the recorded seed and fitness values, and
+    check that every population is generated again bit-for-bit.
+
+    args:
+        path (str): Path to the run log.
+
+    Returns:
+        dict: The number of generations replayed, whether every population matched and the
+        first generation that did not match (None if all matched).
+    """
+    run, generations = read_run_log(path)
+    streams = RandomStreams(run["seed"])
+    mismatch = None
+
+    # The surrogate of the run only learns from the recorded generations
+    surrogate = None
+    if "surrogate_candidates" in run:
+        surrogate = SurrogateScreen(run["surrogate_candidates"], run["surrogate_alpha"], run["surrogate_exploration"])
+
+    if generations and run["initial_population"] == "random":
+        population = first_population(run["engine"], run["population_size"], run["chromosome_size"], streams)
+        if population != generations[0]["population"]:
+            mismatch = 0
+
+    for previous, current in zip(generations, generations[1:]):
+        if mismatch is not None:
+            break
+        if surrogate is not None:
+            surrogate.update(previous["population"], previous["fitness"])
+        population = next_population(
+            run["engine"],
+            previous["population"],
+            previous["fitness"],
+            run["candidates_size"],
+            run["mutation_rate"],
+            streams,
+            surrogate,
+        )
+        if population != current["population"]:
+            mismatch = current["generation"]
+
+    return {"generations": len(generations), "matches": mismatch is None, "mismatch": mismatch}
@@ -0,0 +1,227 @@
+"""
+Author: Rafael Gomes Alves
+Description: Surrogate model used to pre-screen candidates before a physical evaluation.
+Each evaluation of a light recipe in the growth tower costs days of growth. The surrogate
+is a lightweight regression model trained on the (recipe, fitness) pairs measured so far,
+from the collected data, the fitness cache and earlier run logs. Every generation a large
+batch of candidates is produced by crossover and mutation, the surrogate predicts their
+fitness, and only the best predicted candidates are sent to the tower, along with a random
+sample of the other candidates so the search does not stay around the best individual.
+The model is a ridge regression on the second degree polynomial features of the genes,
+fitted in closed form with NumPy.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+
+import numpy as np
+
+from ga import vectorized
+from ga.rng import STREAMS
+from ga.runlog import read_run_log
+
+COLLECTED_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "collectedData", "Data analysis.xlsx")
+
+
+# --- Training data ---
+def load_collected_data(path=COLLECTED_DATA, sheet="Lights"):
+    """
+    Read the (recipe, fitness) pairs measured in the growth tower from the collected data.
+    The sheet has blocks of columns N, R, G, B and Fit for each measurement day.
+
+    args:
+        path (str): Path to the Excel file. Default is collectedData/Data analysis.xlsx.
+        sheet (str): The sheet with the recipes and fitness values. Default is 'Lights'.
+
+    Returns:
+        tuple: The recipes (list of lists) and their fitness values (list).
+    """
+    import openpyxl  # Only needed to read the collected data
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    rows = list(workbook[sheet].iter_rows(values_only=True))
+    workbook.close()
+
+    recipes, fitness_values = [], []
+    columns = []
+    for row in rows:
+        # Header rows define where each R, G, B, Fit block starts
+        if "R" in row and "Fit" in row:
+            columns = [index for index, value in enumerate(row) if value == "R" and row[index + 3 : index + 4] == ("Fit",)]
+            continue
+        for index in columns:
+            red, green, blue, fitness = row[index : index + 4]
+            if all(isinstance(value, (int, float)) for value in (red, green, blue, fitness)):
+                recipes.append([int(red), int(green), int(blue)])
+                fitness_values.append(float(fitness))
+    return recipes, fitness_values
+
+
+def load_cache_data(path):
+    """Read the (recipe, fitness) pairs stored in a fitness cache (ga.cache)."""
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT recipe, fitness FROM fitness WHERE kind = 'chromosome'").fetchall()
+    conn.close()
+    recipes = [[int(gene) for gene in recipe.split(",")] for recipe, _ in rows]
+    return recipes, [float(json.loads(fitness)) for _, fitness in rows]
+
+
+def load_run_log_data(path):
+    """Read the (recipe, fitness) pairs recorded in a run log (ga.runlog)."""
+    _, generations = read_run_log(path)
+    recipes, fitness_values = [], []
+    for generation in generations:
+        recipes.extend(generation["population"])
+        fitness_values.extend(generation["fitness"])
+    return recipes, fitness_values
+
+
+def load_training_data(paths):
+    """
+    Read the (recipe, fitness) pairs of several files, by extension: Excel files with the
+    collected data, .jsonl run logs, and fitness cache databases otherwise.
+
+    args:
+        paths (list): Paths to the files. Ex. ['../collectedData/Data analysis.xlsx', 'run.jsonl', 'cache.db']
+
+    Returns:
+        tuple: The recipes (list of lists) and their fitness values (list).
+    """
+    recipes, fitness_values = [], []
+    for path in paths:
+        if path.endswith(".xlsx"):
+            data = load_collected_data(path)
+        elif path.endswith(".jsonl"):
+            data = load_run_log_data(path)
+        else:
+            data = load_cache_data(path)
+        logging.info(f"Surrogate | Loaded {len(data[0])} recipes from {path}")
+        recipes.extend(data[0])
+        fitness_values.extend(data[1])
+    return recipes, fitness_values
+
+
+# --- Model ---
+def polynomial_features(recipes):
+    """Second degree polynomial features of the genes scaled to [0, 1], without the constant term."""
+    genes = np.asarray(recipes, dtype=float) / 255
+    rows, columns = np.triu_indices(genes.shape[1])
+    return np.hstack([genes, genes[:, rows] * genes[:, columns]])
+
+
+class RidgeSurrogate:
+    """
+    Ridge regression on the polynomial features of the recipes.
+
+    args:
+        alpha (float): Regularization strength. Default value is 1.0.
+    """
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.coefficients = None
+        self.intercept = 0.0
+        self.mean = None
+
+    def fit(self, recipes, fitness_values):
+        features = polynomial_features(recipes)
+        target = np.asarray(fitness_values, dtype=float)
+
+        # Center the data so the intercept is not regularized
+        self.mean = features.mean(axis=0)
+        self.intercept = target.mean()
+        centered = features - self.mean
+        gram = centered.T @ centered + self.alpha * np.eye(centered.shape[1])
+        self.coefficients = np.linalg.solve(gram, centered.T @ (target - self.intercept))
+        return self
+
+    def predict(self, recipes):
+        if self.coefficients is None:
+            raise ValueError("The surrogate model must be fitted before predicting")
+        return (polynomial_features(recipes) - self.mean) @ self.coefficients + self.intercept
+
+
+class SurrogateScreen:
+    """
+    Pre-screen the candidates of each generation with a surrogate model.
+
+    args:
+        candidates_size (int): The number of candidates produced and scored per generation. Default value is 300.
+        alpha (float): Regularization strength of the ridge regression. Default value is 0.01.
+        exploration (float): Fraction of the population sampled at random among the candidates
+            instead of the best predicted. Default value is 0.5.
+        recipes (list): Recipes measured before the run. Ex. load_collected_data()[0]
+        fitness_values (list): Fitness of each recipe measured before the run.
+    """
+
+    def __init__(self, candidates_size=300, alpha=0.01, exploration=0.5, recipes=None, fitness_values=None):
+        self.candidates_size = candidates_size
+        self.exploration = exploration
+        self.model = RidgeSurrogate(alpha)
+        self.recipes = [list(recipe) for recipe in recipes or []]
+        self.fitness_values = list(fitness_values or [])
+        self.fitted = False
+        if self.recipes:
+            self.fit()
+
+    def fit(self):
+        self.model.fit(self.recipes, self.fitness_values)
+        self.fitted = True
+
+    def update(self, population, fitness_values):
+        """Add measured (recipe, fitness) pairs to the training data and fit the model again."""
+        for individual, fitness in zip(population, fitness_values):
+            if np.isfinite(fitness):
+                self.recipes.append([int(gene) for gene in individual])
+                self.fitness_values.append(float(fitness))
+        if self.recipes:
+            self.fit()
+
+    def next_population(self, population, fitness_values, mutation_rate=0.05, streams=None):
+        """
+        Generate the next population keeping the best predicted candidates.
+        As in ga.vectorized.generate_new_population, the candidates are crossovered with the
+        best individual and mutated, and the best individual is kept in the same position.
+
+        args:
+            population (list): The current population. Ex. [[10, 20, 30], [40, 50, 60]]
+            fitness_values (list): The fitness of each individual. Ex. [10.0, 20.0]
+            mutation_rate (float): The probability of flipping each bit. Default value is 0.05.
+            streams (ga.rng.RandomStreams): Random streams to use. Default is the module generator.
+
+        Returns:
+            list: The new population.
+        """
+        streams = streams.numpy if streams is not None else dict.fromkeys(STREAMS, vectorized.default_rng)
+        population = np.asarray(population, dtype=np.uint8)
+        best_index = int(np.argmax(fitness_values))
+        best_individual = population[best_index]
+
+        candidates = vectorized.generate_population(self.candidates_size, population.shape[1], streams["init"])
+        candidates = vectorized.crossover(best_individual, candidates, streams["crossover"])
+        candidates = vectorized.mutation(candidates, mutation_rate, streams["mutation"])
+
+        # Score unique candidates that were not measured yet
+        candidates = np.unique(candidates, axis=0)
+        measured = {tuple(recipe) for recipe in self.recipes}
+        measured.add(tuple(best_individual.tolist()))
+        candidates = candidates[[tuple(candidate) not in measured for candidate in candidates.tolist()]]
+        # The best individual keeps its position, the candidates fill the other positions
+        size = len(population) - 1
+        if not self.fitted or len(candidates) < size:
+            selected = streams["sampling"].choice(len(candidates), min(size, len(candidates)), replace=False)
+        else:
+            # Best predicted candidates, and a random sample of the others to keep exploring
+            predictions = self.model.predict(candidates)
+            order = np.argsort(-predictions, kind="stable")
+            exploit = size - int(round(self.exploration * size))
+            explore = streams["sampling"].choice(order[exploit:], size - exploit, replace=False)
+            selected = np.concatenate([order[:exploit], explore])
+            logging.debug(f"Surrogate | Candidates: {len(candidates)} | Predicted: {predictions[selected].round(2).tolist()}")
+
+        new_population = np.repeat(best_individual[None, :], len(population), axis=0)
+        others = np.delete(np.arange(len(population)), best_index)
+        new_population[others[: len(selected)]] = candidates[selected]
+        return new_population.tolist()
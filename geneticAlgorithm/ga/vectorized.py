@@ -0,0 +1,138 @@
+"""
+Author: Rafael Gomes Alves
+Description: Vectorized NumPy engine for the Genetic Algorithm operators.
+The population is stored as a (population_size, chromosome_size) uint8 array, so each
+operator works on the whole population at once using bit masks instead of strings.
+The engine keeps the semantics of the operators defined in GA.ipynb:
+- One-point crossover of every gene against the best individual, with the crossover
+  point drawn from 0 to 8 and the most significant bits taken from the best individual
+- Mutation flipping each bit with a probability of mutation_rate (default 0.05)
+- Elitism keeping the best individual in the same position of the new population
+The functions use a module generator unless a numpy.random.Generator is given, and
+generate_new_population accepts ga.rng.RandomStreams to use one stream per stage.
+"""
+
+import numpy as np
+
+from ga.rng import STREAMS
+
+NUM_BITS = 8
+
+# Mask keeping the `point` most significant bits of a gene, indexed by the crossover point
+CROSSOVER_MASKS = np.array(
+    [(0xFF << (NUM_BITS - point)) & 0xFF for point in range(NUM_BITS + 1)],
+    dtype=np.uint8,
+)
+
+# Generator used when the caller does not provide one
+default_rng = np.random.default_rng()
+
+
+def generate_population(population_size, chromosome_size, rng=None):
+    """
+    Generate a population of chromosomes with random genes from 0 to 255.
+
+    args:
+        population_size (int): The number of individuals in the population. Ex. 30
+        chromosome_size (int): The number of genes in each individual. Ex. 3
+        rng (numpy.random.Generator): Random generator to use. Default is the module generator.
+
+    Returns:
+        numpy.ndarray: A (population_size, chromosome_size) uint8 array.
+    """
+    rng = default_rng if rng is None else rng
+    return rng.integers(0, 256, size=(population_size, chromosome_size), dtype=np.uint8)
+
+
+def crossover(best, population, rng=None):
+    """
+    Perform one-point crossover between the best individual and a population of individuals.
+    A crossover point is drawn for every gene and the bits before it are taken from the best
+    individual, while the remaining bits are kept from the individual.
+
+    args:
+        best (array-like): The best individual. Ex. [10, 20, 30]
+        population (array-like): The population of individuals. Ex. [[1, 2, 3], [4, 5, 6]]
+        rng (numpy.random.Generator): Random generator to use. Default is the module generator.
+
+    Returns:
+        numpy.ndarray: The crossovered population as a uint8 array.
+    """
+    rng = default_rng if rng is None else rng
+    best = np.asarray(best, dtype=np.uint8)
+    population = np.asarray(population, dtype=np.uint8)
+
+    # Select a random crossover point for each gene and convert it to a bit mask
+    crossover_points = rng.integers(0, NUM_BITS + 1, size=population.shape)
+    masks = CROSSOVER_MASKS[crossover_points]
+
+    return (best & masks) | (population & ~masks)
+
+
+def mutation(population, mutation_rate=0.05, rng=None):
+    """
+    Perform mutation on a population of individuals.
+    A random bitmask is drawn for each gene, where each bit is set with a probability of
+    mutation_rate, and the genes are XORed with it.
+
+    args:
+        population (array-like): The population of individuals. Ex. [[1, 2, 3], [4, 5, 6]]
+        mutation_rate (float): The probability of flipping each bit. Default value is 0.05.
+        rng (numpy.random.Generator): Random generator to use. Default is the module generator.
+
+    Returns:
+        numpy.ndarray: The mutated population as a uint8 array.
+    """
+    rng = default_rng if rng is None else rng
+    population = np.asarray(population, dtype=np.uint8)
+
+    # Draw one boolean per bit and pack each group of 8 bits into a gene mask
+    flips = rng.random(population.shape + (NUM_BITS,)) < mutation_rate
+    masks = np.packbits(flips, axis=-1).reshape(population.shape)
+
+    return population ^ masks
+
+
+def generate_new_population(
+    population,
+    fitness_values,
+    candidates_size=30,
+    mutation_rate=0.05,
+    rng=None,
+    streams=None,
+):
+    """
+    Generate a new population from the current population and its fitness values.
+    A random population of candidates is crossovered with the best individual and mutated,
+    a sample of the same size as the current population is selected, and the best individual
+    is kept in the same position.
+
+    args:
+        population (array-like): The current population. Ex. [[1, 2, 3], [4, 5, 6]]
+        fitness_values (array-like): The fitness of each individual. Ex. [10.0, 20.0]
+        candidates_size (int): The number of random candidates. Default value is 30.
+        mutation_rate (float): The probability of flipping each bit. Default value is 0.05.
+        rng (numpy.random.Generator): Random generator used by every stage. Default is the module generator.
+        streams (ga.rng.RandomStreams): Random streams to use, one per stage. Default uses rng.
+
+    Returns:
+        numpy.ndarray: The new population as a uint8 array.
+    """
+    rng = default_rng if rng is None else rng
+    streams = streams.numpy if streams is not None else dict.fromkeys(STREAMS, rng)
+    population = np.asarray(population, dtype=np.uint8)
+
+    # Select the best individual (first one in case of a tie, as list.index does)
+    best_index = int(np.argmax(fitness_values))
+    best_individual = population[best_index]
+
+    # Generate the candidates, crossover them with the best individual and mutate them
+    candidates = generate_population(candidates_size, population.shape[1], streams["init"])
+    candidates = crossover(best_individual, candidates, streams["crossover"])
+    candidates = mutation(candidates, mutation_rate, streams["mutation"])
+
+    # Select the new individuals and replace the best individual in the same position
+    new_population = candidates[streams["sampling"].choice(candidates_size, population.shape[0], replace=False)]
+    new_population[best_index] = best_individual
+
+    return new_population
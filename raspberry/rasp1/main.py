@@ -1,8 +1,6 @@
-import threading
 import os
 import logging
 import sys
-import time
 import argparse
 import dotenv
 import requests
@@ -10,12 +8,18 @@ import requests
 from lib.dht22 import DHT22
 from lib.pump import Pump
 from lib.fixture import LightFixture
+from lib.climate import ClimateController
 from lib.mqtt_client import MqttClient
+from lib.sqlite_writer import close_writers
+from lib.config_store import close_stores
+from lib.runtime import DeviceRuntime
+from lib.hal import set_backend
 
 if __name__ == "__main__":
     # --- Define the command line arguments ---
     parser = argparse.ArgumentParser(description="Run devices connected to the `Raspberry Pi top` gateway")
     parser.add_argument("-d", "--debug", help="Enable debug mode", action="store_true")
+    parser.add_argument("-s", "--simulate", help="Use the simulated hardware (see lib/hal.py)", action="store_true")
 
     args = parser.parse_args()
 
@@ -25,6 +29,10 @@ if __name__ == "__main__":
         level=log_level, format="%(asctime)s [%(levelname)s] %(message)s"
     )
 
+    # --- Define the hardware backend ---
+    if args.simulate:
+        set_backend("simulated")
+
     # --- Define the environment variables ---
     dotenv.load_dotenv("/home/lab/Desktop/rasp-top/.env")
 
@@ -55,33 +63,28 @@ if __name__ == "__main__":
     light_fixture_2 = LightFixture(mqtt_client, LIGHT_FIXTURE_KEY, LIGHT_FIXTURE_ID_2)
 
 
-    # --- Define and start the threads ---
-    threads = []
-
-    threads.append(
-        threading.Thread(target=dht22_sensor_1.run, daemon=True)
-    )
-    threads.append(
-        threading.Thread(target=pump_actuator_1.run, daemon=True)
-    )
-    threads.append(
-        threading.Thread(target=light_fixture_1.run, daemon=True)
-    )
-
-    threads.append(
-        threading.Thread(target=light_fixture_2.run, daemon=True)
-    )
-
+    # Local climate control, optional: drives the outputs from the DHT22 samples (see lib/climate.py)
+    CLIMATE_CONTROL_KEY = os.environ.get("CLIMATE_CONTROL_KEY", "climate_key")
+    CLIMATE_CONTROL_ID = os.environ.get("CLIMATE_CONTROL_ID")
+    if CLIMATE_CONTROL_ID:
+        climate_control = ClimateController(mqtt_client, CLIMATE_CONTROL_KEY, CLIMATE_CONTROL_ID, dht22_sensor_1, [pump_actuator_1])
 
-    # Start all threads
-    for thread in threads:
-        thread.start()
+    # --- Run the devices as coroutines of a single event loop ---
+    runtime = DeviceRuntime()
+    runtime.add(dht22_sensor_1)
+    runtime.add(pump_actuator_1)
+    runtime.add(light_fixture_1)
+    runtime.add(light_fixture_2)
+    if CLIMATE_CONTROL_ID:
+        runtime.add(climate_control)
 
-    # --- Keep the main thread running ---
+    # --- Run until Ctrl+C ---
     try:
-        while True:
-            time.sleep(1)
+        runtime.run()
     except KeyboardInterrupt:
         logging.info("Ctrl+C pressed")
-        logging.info("Exiting...")
-        sys.exit(0)
\ No newline at end of file
+    logging.info("Exiting...")
+    mqtt_client.disconnect()
+    close_writers()  # Commit the rows waiting in the SQLite writers
+    close_stores()  # Write the settings waiting in the config stores
+    sys.exit(0)
@@ -0,0 +1,344 @@
+"""
+Author: Rafael Gomes Alves
+Description: This script uses an object oriented programming to define the local climate control of the gateway.
+The controller closes the loop on the gateway, instead of waiting for the readings to go through
+the broker, the IoT Agent and Orion: it listens to the samples of a DHT22 in the same process,
+and drives the outputs of the gateway (Ex. a Cold fixture or a pump) at each sample. The controller should be able to:
+- Compare the temperature ("t") or the humidity ("rh") with a setpoint, to cool (on above the
+  setpoint) or to heat (on below it), with one of the modes:
+    - hysteresis: on above the setpoint plus half the band, off below the setpoint minus half the band
+    - pid: a PID computes a duty between 0 and 1, and the outputs are on for that fraction of the
+      sample period (time proportioning), with the integral limited to avoid the windup
+    - off: the outputs follow their own schedule again
+- Respect the limits of the process:
+    - The setpoint is kept between minSetpoint and maxSetpoint
+    - An output stays on for minOnTime seconds, and off for minOffTime seconds, at least
+    - Without a recent sample (a stale sample, or none for staleTimeout seconds) the outputs are turned off
+- Log every control decision, save it to the SQLite database and send it to the MQTT broker in
+  the topic /json/<api_key>/<device_id>/attrs
+- Receive its settings from the MQTT broker in the topic /<api_key>/<device_id>/cmd
+The controller is optional, it runs when CLIMATE_CONTROL_ID is defined (see main.py).
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from lib.config_store import get_store
+from lib.report import ChangeReporter
+from lib.sqlite_writer import get_writer
+
+MODES = ("off", "hysteresis", "pid")
+
+
+def parse_number(value):
+    """Convert the value of a command to a finite number. Ex. "24.5" -> 24.5"""
+    if isinstance(value, bool):
+        raise TypeError("expected a number")
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError("expected a finite number")
+    return number
+
+
+def parse_gains(value):
+    """Convert the value of setPid to the (kp, ki, kd) gains. Ex. [0.5, 0.01, 0] or "0.5,0.01,0" -> (0.5, 0.01, 0.0)"""
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)) or len(value) != 3:
+        raise ValueError("expected the 3 gains kp, ki and kd")
+    gains = tuple(parse_number(gain) for gain in value)
+    if any(gain < 0 for gain in gains):
+        raise ValueError("the gains must not be negative")
+    return gains
+
+
+class ClimateController():
+    def __init__(self, mqtt_client, sensor_key, sensor_id, sensor, outputs):
+        # --- Set environement file ---
+        self.config = get_store(os.environ.get("DOTENV_FILE", "/home/lab/Desktop/rasp-top/.env"))  # Settings saved by command (see config_store.py)
+
+        # --- Controller Attributes as defined in the IoT Agent JSON ---
+        self.sensor_key = sensor_key  # API Key from IoT Agent JSON
+        self.sensor_id = sensor_id  # Device ID from IoT Agent JSON
+        self.sensor = sensor  # DHT22 whose samples are controlled
+        self.outputs = outputs  # Devices driven by the controller, Ex. [Cold] or [Pump]
+
+        # Settings of the controller
+        self.mode = os.environ.get(f"{self.sensor_id}_mode", "hysteresis")
+        self.variable = os.environ.get(f"{self.sensor_id}_variable", "t")  # "t" or "rh"
+        self.action = os.environ.get(f"{self.sensor_id}_action", "cool")  # "cool" or "heat"
+        self.minSetpoint = float(os.environ.get(f"{self.sensor_id}_minSetpoint", "5"))
+        self.maxSetpoint = float(os.environ.get(f"{self.sensor_id}_maxSetpoint", "40"))
+        self.setpoint = self.limit(float(os.environ.get(f"{self.sensor_id}_setpoint", "24")))
+        self.hysteresis = float(os.environ.get(f"{self.sensor_id}_hysteresis", "1"))
+        self.kp = float(os.environ.get(f"{self.sensor_id}_kp", "0.5"))
+        self.ki = float(os.environ.get(f"{self.sensor_id}_ki", "0.01"))
+        self.kd = float(os.environ.get(f"{self.sensor_id}_kd", "0"))
+        self.minOnTime = float(os.environ.get(f"{self.sensor_id}_minOnTime", "0"))
+        self.minOffTime = float(os.environ.get(f"{self.sensor_id}_minOffTime", "0"))
+        self.staleTimeout = float(os.environ.get(f"{self.sensor_id}_staleTimeout", str(3 * sensor.collectInterval)))
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown control mode '{self.mode}', expected one of {MODES}")
+
+        # State of the controller
+        self.output = None  # None while the outputs follow their schedule
+        self.duty = None
+        self.reason = "started"
+        self.lastSwitch = None  # Monotonic time of the last change of the outputs
+        self.lastSample = None  # Monotonic time of the last sample received
+        self.pulseEnd = None  # End of the on time of the PID, on the monotonic clock
+        self.holdUntil = None  # End of the minimum on or off time delaying a change
+        self.integral = 0.0
+        self.lastError = None
+        self.sampled = False  # A new sample was received
+        self.changed = False  # A setting changed, the decision is computed again with the last sample
+
+        # Samples of the sensor, received in the same process
+        self.sensor.add_listener(self.on_sample)
+        # The outputs are off until the first sample, instead of following their schedule
+        if self.mode != "off":
+            self.output = False
+            for device in self.outputs:
+                device.set_control(False)
+
+        # --- SQLite writer shared by the devices of the gateway ---
+        self.database = os.environ.get("DATABASE_FILE", "/home/lab/Desktop/rasp-top/data-top.db")
+        self.sqlite_writer = get_writer(self.database)
+        self.sqlite_writer.create_table(self.sensor_id, "value REAL, setpoint REAL, output INTEGER, duty REAL, reason TEXT")
+
+        # MQTT Topics as defined in the IoT Agent JSON
+        self.attrs_topic = f"/json/{self.sensor_key}/{self.sensor_id}/attrs"
+        self.cmd_topic = f"/{self.sensor_key}/{self.sensor_id}/cmd"
+
+        # --- MQTT Client ---
+        self.mqtt_client = mqtt_client
+        # Only the measures that changed are published (see report.py)
+        self.reporter = ChangeReporter(self.mqtt_client, self.sensor_id, self.attrs_topic)
+        # Commands received by MQTT and waiting for the device loop, the latest value of each one
+        self.commands = {}
+        self.commands_lock = threading.Lock()
+        self.runtime = None
+        self.wakeup = None  # Event that wakes the device loop, created on its event loop
+        self.mqtt_client.connect()
+        self.mqtt_client.subscribe(self.cmd_topic)
+        self.mqtt_client.message_callback_add(self.cmd_topic, self.receive_commands)
+
+    # --- Magic Methods ---
+    def __dir__(self):
+        return {
+            "sensor_id": self.sensor_id,
+            "mode": self.mode,
+            "variable": self.variable,
+            "setpoint": self.setpoint,
+            "output": self.output,
+            "duty": self.duty,
+            "reason": self.reason,
+        }
+
+    # --- Sensor listener ---
+    def on_sample(self, sensor):
+        """Called by the DHT22 after each sample, in the event loop."""
+        self.sampled = True
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    # --- MQTT Callbacks ---
+    def receive_commands(self, client, userdata, message):
+        # Called in the MQTT thread: the command is only recorded, and the device loop is woken to apply it
+        payload = json.loads(message.payload.decode())
+        with self.commands_lock:
+            self.commands.update(payload)  # A command waiting for the same attribute is replaced by the newer one
+        if self.runtime is not None:
+            self.runtime.notify(self.wakeup)
+
+    def apply_commands(self):
+        with self.commands_lock:
+            commands, self.commands = self.commands, {}
+        if "setMode" in commands:
+            self.update_mode(commands["setMode"])
+        # The values are checked here, a malformed command is answered with an error instead of stopping the loop
+        if "setSetpoint" in commands:
+            setpoint = self.parse_command("setSetpoint", commands["setSetpoint"], parse_number)
+            if setpoint is not None:
+                self.update_setpoint(setpoint)
+        if "setHysteresis" in commands:
+            hysteresis = self.parse_command("setHysteresis", commands["setHysteresis"], parse_number)
+            if hysteresis is not None:
+                self.update_hysteresis(hysteresis)
+        if "setPid" in commands:
+            gains = self.parse_command("setPid", commands["setPid"], parse_gains)
+            if gains is not None:
+                self.update_pid(gains)
+
+    def parse_command(self, command, value, parse):
+        """Return the value of a command converted by `parse`, or None after answering with an error."""
+        try:
+            return parse(value)
+        except (TypeError, ValueError) as e:
+            logging.error(f"Device: {self.sensor_id} | Command: {command} | Invalid value {value!r} | Error: {e}")
+            self.reporter.acknowledge({f"{command}_info": f"Invalid value {value}: {e}", f"{command}_status": "ERROR"})
+            return None
+
+    def update_mode(self, mode):
+        if mode not in MODES:
+            self.reporter.acknowledge({"setMode_info": f"Unknown mode {mode}, expected one of {MODES}", "setMode_status": "ERROR"})
+            return
+        self.mode = mode
+        self.integral, self.lastError, self.pulseEnd = 0.0, None, None
+        self.changed = True
+        self.config.set(f"{self.sensor_id}_mode", self.mode)
+        self.reporter.acknowledge({"mode": self.mode, "setMode_info": f"Updated to {self.mode}", "setMode_status": "OK"})
+
+    def update_setpoint(self, setpoint):
+        self.setpoint = self.limit(setpoint)
+        self.changed = True
+        self.config.set(f"{self.sensor_id}_setpoint", self.setpoint)
+        info = f"Updated to {self.setpoint}"
+        if self.setpoint != setpoint:
+            info += f", limited to [{self.minSetpoint}, {self.maxSetpoint}]"
+        self.reporter.acknowledge({"sp": self.setpoint, "setSetpoint_info": info, "setSetpoint_status": "OK"})
+
+    def update_hysteresis(self, hysteresis):
+        self.hysteresis = max(0.0, hysteresis)
+        self.changed = True
+        self.config.set(f"{self.sensor_id}_hysteresis", self.hysteresis)
+        self.reporter.acknowledge(
+            {"hy": self.hysteresis, "setHysteresis_info": f"Updated to {self.hysteresis}", "setHysteresis_status": "OK"}
+        )
+
+    def update_pid(self, gains):
+        self.kp, self.ki, self.kd = gains
+        self.integral, self.lastError = 0.0, None
+        self.changed = True
+        self.config.update({f"{self.sensor_id}_kp": self.kp, f"{self.sensor_id}_ki": self.ki, f"{self.sensor_id}_kd": self.kd})
+        self.reporter.acknowledge(
+            {"pid": [self.kp, self.ki, self.kd], "setPid_info": f"Updated to {self.kp},{self.ki},{self.kd}", "setPid_status": "OK"}
+        )
+
+    # --- Utility methods ---
+    def limit(self, setpoint):
+        return min(self.maxSetpoint, max(self.minSetpoint, setpoint))
+
+    def value(self):
+        return self.sensor.temperature if self.variable == "t" else self.sensor.humidity
+
+    def error(self, value):
+        # Positive when the output should be on
+        return value - self.setpoint if self.action == "cool" else self.setpoint - value
+
+    # --- Main controller methods ---
+    def decide(self, now):
+        """
+        Decide the state of the outputs.
+
+        args:
+            now (float): The time on the monotonic clock.
+
+        Returns:
+            tuple: The (output, reason) of the decision. The output is None when the outputs follow their schedule.
+        """
+        if self.mode == "off":
+            return None, "control off"
+
+        sampled, self.sampled = self.sampled, False
+        changed, self.changed = self.changed, False
+        if sampled:
+            self.lastSample = now
+        value = self.value()
+        if value is None or self.sensor.stale or self.lastSample is None or now - self.lastSample >= self.staleTimeout:
+            self.duty = None
+            return False, "no recent sample, outputs off"
+
+        if self.mode == "hysteresis":
+            error = self.error(value)
+            self.duty = None
+            band = f"{self.variable} {value}, error {error:+.2f} for a band of +/- {self.hysteresis / 2}"
+            if error >= self.hysteresis / 2:
+                return True, f"{band}, above the band"
+            if error <= -self.hysteresis / 2:
+                return False, f"{band}, below the band"
+            return bool(self.output), f"{band}, inside the band"
+
+        # PID with time proportioning: on for `duty` of the sample period, computed at each sample
+        period = self.sensor.collectInterval
+        if sampled or changed:
+            error = self.error(value)
+            if sampled:
+                derivative = 0.0 if self.lastError is None else (error - self.lastError) / period
+                self.lastError = error
+                duty = self.kp * error + self.ki * (self.integral + error * period) + self.kd * derivative
+                # The integral only grows while the duty is not saturated, or when it brings it back (anti-windup)
+                if 0 < duty < 1 or (duty >= 1) != (error > 0):
+                    self.integral += error * period
+            else:
+                duty = self.kp * error + self.ki * self.integral
+            self.duty = round(min(1.0, max(0.0, duty)), 3)
+            self.pulseEnd = now + self.duty * period if self.duty < 1 else None  # Always on at full duty
+            return self.duty > 0, f"{self.variable} {value}, setpoint {self.setpoint}, duty {self.duty}"
+        if self.output and self.pulseEnd is not None and now >= self.pulseEnd:
+            return False, f"end of the pulse, duty {self.duty}"
+        return bool(self.output), f"duty {self.duty}"
+
+    def switch(self, output, reason, now):
+        """Change the outputs, unless they did not stay in their state for the minimum time."""
+        self.holdUntil = None
+        if output is not None and self.output is not None and output != self.output and self.lastSwitch is not None:
+            minimum = self.minOnTime if self.output else self.minOffTime
+            if now - self.lastSwitch < minimum:
+                self.holdUntil = self.lastSwitch + minimum
+                self.reason = f"{reason}, held for the minimum {'on' if self.output else 'off'} time of {minimum} seconds"
+                return
+        if output != self.output:
+            self.lastSwitch = now
+            for device in self.outputs:
+                device.set_control(output)
+        self.output = output
+        self.reason = reason
+
+    def log_decision(self):
+        value = self.value()
+        logging.info(
+            f"Device: {self.sensor_id} | Control | {self.variable}: {value} | Setpoint: {self.setpoint} | "
+            f"Output: {self.output} | Duty: {self.duty} | {self.reason}"
+        )
+        try:
+            self.sqlite_writer.insert(
+                self.sensor_id,
+                {"value": value, "setpoint": self.setpoint, "output": self.output, "duty": self.duty, "reason": self.reason},
+            )
+            self.reporter.report(
+                {"mode": self.mode, "sp": self.setpoint, "out": self.output, "duty": self.duty, "timestamp": time.time()}
+            )
+        except Exception as e:
+            logging.error(f"Device: {self.sensor_id} | Log decision | Error: {e}")
+
+    def next_check(self, now):
+        """Monotonic time of the next decision without a sample: end of a pulse, of a minimum time, or the stale timeout."""
+        times = []
+        if self.lastSample is not None and self.lastSample + self.staleTimeout > now:
+            times.append(self.lastSample + self.staleTimeout)
+        if self.output and self.pulseEnd is not None and self.pulseEnd > now:
+            times.append(self.pulseEnd)
+        if self.holdUntil is not None:
+            times.append(self.holdUntil)
+        # Without a sample, the decision is logged again every staleTimeout seconds
+        return min(times) if times else now + self.staleTimeout
+
+    # --- Main Loop ---
+    async def run_async(self, runtime):
+        self.wakeup = asyncio.Event()
+        self.runtime = runtime
+        while True:
+            # The commands and the samples received while waiting are applied at once
+            self.wakeup.clear()
+            self.apply_commands()
+            now = time.monotonic()
+            output, reason = self.decide(now)
+            self.switch(output, reason, now)
+            self.log_decision()
+            await runtime.scheduler.sleep_until(self.next_check(now), wake=self.wakeup)
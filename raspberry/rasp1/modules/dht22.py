@@ -8,7 +8,10 @@ The sensor class should be able to:
     - MQTT client id
     - Sensor API key
     - Sensor ID
-- Read the temperature and humidity data from the sensor
+- Read the temperature and humidity data from the sensor, within a deadline:
+    - Each read is retried while the time left before the deadline (readDeadline seconds) allows
+    - The published value is the median of the last good reads (filterSize), to remove outliers
+    - If no read succeeded before the deadline, the last good value is published marked as stale
 - Save this data to a SQLite database with the following schema:
     - id: integer, primary key, autoincrement
     - temperature: real
@@ -20,22 +23,25 @@ The sensor class should be able to:
 """
 
 import random
+import asyncio
+import collections
 import json
 import time
-import sqlite3
 import logging
 import os
-import dotenv
-import Adafruit_DHT
-import RPi.GPIO as GPIO
+import statistics
 
 from lib.mqtt_client import MqttClient
+from lib.config_store import get_store
+from lib.hal import get_dht22, get_gpio
+from lib.report import ChangeReporter
+from lib.sqlite_writer import get_writer
 
 
 class DHT22():
     def __init__(self, mqtt_client, sensor_key, sensor_id):
         # --- Set environement file --- 
-        self.dotenv_file = "/home/lab/Desktop/rasp-top/.env"
+        self.config = get_store(os.environ.get("DOTENV_FILE", "/home/lab/Desktop/rasp-top/.env"))  # Settings saved by command (see config_store.py)
         
         # --- Sensor Attributes as defined in the IoT Agent JSON ---
         self.sensor_key = sensor_key  # API Key from IoT Agent JSON
@@ -47,20 +53,38 @@ class DHT22():
         )
         self.temperature = None  # Temperature data
         self.humidity = None  # Humidity data
+        self.stale = False  # True when the last sample missed its deadline
+        self.sampleTime = None  # Time of the last good read
+
+        # Sampling: deadline of each sample, delay between two reads, and reads kept for the median
+        self.readDeadline = float(os.environ.get(f"{self.sensor_id}_readDeadline", "4"))
+        self.retryDelay = float(os.environ.get(f"{self.sensor_id}_retryDelay", "2"))
+        self.readings = collections.deque(maxlen=int(os.environ.get(f"{self.sensor_id}_filterSize", "5")))
+        self.pending_read = None  # Read still running after its deadline
+        self.misses = 0
+        self.listeners = []  # Called with the sensor after each sample, Ex. the local climate control (see climate.py)
 
         # MQTT Topics as defined in the IoT Agent JSON
         self.attrs_topic = f"/json/{self.sensor_key}/{self.sensor_id}/attrs"
         self.cmd_topic = f"/{self.sensor_key}/{self.sensor_id}/cmd"
 
-        # Sensor attributes need for the Adafruit_DHT library
-        self.sensor = Adafruit_DHT.DHT22
+        # Sensor attributes need for the Adafruit_DHT library (or the simulated sensor, see hal.py)
         self.pin = int(os.environ.get(f"{self.sensor_id}_PIN", "4"))
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.pin, GPIO.IN)
+        self.sensor = get_dht22(self.pin)
+        self.gpio = get_gpio()
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(self.pin, self.gpio.IN)
+
+        # --- SQLite writer shared by the devices of the gateway ---
+        self.database = os.environ.get("DATABASE_FILE", "/home/lab/Desktop/rasp-top/data-top.db")
+        self.sqlite_writer = get_writer(self.database)
+        self.sqlite_writer.create_table(self.sensor_id, "temperature REAL, humidity REAL")
 
         # --- MQTT Client Inheritence ---
         # super().__init__()
         self.mqtt_client = mqtt_client
+        # Only the measures that changed are published (see report.py)
+        self.reporter = ChangeReporter(self.mqtt_client, self.sensor_id, self.attrs_topic, {"t": 0.2, "rh": 1.0})
         self.mqtt_client.connect()
         self.mqtt_client.subscribe(self.cmd_topic)
         self.mqtt_client.message_callback_add(self.cmd_topic, self.receive_commands)
@@ -71,6 +95,7 @@ class DHT22():
             "timestamp": time.time(),
             "temperature": self.temperature,
             "humidity": self.humidity,
+            "stale": self.stale,
             "collectInterval": self.collectInterval,
         }
 
@@ -84,49 +109,68 @@ class DHT22():
 
     def update_collect_interval(self, collectInterval):
         self.collectInterval = collectInterval
-        dotenv.set_key(
-            self.dotenv_file, f"{self.sensor_id}_collectInterval", str(self.collectInterval)
-        )
+        self.config.set(f"{self.sensor_id}_collectInterval", self.collectInterval)
         # Send the response to the MQTT Broker
         data = {
             "ci": self.collectInterval,
             "setCollectInterval_info": f"Updated to {self.collectInterval} seconds",
             "setCollectInterval_status": "OK",
         }
-        payload = json.dumps(data)
-        self.mqtt_client.publish(self.attrs_topic, payload)
+        self.reporter.acknowledge(data)
 
     # --- Main sensor Methods ---
     def read_data(self):
+        """Read the sensor once, returning (None, None) if the read failed."""
         logging.debug(f"Reading data from {self.sensor_id}")
         try:
-            self.humidity, self.temperature = Adafruit_DHT.read_retry(
-                self.sensor, self.pin
-            )
+            return self.sensor.read()
         except Exception as e:
             logging.error(f"Device: {self.sensor_id} | Read data | Error: {e}")
+            return None, None
+
+    def update_readings(self, humidity, temperature):
+        """Add a read to the ring buffer, if it is valid, and update the median values."""
+        if humidity is None or temperature is None or not (0 <= humidity <= 100 and -40 <= temperature <= 80):
+            return False
+        self.readings.append((humidity, temperature))
+        self.humidity = round(statistics.median(reading[0] for reading in self.readings), 2)
+        self.temperature = round(statistics.median(reading[1] for reading in self.readings), 2)
+        self.sampleTime = time.time()
+        return True
+
+    async def sample(self, runtime):
+        """Read the sensor until a good read or the deadline, retrying while the time left allows it."""
+        deadline = time.monotonic() + self.readDeadline
+        # A read that finished after the deadline of the previous sample is too old
+        if self.pending_read is not None and self.pending_read.done():
+            self.pending_read = None
+
+        while True:
+            if self.pending_read is None:
+                self.pending_read = asyncio.ensure_future(runtime.blocking(self.read_data))
+            try:
+                # The read continues after the deadline, but the sample does not wait for it
+                reading = await asyncio.wait_for(asyncio.shield(self.pending_read), max(0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                break
+            self.pending_read = None
+            if self.update_readings(*reading):
+                self.stale = False
+                return
+            if time.monotonic() + self.retryDelay >= deadline:
+                break
+            await asyncio.sleep(self.retryDelay)
+
+        self.stale = True
+        self.misses += 1
+        logging.warning(f"Device: {self.sensor_id} | Sample | Missed the deadline of {self.readDeadline} seconds | Misses: {self.misses}")
 
     def save_data(self):
         logging.debug(f"Saving data to sqlite {self.sensor_id}")
-        # Create table
         try:
-            conn = sqlite3.connect("/home/lab/Desktop/rasp-top/data-top.db")
-            cur = conn.cursor()
-            table_name = f"`{self.sensor_id}`"
-            cur.execute(
-                f"""CREATE TABLE IF NOT EXISTS {table_name} (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    temperature REAL, 
-                    humidity REAL
-                )"""
-            )
-            cur.execute(
-                f"INSERT INTO {table_name} (temperature, humidity) VALUES (?, ?)",
-                (self.temperature, self.humidity),
-            )
-            conn.commit()
-            conn.close()
+            # Only the new samples are saved, not the stale values
+            if not self.stale:
+                self.sqlite_writer.insert(self.sensor_id, {"temperature": self.temperature, "humidity": self.humidity})
         except Exception as e:
             logging.error(f"Device: {self.sensor_id} | Save to SQL | Error: {e}")
 
@@ -138,18 +182,25 @@ class DHT22():
                     "t": self.temperature,
                     "rh": self.humidity,
                     "ci": self.collectInterval,
-                    "timestamp": time.time(),
+                    "stale": self.stale,
+                    "timestamp": self.sampleTime,
                 }
-                payload = json.dumps(message)
-                self.mqtt_client.publish(self.attrs_topic, payload)
+                self.reporter.report(message)
         except Exception as e:
             logging.error(f"Device: {self.sensor_id} | Send to MQTT | Error: {e}")
 
+    def add_listener(self, callback):
+        """Call a function with the sensor after each sample, in the event loop."""
+        self.listeners.append(callback)
+
     # --- Main Loop ---
-    def run(self):
+    async def run_async(self, runtime):
+        deadline = None
         while True:
-            self.read_data()
+            await self.sample(runtime)
+            for listener in self.listeners:
+                listener(self)
             self.save_data()
             self.send_data()
             logging.info(f"DHT22 object: {self.__dir__()}")
-            time.sleep(self.collectInterval)
\ No newline at end of file
+            deadline = await runtime.scheduler.sleep(self.collectInterval, deadline)
\ No newline at end of file
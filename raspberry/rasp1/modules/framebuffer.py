@@ -0,0 +1,105 @@
+"""
+Author: Rafael Gomes Alves
+Description: This script uses an object oriented programming to define the frame buffer of a LED strip.
+The colors of the strip are kept in a NumPy array of uint32, one packed color per pixel, in the
+format of rpi_ws281x.Color (white << 24 | red << 16 | green << 8 | blue):
+- The strip is divided in named zones, Ex. "right:0-27,left:27-54", each one with its own color
+- show() only sends the pixels that changed since the last frame shown, and does not call
+  strip.show() at all when the frame is unchanged, so the DMA is not refreshed for nothing
+- fade() renders the transition from the frame on the strip to new zone colors, one frame at a
+  time, so the device can show them at a fixed frame rate
+"""
+
+import numpy as np
+
+
+def pack(red, green, blue, white=0):
+    """Pack a color as rpi_ws281x.Color does."""
+    return (int(white) << 24) | (int(red) << 16) | (int(green) << 8) | int(blue)
+
+
+def unpack(pixels):
+    """Split packed colors into an array of (white, red, green, blue) channels."""
+    return np.stack([(pixels >> shift) & 0xFF for shift in (24, 16, 8, 0)], axis=-1).astype(np.int32)
+
+
+def parse_zones(text):
+    """
+    Parse the zones of a strip.
+
+    args:
+        text (str): The zones as name:start-end, separated by commas, with the end excluded. Ex. "right:0-27,left:27-54"
+
+    Returns:
+        dict: The (start, end) of each zone. Ex. {"right": (0, 27), "left": (27, 54)}
+    """
+    zones = {}
+    for zone in text.split(","):
+        name, pixels = zone.strip().split(":")
+        start, end = pixels.split("-")
+        zones[name] = (int(start), int(end))
+    return zones
+
+
+class FrameBuffer:
+    def __init__(self, pixel_count, zones):
+        self.pixel_count = pixel_count
+        self.pixels = np.zeros(pixel_count, dtype=np.uint32)
+        self.shown = None  # Last frame sent to the strip
+        self.zones = {}
+        for name, (start, end) in zones.items():
+            if not 0 <= start < end <= pixel_count:
+                raise ValueError(f"Zone {name} ({start}-{end}) is outside the strip of {pixel_count} pixels")
+            self.zones[name] = slice(start, end)
+
+    def fill(self, zone, color):
+        """Set the (red, green, blue) color of every pixel of a zone."""
+        self.pixels[self.zones[zone]] = pack(*color)
+
+    def show(self, strip):
+        """
+        Send the frame to the strip, if it changed.
+
+        args:
+            strip (Adafruit_NeoPixel): The strip driven by rpi_ws281x.
+
+        Returns:
+            int: The number of pixels sent, 0 if the frame is unchanged.
+        """
+        if self.shown is None:
+            changed = np.arange(self.pixel_count)
+        else:
+            changed = np.flatnonzero(self.pixels != self.shown)
+        if not len(changed):
+            return 0
+
+        for index, color in zip(changed.tolist(), self.pixels[changed].tolist()):
+            strip.setPixelColor(index, color)
+        strip.show()
+        self.shown = self.pixels.copy()
+        return len(changed)
+
+    def fade(self, colors, duration, fps):
+        """
+        Fade from the frame on the strip to new zone colors, setting one frame at each step.
+
+        args:
+            colors (dict): The (red, green, blue) color of each zone. Ex. {"right": (255, 0, 0)}
+            duration (float): The duration of the fade in seconds. Ex. 2
+            fps (float): The frames per second. Ex. 30
+
+        Yields:
+            int: The index of the frame set in the buffer, the last one being the new colors.
+        """
+        start = unpack(self.pixels if self.shown is None else self.shown)
+        for zone, color in colors.items():
+            self.fill(zone, color)
+        target = unpack(self.pixels)
+        if np.array_equal(start, target):
+            return
+
+        frames = max(1, round(duration * fps))
+        for frame in range(1, frames + 1):
+            channels = np.rint(start + (target - start) * (frame / frames)).astype(np.uint32)
+            self.pixels = (channels[:, 0] << 24) | (channels[:, 1] << 16) | (channels[:, 2] << 8) | channels[:, 3]
+            yield frame
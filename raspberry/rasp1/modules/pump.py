@@ -20,22 +20,26 @@ The sensor class should be able to:
 """
 
 import random
+import asyncio
 import json
 import time
-import sqlite3
 import logging
 import os
-import dotenv
-import RPi.GPIO as GPIO
+import threading
 
 # from lib.mqtt_client import MqttClient
+from lib.config_store import get_store
+from lib.schedule import duty_cycle, monotonic_deadline
+from lib.hal import get_gpio
+from lib.report import ChangeReporter
+from lib.sqlite_writer import get_writer
 
 
 class Pump():
     def __init__(self, mqtt_client, sensor_key, sensor_id):
         
         # --- Set environement file --- 
-        self.dotenv_file = "/home/lab/Desktop/rasp-top/.env"
+        self.config = get_store(os.environ.get("DOTENV_FILE", "/home/lab/Desktop/rasp-top/.env"))  # Settings saved by command (see config_store.py)
         
         # --- Sensor Attributes as defined in the IoT Agent JSON ---
         self.sensor_key = sensor_key  # API Key from IoT Agent JSON
@@ -45,6 +49,9 @@ class Pump():
         self.onInterval = int(os.environ.get(f"{self.sensor_id}_onInterval", "5"))
         self.offInterval = int(os.environ.get(f"{self.sensor_id}_offInterval", "10"))
         self.status = os.environ.get(f"{self.sensor_id}_status", "off") 
+        # The duty cycle is compiled into a transition table, and starts at the Unix epoch (see schedule.py)
+        self.schedule = duty_cycle(self.onInterval, self.offInterval)
+        self.control = None  # State set by the local climate control, instead of the duty cycle
 
         # MQTT Topics as defined in the IoT Agent JSON
         self.attrs_topic = f"/json/{self.sensor_key}/{self.sensor_id}/attrs"
@@ -52,12 +59,25 @@ class Pump():
         
         # --- Device attributes need for the GPIO library ---
         self.pin = int(os.environ.get(f"{self.sensor_id}_PIN", "17"))
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.pin, GPIO.OUT)
+        self.gpio = get_gpio()  # RPi.GPIO or the simulated GPIO (see hal.py)
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(self.pin, self.gpio.OUT)
+
+        # --- SQLite writer shared by the devices of the gateway ---
+        self.database = os.environ.get("DATABASE_FILE", "/home/lab/Desktop/rasp-top/data-top.db")
+        self.sqlite_writer = get_writer(self.database)
+        self.sqlite_writer.create_table(self.sensor_id, "status TEXT")
 
         # --- MQTT Client Inheritence ---
         # super().__init__()
         self.mqtt_client = mqtt_client
+        # Only the measures that changed are published (see report.py)
+        self.reporter = ChangeReporter(self.mqtt_client, self.sensor_id, self.attrs_topic)
+        # Commands received by MQTT and waiting for the device loop, the latest value of each one
+        self.commands = {}
+        self.commands_lock = threading.Lock()
+        self.runtime = None
+        self.wakeup = None  # Event that wakes the device loop, created on its event loop
         self.mqtt_client.connect()
         self.mqtt_client.subscribe(self.cmd_topic)
         self.mqtt_client.message_callback_add(self.cmd_topic, self.receive_commands)
@@ -73,71 +93,81 @@ class Pump():
         }
 
     def receive_commands(self, client, userdata, message):
+        # Called in the MQTT thread: the command is only recorded, and the device loop is woken to apply it
         payload = json.loads(message.payload.decode())
         logging.info("Received command: %s", payload)
-
-        if payload.get("setOnInterval"):
-            self.update_on_interval(payload.get("setOnInterval"))
-        elif payload.get("setOffInterval"):
-            self.update_off_interval(payload.get("setOffInterval"))
+        with self.commands_lock:
+            self.commands.update(payload)  # A command waiting for the same attribute is replaced by the newer one
+        if self.runtime is not None:
+            self.runtime.notify(self.wakeup)
+
+    def apply_commands(self):
+        with self.commands_lock:
+            commands, self.commands = self.commands, {}
+        if commands.get("setOnInterval"):
+            self.update_on_interval(commands["setOnInterval"])
+        if commands.get("setOffInterval"):
+            self.update_off_interval(commands["setOffInterval"])
 
     def update_on_interval(self, onInterval):
-        self.onInterval = onInterval
-        dotenv.set_key(self.dotenv_file, f"{self.sensor_id}_onInterval", str(self.onInterval))
-
-        logging.info("Device: {self.sensor_id} | On interval updated to {self.onInterval}")
+        # The schedule is compiled first, so an invalid interval is refused and the current one is kept
+        try:
+            schedule = duty_cycle(onInterval, self.offInterval)
+        except (TypeError, ValueError) as e:
+            logging.error(f"Device: {self.sensor_id} | Invalid On interval {onInterval} | Error: {e}")
+            self.reporter.acknowledge({"setOnInterval_info": f"Invalid on interval {onInterval}: {e}", "setOnInterval_status": "ERROR"})
+            return
+        self.onInterval, self.schedule = onInterval, schedule
+        self.config.set(f"{self.sensor_id}_onInterval", self.onInterval)
+
+        logging.info(f"Device: {self.sensor_id} | On interval updated to {self.onInterval}")
         data = {
             "on": self.onInterval,
             "setOnInterval_info": f"Updated to {self.onInterval} seconds",
             "setOnInterval_status": "OK",
         }
-        payload = json.dumps(data)
-        self.mqtt_client.publish(self.attrs_topic, payload)
+        self.reporter.acknowledge(data)
 
     def update_off_interval(self, offInterval):
+        try:
+            schedule = duty_cycle(self.onInterval, offInterval)
+        except (TypeError, ValueError) as e:
+            logging.error(f"Device: {self.sensor_id} | Invalid Off interval {offInterval} | Error: {e}")
+            self.reporter.acknowledge({"setOffInterval_info": f"Invalid off interval {offInterval}: {e}", "setOffInterval_status": "ERROR"})
+            return
+        self.offInterval, self.schedule = offInterval, schedule
         logging.debug(
-            f"Device: {self.sensor_id} | On interval updated to {self.offInterval}"
+            f"Device: {self.sensor_id} | Off interval updated to {self.offInterval}"
         )
-        self.offInterval = offInterval
-        dotenv.set_key(self.dotenv_file, f"{self.sensor_id}_offInterval", str(self.offInterval))
+        self.config.set(f"{self.sensor_id}_offInterval", self.offInterval)
 
         data = {
             "off": self.offInterval,
             "setOffInterval_info": f"Updated to {self.offInterval} seconds",
             "setOffInterval_status": "OK",
         }
-        payload = json.dumps(data)
-        self.mqtt_client.publish(self.attrs_topic, payload)
+        self.reporter.acknowledge(data)
+
+    def set_control(self, on):
+        """Drive the device from the local climate control (see climate.py), None gives it back to its schedule."""
+        self.control = on
+        if self.wakeup is not None:
+            self.wakeup.set()
 
     # --- Main device methods
     def actuate(self):
         logging.debug(f"Actuating {self.sensor_id}")
         if self.status == "on":
             # Turn the pump on
-            GPIO.output(self.pin, GPIO.HIGH)
+            self.gpio.output(self.pin, self.gpio.HIGH)
         elif self.status == "off":
             # Turn the pump off
-            GPIO.output(self.pin, GPIO.LOW)
+            self.gpio.output(self.pin, self.gpio.LOW)
 
     def save_data(self):
         logging.debug(f"Saving data to sqlite {self.sensor_id}")
-        # Create table
         try:
-            conn = sqlite3.connect("/home/lab/Desktop/rasp-top/data-top.db")
-            cur = conn.cursor()
-            table_name = f"`{self.sensor_id}`"
-            cur.execute(
-                f"""CREATE TABLE IF NOT EXISTS {table_name} (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    status TEXT
-                )"""
-            )
-            cur.execute(
-                f"INSERT INTO {table_name} (status) VALUES (?)", (self.status,)
-                )
-            conn.commit()
-            conn.close()
+            self.sqlite_writer.insert(self.sensor_id, {"status": self.status})
         except Exception as e:
             logging.error(f"Device: {self.sensor_id} | Save to SQL | Error: {e}")
 
@@ -150,21 +180,24 @@ class Pump():
                 "off": self.offInterval,
                 "timestamp": time.time()
             }
-            payload = json.dumps(message)
-            self.mqtt_client.publish(self.attrs_topic, payload)
+            self.reporter.report(message)
         except Exception as e:
             logging.error(f"Device: {self.sensor_id} | Send to MQTT | Error: {e}")
 
     # --- Main Loop ---
-    def run(self):
+    async def run_async(self, runtime):
+        self.wakeup = asyncio.Event()
+        self.runtime = runtime
         while True:
+            # The commands received while waiting are applied before actuating
+            self.wakeup.clear()
+            self.apply_commands()
+            on = self.schedule.state_at() if self.control is None else self.control
+            self.status = "on" if on else "off"
             logging.info(f"Pump object: {self.__dir__()}")
             self.actuate()
             self.save_data()
             self.send_data()
-            if self.status == "on":
-                time.sleep(self.onInterval)
-                self.status = "off"
-            elif self.status == "off":
-                time.sleep(self.offInterval)
-                self.status = "on"
\ No newline at end of file
+            # The pump only wakes up at the transitions of its duty cycle, or for a command or the climate control
+            transition, _ = self.schedule.next_transition()
+            await runtime.scheduler.sleep_until(monotonic_deadline(transition), wake=self.wakeup)
@@ -0,0 +1,82 @@
+"""
+Author: Rafael Gomes Alves
+Description: This script uses an object oriented programming to define the report-by-exception of a device.
+The devices do not send the same values on every loop: the reporter keeps the last value sent
+for each attribute and only publishes the attributes that changed:
+- A number changed when it moved at least its deadband away from the last value sent,
+  Ex. 0.2 for the temperature of a DHT22. The default deadband is 0, any change is sent
+- Any other value (Ex. a status) changed when it is different from the last value sent
+- Every attribute is sent again when the heartbeat expires, so the platform knows the
+  device is alive and a lost message is corrected. Default is every 300 seconds
+- The acknowledgement of a command is always published at once, and its values are
+  recorded as sent
+The deadband of an attribute can be set with the `<sensor_id>_<attribute>_deadband`
+environment variable, and the heartbeat with `<sensor_id>_heartbeat`.
+"""
+
+import json
+import logging
+import os
+import time
+
+# Attributes sent with the changed values, but never compared
+UNCOMPARED = ("timestamp",)
+
+
+class ChangeReporter:
+    def __init__(self, mqtt_client, sensor_id, topic, deadbands=None):
+        self.mqtt_client = mqtt_client
+        self.sensor_id = sensor_id
+        self.topic = topic
+        self.deadbands = {
+            attribute: float(os.environ.get(f"{sensor_id}_{attribute}_deadband", deadband))
+            for attribute, deadband in (deadbands or {}).items()
+        }
+        self.heartbeat = float(os.environ.get(f"{sensor_id}_heartbeat", "300"))
+        self.sent = {}  # Last value sent for each attribute
+        self.last_heartbeat = None
+        self.skipped = 0
+
+    def changed(self, attribute, value):
+        if attribute not in self.sent:
+            return True
+        last = self.sent[attribute]
+        if isinstance(value, (int, float)) and isinstance(last, (int, float)) and not isinstance(value, bool):
+            # Tolerance for the rounding of the values, Ex. 24.2 - 24.0 < 0.2
+            return abs(value - last) >= self.deadbands.get(attribute, 0) - 1e-9 and value != last
+        return value != last
+
+    def report(self, measures):
+        """
+        Queue the measures that changed, or every measure when the heartbeat expired.
+
+        args:
+            measures (dict): The measures of the device. Ex. {"t": 24.1, "rh": 55.0, "timestamp": 1700000000.0}
+
+        Returns:
+            dict: The measures queued, empty if nothing changed.
+        """
+        now = time.monotonic()
+        if self.last_heartbeat is None or now - self.last_heartbeat >= self.heartbeat:
+            self.last_heartbeat = now
+            changes = dict(measures)
+        else:
+            changes = {
+                attribute: value
+                for attribute, value in measures.items()
+                if attribute not in UNCOMPARED and self.changed(attribute, value)
+            }
+            if not changes:
+                self.skipped += 1
+                logging.debug(f"Device: {self.sensor_id} | Report | No change")
+                return changes
+            changes.update({attribute: measures[attribute] for attribute in UNCOMPARED if attribute in measures})
+
+        self.sent.update(changes)
+        self.mqtt_client.publish_measures(self.topic, changes)
+        return changes
+
+    def acknowledge(self, message):
+        """Publish the acknowledgement of a command at once."""
+        self.sent.update(message)
+        self.mqtt_client.publish(self.topic, json.dumps(message))
@@ -20,23 +20,44 @@ The sensor class should be able to:
 """
 
 import random
+import asyncio
 import json
 import time
-import sqlite3
 import logging
 import os
-import datetime
-import dotenv
+import threading
 
 from lib.mqtt_client import MqttClient
+from lib.framebuffer import FrameBuffer, parse_zones
+from lib.config_store import get_store
+from lib.schedule import monotonic_deadline, parse_recipe, photoperiod
+from lib.hal import get_strip
+from lib.report import ChangeReporter
+from lib.sqlite_writer import get_writer
 
-from rpi_ws281x import Adafruit_NeoPixel, Color, ws
+
+def parse_color(value):
+    """Convert the value of a color command to its (red, green, blue) levels. Ex. [211, 169, 243] or "211,169,243" -> (211, 169, 243)"""
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)) or len(value) != 3:
+        raise ValueError("expected the 3 levels red, green and blue")
+    levels = []
+    for level in value:
+        # A level above 255 would overflow into the next channel of the frame buffer
+        if isinstance(level, bool) or not isinstance(level, (int, str)):
+            raise TypeError("expected integer levels")
+        level = int(level)
+        if not 0 <= level <= 255:
+            raise ValueError("expected levels between 0 and 255")
+        levels.append(level)
+    return tuple(levels)
 
 
 class LightFixture():
     def __init__(self, mqtt_client, sensor_key, sensor_id):
         # --- Set environement file --- 
-        self.dotenv_file = "/home/lab/Desktop/rasp-top/.env"
+        self.config = get_store(os.environ.get("DOTENV_FILE", "/home/lab/Desktop/rasp-top/.env"))  # Settings saved by command (see config_store.py)
         
         # --- Sensor Attributes ---
         self.sensor_key = sensor_key  # API Key from IoT Agent JSON
@@ -58,8 +79,11 @@ class LightFixture():
         self.currentLeftGreen = 0
         self.currentLeftBlue = 0
         self.collectInterval = int(os.environ.get(f"{self.sensor_id}_collectInterval", "60"))
+        # Daily recipe with several segments, Ex. "06:00=on,12:00=off,13:00=on,18:00=off", instead of startTime and endTime
+        self.recipe = os.environ.get(f"{self.sensor_id}_recipe")
+        self.schedule = self.compile_schedule()
         
-        # Sensor attributes need for the rpi_ws281x library
+        # Sensor attributes need for the rpi_ws281x library (or the simulated strip, see hal.py)
         
         self.pixelCount = int(os.environ.get(f"{self.sensor_id}_LED_COUNT", "54"))
         self.pin = int(os.environ.get(f"{self.sensor_id}_LED_PIN", "18"))
@@ -68,9 +92,9 @@ class LightFixture():
         self.invert = False
         self.brightness = int(os.environ.get(f"{self.sensor_id}_LED_BRIGHTNESS", "255"))
         self.channel = int(os.environ.get(f"{self.sensor_id}_LED_CHANNEL", "0"))
-        self.strip_type = ws.WS2811_STRIP_GRB
+        self.strip_type = "GRB"
         
-        self.strip = Adafruit_NeoPixel(
+        self.strip = get_strip(
             self.pixelCount,
             self.pin,
             self.frequency,
@@ -82,18 +106,36 @@ class LightFixture():
         )
         self.strip.begin()
         
-        self.right_start = 0
-        self.right_end = 27
-        self.left_start = 27
-        self.left_end = 55
+        # Zones of the strip, Ex. "right:0-27,left:27-54", the right side is the first half by default
+        half = self.pixelCount // 2
+        self.zones = os.environ.get(f"{self.sensor_id}_ZONES", f"right:0-{half},left:{half}-{self.pixelCount}")
+        self.frame = FrameBuffer(self.pixelCount, parse_zones(self.zones))
+        self.fadeDuration = float(os.environ.get(f"{self.sensor_id}_fadeDuration", "0"))  # 0 changes the colors at once
+        self.fps = int(os.environ.get(f"{self.sensor_id}_FPS", "30"))
     
         # MQTT Topics as defined in the IoT Agent JSON
         self.attrs_topic = f"/json/{self.sensor_key}/{self.sensor_id}/attrs"
         self.cmd_topic = f"/{self.sensor_key}/{self.sensor_id}/cmd"
 
+        # --- SQLite writer shared by the devices of the gateway ---
+        self.database = os.environ.get("DATABASE_FILE", "/home/lab/Desktop/rasp-top/data-top.db")
+        self.sqlite_writer = get_writer(self.database)
+        self.sqlite_writer.create_table(
+            self.sensor_id,
+            "currentRightRed INTEGER, currentRightGreen INTEGER, currentRightBlue INTEGER, "
+            "currentLeftRed INTEGER, currentLeftGreen INTEGER, currentLeftBlue INTEGER",
+        )
+
         # --- MQTT Client Inheritence ---
         # super().__init__()
         self.mqtt_client = mqtt_client
+        # Only the measures that changed are published (see report.py)
+        self.reporter = ChangeReporter(self.mqtt_client, self.sensor_id, self.attrs_topic)
+        # Commands received by MQTT and waiting for the device loop, the latest value of each one
+        self.commands = {}
+        self.commands_lock = threading.Lock()
+        self.runtime = None
+        self.wakeup = None  # Event that wakes the device loop, created on its event loop
         self.mqtt_client.connect()
         self.mqtt_client.subscribe(self.cmd_topic)
         self.mqtt_client.message_callback_add(self.cmd_topic, self.receive_commands)
@@ -112,23 +154,49 @@ class LightFixture():
 
     # --- MQTT Callbacks ---
     def receive_commands(self, client, userdata, message):
+        # Called in the MQTT thread: the command is only recorded, and the device loop is woken to apply it
         payload = json.loads(message.payload.decode())
+        with self.commands_lock:
+            self.commands.update(payload)  # A command waiting for the same attribute is replaced by the newer one
+        if self.runtime is not None:
+            self.runtime.notify(self.wakeup)
 
-        if payload.get("setRightColor"):
-            self.update_right_color(payload.get("setRightColor"))
-        elif payload.get("setLeftColor"):
-            self.update_left_color(payload.get("setLeftColor"))
-        elif payload.get("setCollectInterval"):
-            self.update_collect_interval(payload.get("setCollectInterval"))
+    def apply_commands(self):
+        with self.commands_lock:
+            commands, self.commands = self.commands, {}
+        # The colors are checked here, a malformed command is answered with an error instead of stopping the loop
+        if commands.get("setRightColor"):
+            rightColor = self.parse_command("setRightColor", commands["setRightColor"], parse_color)
+            if rightColor is not None:
+                self.update_right_color(rightColor)
+        if commands.get("setLeftColor"):
+            leftColor = self.parse_command("setLeftColor", commands["setLeftColor"], parse_color)
+            if leftColor is not None:
+                self.update_left_color(leftColor)
+        if commands.get("setCollectInterval"):
+            self.update_collect_interval(commands["setCollectInterval"])
+
+    def parse_command(self, command, value, parse):
+        """Return the value of a command converted by `parse`, or None after answering with an error."""
+        try:
+            return parse(value)
+        except (TypeError, ValueError) as e:
+            logging.error(f"Device: {self.sensor_id} | Command: {command} | Invalid value {value!r} | Error: {e}")
+            self.reporter.acknowledge({f"{command}_info": f"Invalid value {value}: {e}", f"{command}_status": "ERROR"})
+            return None
 
     def update_right_color(self, rightColor):
         logging.info(f"Updating {self.sensor_id} Right Color | Color: {rightColor}")
         self.setRightRed = rightColor[0]
         self.setRightGreen = rightColor[1]
         self.setRightBlue = rightColor[2]
-        dotenv.set_key(self.dotenv_file, f"{self.sensor_id}_setRightRed", str(self.setRightRed))
-        dotenv.set_key(self.dotenv_file, f"{self.sensor_id}_setRightGreen", str(self.setRightGreen))
-        dotenv.set_key(self.dotenv_file, f"{self.sensor_id}_setRightBlue", str(self.setRightBlue))
+        self.config.update(
+            {
+                f"{self.sensor_id}_setRightRed": self.setRightRed,
+                f"{self.sensor_id}_setRightGreen": self.setRightGreen,
+                f"{self.sensor_id}_setRightBlue": self.setRightBlue,
+            }
+        )
 
         message = {
             "sr-red": self.setRightRed,
@@ -138,16 +206,20 @@ class LightFixture():
             "setRightColor_status": "OK",
         }
         logging.debug(message)
-        self.mqtt_client.publish(self.attrs_topic, json.dumps(message))
+        self.reporter.acknowledge(message)
 
     def update_left_color(self, leftColor):
         logging.info(f"Updating {self.sensor_id} Left Color | Color: {leftColor}")
         self.setLeftRed = leftColor[0]
         self.setLeftGreen = leftColor[1]
         self.setLeftBlue = leftColor[2]
-        dotenv.set_key(self.dotenv_file, f"{self.sensor_id}_setLeftRed", str(self.setLeftRed))
-        dotenv.set_key(self.dotenv_file, f"{self.sensor_id}_setLeftGreen", str(self.setLeftGreen))
-        dotenv.set_key(self.dotenv_file, f"{self.sensor_id}_setLeftBlue", str(self.setLeftBlue))
+        self.config.update(
+            {
+                f"{self.sensor_id}_setLeftRed": self.setLeftRed,
+                f"{self.sensor_id}_setLeftGreen": self.setLeftGreen,
+                f"{self.sensor_id}_setLeftBlue": self.setLeftBlue,
+            }
+        )
 
         message = {
             "sl-red": self.setLeftRed,
@@ -157,12 +229,12 @@ class LightFixture():
             "setLeftColor_status": "OK",
         }
         logging.info(message)
-        self.mqtt_client.publish(self.attrs_topic, json.dumps(message))
+        self.reporter.acknowledge(message)
         
     def update_collect_interval(self, collectInterval):
         logging.info(f"Updating {self.sensor_id} Collect Interval | Collect Interval: {collectInterval}")
         self.collectInterval = collectInterval
-        dotenv.set_key(self.dotenv_file, f"{self.sensor_id}_collectInterval", str(self.collectInterval))
+        self.config.set(f"{self.sensor_id}_collectInterval", self.collectInterval)
 
         message = {
             "collectInterval": self.collectInterval,
@@ -170,18 +242,17 @@ class LightFixture():
             "collectInterval_status": "OK",
         }
         logging.info(message)
-        self.mqtt_client.publish(self.attrs_topic, json.dumps(message))
+        self.reporter.acknowledge(message)
 
     # --- Utility functions ---
+    def compile_schedule(self):
+        """Compile the photoperiod, or the daily recipe if defined, into a transition table (see schedule.py)."""
+        if self.recipe:
+            return parse_recipe(self.recipe)
+        return photoperiod(self.startTime, self.endTime)
+
     def is_between(self):
-        start_time = datetime.datetime.strptime(self.startTime, "%H:%M:%S").time()
-        end_time = datetime.datetime.strptime(self.endTime, "%H:%M:%S").time()
-        now = datetime.datetime.now().time()
-        logging.debug(f"{start_time},{end_time},{now}")
-        if start_time < end_time:
-            return start_time <= now <= end_time
-        else:
-            return start_time <= now or now <= end_time
+        return self.schedule.state_at()
 
     def update_current_color(self):
         if self.is_between():
@@ -199,61 +270,43 @@ class LightFixture():
             self.currentLeftGreen = 0
             self.currentLeftBlue = 0
 
+    def zone_colors(self):
+        return {
+            "right": (self.currentRightRed, self.currentRightGreen, self.currentRightBlue),
+            "left": (self.currentLeftRed, self.currentLeftGreen, self.currentLeftBlue),
+        }
+
     # --- Main device functions ---
     def actuate(self):
         logging.debug(f"Actuating {self.sensor_id}")
-        
-        for i in range(self.right_start, self.right_end):
-            self.strip.setPixelColor(i, Color(self.currentRightRed, self.currentRightGreen, self.currentRightBlue))
-        for i in range(self.left_start, self.left_end):
-            self.strip.setPixelColor(i, Color(self.currentLeftRed, self.currentLeftGreen, self.currentLeftBlue))
-            
-        self.strip.show()
+        for zone, color in self.zone_colors().items():
+            self.frame.fill(zone, color)
+        if not self.frame.show(self.strip):
+            logging.debug(f"Device: {self.sensor_id} | Strip unchanged")
 
-        message = {
-            "cr-red": self.currentRightRed,
-            "cr-green": self.currentRightGreen,
-            "cr-blue": self.currentRightBlue,
-            "cl-red": self.currentLeftRed,
-            "cl-green": self.currentLeftGreen,
-            "cl-blue": self.currentLeftBlue,
-        }
-        self.mqtt_client.publish(self.attrs_topic, json.dumps(message))
+    async def fade(self, runtime):
+        """Fade the strip to the current colors in fadeDuration seconds, at a fixed frame rate."""
+        deadline = None
+        for _ in self.frame.fade(self.zone_colors(), self.fadeDuration, self.fps):
+            await runtime.blocking(self.frame.show, self.strip)
+            if self.wakeup.is_set():
+                return  # A new command stops the fade, the next one starts from the colors shown
+            deadline = await runtime.scheduler.sleep(1 / self.fps, deadline, align=False)
 
     def save_data(self):
         logging.debug(f"Saving data to sqlite {self.sensor_id}")
-        # Create table
         try:
-            conn = sqlite3.connect("/home/lab/Desktop/rasp-top/data-top.db")
-            cur = conn.cursor()
-            table_name = f"`{self.sensor_id}`"
-            cur.execute(
-                f"""
-                CREATE TABLE IF NOT EXISTS {table_name} (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    currentRightRed INTEGER,
-                    currentRightGreen INTEGER,
-                    currentRightBlue INTEGER,
-                    currentLeftRed INTEGER,
-                    currentLeftGreen INTEGER,
-                    currentLeftBlue INTEGER
-                )
-                """
-            )
-            cur.execute(
-                f"INSERT INTO {table_name} (currentRightRed,currentRightGreen,currentRightBlue,currentLeftRed,currentLeftGreen,currentLeftBlue) VALUES (?,?,?,?,?,?)",
-                (
-                    self.currentRightRed,
-                    self.currentRightGreen,
-                    self.currentRightBlue,
-                    self.currentLeftRed,
-                    self.currentLeftGreen,
-                    self.currentLeftBlue,
-                ),
+            self.sqlite_writer.insert(
+                self.sensor_id,
+                {
+                    "currentRightRed": self.currentRightRed,
+                    "currentRightGreen": self.currentRightGreen,
+                    "currentRightBlue": self.currentRightBlue,
+                    "currentLeftRed": self.currentLeftRed,
+                    "currentLeftGreen": self.currentLeftGreen,
+                    "currentLeftBlue": self.currentLeftBlue,
+                },
             )
-            conn.commit()
-            conn.close()
         except Exception as e:
             logging.error(f"Device: {self.sensor_id} | Save to SQL | Error: {e}")
 
@@ -267,15 +320,27 @@ class LightFixture():
             "cl-green": self.currentLeftGreen,
             "cl-blue": self.currentLeftBlue,
         }
-        payload = json.dumps(data)
-        self.mqtt_client.publish(self.attrs_topic, payload)
+        self.reporter.report(data)
 
     # --- Main Loop ---
-    def run(self):
+    async def run_async(self, runtime):
+        self.wakeup = asyncio.Event()
+        self.runtime = runtime
+        deadline = None
         while True:
+            # The commands received while waiting are applied before actuating
+            self.wakeup.clear()
+            self.apply_commands()
             self.update_current_color()
-            self.actuate()
+            if self.fadeDuration > 0:
+                await self.fade(runtime)
+            else:
+                await runtime.blocking(self.actuate)  # strip.show blocks while the DMA sends the colors
             self.save_data()
             self.send_data()
             logging.info(f"Fixture object: {self.__dir__()}")
-            time.sleep(self.collectInterval)
\ No newline at end of file
+            # Woken at the next transition of the schedule too, to switch at the exact time
+            transition, _ = self.schedule.next_transition()
+            deadline = await runtime.scheduler.sleep(
+                self.collectInterval, deadline, wake=self.wakeup, until=monotonic_deadline(transition)
+            )
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Author: Rafael Gomes Alves
+Description: This script uses an object oriented programming to define the device runtime of a gateway.
+Every device of the gateway runs as a coroutine on a single asyncio event loop, instead of
+one thread per device, so a gateway can host hundreds of devices with a flat memory use:
+- Each device defines `async def run_async(self, runtime)`, its main loop, and waits for its next
+  deadline with `await runtime.scheduler.sleep(interval, deadline)` (see scheduler.py), so the
+  devices with the same interval wake together and their measures are published once per tick
+- The blocking calls to the hardware (Ex. Adafruit_DHT.read_retry, strip.show) go to a small
+  thread pool with `await runtime.blocking(function, *args)`, so they never stop the event loop
+- A device that receives a command is woken at once with `runtime.notify(event)`, from the MQTT
+  thread, instead of waiting for its next deadline
+- A device whose loop fails is logged and started again after RESTART_DELAY seconds
+- Ctrl+C or SIGTERM cancels every device and waits for the running hardware calls to finish
+The number of threads of the pool is set by the RUNTIME_WORKERS environment variable (default 4).
+"""
+
+import asyncio
+import logging
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.scheduler import TickScheduler
+
+RESTART_DELAY = 5  # Seconds before starting again a device that failed
+
+
+class DeviceRuntime:
+    def __init__(self, workers=None):
+        self.workers = workers or int(os.environ.get("RUNTIME_WORKERS", "4"))
+        self.devices = []
+        self.executor = None
+        self.loop = None
+        self.stopped = None
+        self.scheduler = None
+
+    def add(self, device):
+        """Add a device with a `run_async(runtime)` coroutine to the runtime."""
+        self.devices.append(device)
+        return device
+
+    async def blocking(self, function, *args):
+        """Run a blocking call in the thread pool and wait for its result without blocking the loop."""
+        return await self.loop.run_in_executor(self.executor, function, *args)
+
+    async def supervise(self, device):
+        name = getattr(device, "sensor_id", type(device).__name__)
+        while True:
+            try:
+                self.scheduler.enter()
+                await device.run_async(self)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception(f"Device: {name} | Runtime | Restarting in {RESTART_DELAY} seconds")
+                self.scheduler.leave()
+                await asyncio.sleep(RESTART_DELAY)
+
+    def notify(self, event):
+        """Set an asyncio event from another thread, Ex. to wake a device from an MQTT callback."""
+        try:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            pass  # The runtime already stopped, the command is applied at the next start
+
+    def stop(self):
+        """Stop the runtime, Ex. from a signal handler or another thread."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    async def main(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="device-io")
+
+        # The measures queued by the devices are published by the MQTT clients after each tick
+        clients = {device.mqtt_client for device in self.devices if hasattr(device, "mqtt_client")}
+        self.scheduler = TickScheduler([client.flush_measures for client in clients])
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(sig, self.stopped.set)
+
+        tasks = [asyncio.create_task(self.supervise(device)) for device in self.devices]
+        logging.info(f"Runtime | Devices: {len(tasks)} | Workers: {self.workers}")
+        try:
+            await self.stopped.wait()
+        finally:
+            logging.info("Runtime | Stopping the devices...")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.scheduler.flush()
+            # Wait for the hardware calls already running, Ex. a DHT22 read
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                self.loop.remove_signal_handler(sig)
+
+    def run(self):
+        """Run every device until Ctrl+C or SIGTERM."""
+        asyncio.run(self.main())
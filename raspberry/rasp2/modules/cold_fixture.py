@@ -20,20 +20,24 @@ The sensor class should be able to:
 """
 
 import random
+import asyncio
 import json
 import time
-import sqlite3
 import logging
 import os
-import dotenv
-import RPi.GPIO as GPIO
-import datetime
+import threading
+
+from lib.config_store import get_store
+from lib.schedule import monotonic_deadline, parse_recipe, photoperiod
+from lib.hal import get_gpio
+from lib.report import ChangeReporter
+from lib.sqlite_writer import get_writer
 
 
 class Cold():
     def __init__(self, mqtt_client, sensor_key, sensor_id):
         # --- Set environement file --- 
-        self.dotenv_file = "/home/lab/Desktop/rasp-bottom/.env"
+        self.config = get_store(os.environ.get("DOTENV_FILE", "/home/lab/Desktop/rasp-bottom/.env"))  # Settings saved by command (see config_store.py)
         
         # --- Sensor Attributes as defined in the IoT Agent JSON ---
         self.sensor_key = sensor_key  # API Key from IoT Agent JSON
@@ -44,6 +48,10 @@ class Cold():
         self.endTime = os.environ.get(f"{self.sensor_id}_endTime", "20:00:00")
         self.status = os.environ.get(f"{self.sensor_id}_status", "off") 
         self.collectInterval = int(os.environ.get(f"{self.sensor_id}_collectInterval", "60"))
+        # Daily recipe with several segments, Ex. "06:00=on,12:00=off,13:00=on,18:00=off", instead of startTime and endTime
+        self.recipe = os.environ.get(f"{self.sensor_id}_recipe")
+        self.schedule = self.compile_schedule()
+        self.control = None  # State set by the local climate control, instead of the schedule
 
         # MQTT Topics as defined in the IoT Agent JSON
         self.attrs_topic = f"/json/{self.sensor_key}/{self.sensor_id}/attrs"
@@ -51,12 +59,25 @@ class Cold():
         
         # --- Device attributes need for the GPIO library ---
         self.pin = int(os.environ.get(f"{self.sensor_id}_PIN", "17"))
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.pin, GPIO.OUT)
+        self.gpio = get_gpio()  # RPi.GPIO or the simulated GPIO (see hal.py)
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(self.pin, self.gpio.OUT)
+
+        # --- SQLite writer shared by the devices of the gateway ---
+        self.database = os.environ.get("DATABASE_FILE", "/home/lab/Desktop/rasp-bottom/data-bottom.db")
+        self.sqlite_writer = get_writer(self.database)
+        self.sqlite_writer.create_table(self.sensor_id, "status TEXT")
 
         # --- MQTT Client Inheritence ---
         # super().__init__()
         self.mqtt_client = mqtt_client
+        # Only the measures that changed are published (see report.py)
+        self.reporter = ChangeReporter(self.mqtt_client, self.sensor_id, self.attrs_topic)
+        # Commands received by MQTT and waiting for the device loop, the latest value of each one
+        self.commands = {}
+        self.commands_lock = threading.Lock()
+        self.runtime = None
+        self.wakeup = None  # Event that wakes the device loop, created on its event loop
         self.mqtt_client.connect()
         self.mqtt_client.subscribe(self.cmd_topic)
         self.mqtt_client.message_callback_add(self.cmd_topic, self.receive_commands)
@@ -71,97 +92,113 @@ class Cold():
 
     # --- MQTT Callbacks ---
     def receive_commands(self, client, userdata, message):
+        # Called in the MQTT thread: the command is only recorded, and the device loop is woken to apply it
         payload = json.loads(message.payload.decode())
-
-        if payload.get("setStartTime"):
-            self.update_start_time(payload.get("setStartTime"))
-        elif payload.get("setEndTime"):
-            self.update_end_time(payload.get("setEndTime"))
-        elif self.get("setCollectInterval"):
-            self.update_collect_interval(payload.get("setCollectInterval"))
+        with self.commands_lock:
+            self.commands.update(payload)  # A command waiting for the same attribute is replaced by the newer one
+        if self.runtime is not None:
+            self.runtime.notify(self.wakeup)
+
+    def apply_commands(self):
+        with self.commands_lock:
+            commands, self.commands = self.commands, {}
+        if commands.get("setStartTime"):
+            self.update_start_time(commands["setStartTime"])
+        if commands.get("setEndTime"):
+            self.update_end_time(commands["setEndTime"])
+        if commands.get("setCollectInterval"):
+            self.update_collect_interval(commands["setCollectInterval"])
 
     def update_start_time(self, startTime):
+        # The schedule is compiled first, so an invalid time is refused and the current one is kept
+        try:
+            schedule = self.compile_schedule(startTime, self.endTime)
+        except (AttributeError, TypeError, ValueError) as e:
+            logging.error(f"Device: {self.sensor_id} | Invalid Start Time {startTime} | Error: {e}")
+            self.reporter.acknowledge({"setStartTime_info": f"Invalid start time {startTime}: {e}", "setStartTime_status": "ERROR"})
+            return
+        self.startTime, self.schedule = startTime, schedule
         logging.debug(
             f"Device: {self.sensor_id} | Start Time updated to {self.startTime}"
         )
-        self.startTime = startTime
-        dotenv.set_key(self.dotenv_file, f"{self.sensor_id}_startTime", str(self.startTime))
+        self.config.set(f"{self.sensor_id}_startTime", self.startTime)
 
         data = {
             "st": self.startTime,
             "setStartTime_info": f"Updated to {self.startTime,}",
             "setStartTime_status": "OK",
         }
-        payload = json.dumps(data)
-        self.mqtt_client.publish(self.attrs_topic, payload)
+        self.reporter.acknowledge(data)
 
     def update_end_time(self, endTime):
+        try:
+            schedule = self.compile_schedule(self.startTime, endTime)
+        except (AttributeError, TypeError, ValueError) as e:
+            logging.error(f"Device: {self.sensor_id} | Invalid End Time {endTime} | Error: {e}")
+            self.reporter.acknowledge({"setEndTime_info": f"Invalid end time {endTime}: {e}", "setEndTime_status": "ERROR"})
+            return
+        self.endTime, self.schedule = endTime, schedule
         logging.debug(
             f"Device: {self.sensor_id} | End Time updated to {self.endTime}"
         )
-        self.endTime = endTime
-        dotenv.set_key(self.dotenv_file, f"{self.sensor_id}_startTime", str(self.endTime))
+        self.config.set(f"{self.sensor_id}_endTime", self.endTime)
 
         data = {
             "et": self.endTime,
             "setEndTime_info": f"Updated to {self.endTime,}",
             "setEndTime_status": "OK",
         }
-        payload = json.dumps(data)
-        self.mqtt_client.publish(self.attrs_topic, payload)
+        self.reporter.acknowledge(data)
         
     def update_collect_interval(self, collectInterval):
         logging.debug(
             f"Device: {self.sensor_id} | Collect Interval updated to {self.collectInterval}"
         )
         self.collectInterval = collectInterval
-        dotenv.set_key(self.dotenv_file, f"{self.sensor_id}_collectInterval", str(self.collectInterval))
+        self.config.set(f"{self.sensor_id}_collectInterval", self.collectInterval)
 
         data = {
             "collectInterval": self.collectInterval,
             "setCollectInterval_info": f"Updated to {self.collectInterval,}",
             "setCollectInterval_status": "OK",
         }
-        payload = json.dumps(data)
-        self.mqtt_client.publish(self.attrs_topic, payload)
+        self.reporter.acknowledge(data)
 
     # --- Utility methods
+    def compile_schedule(self, startTime=None, endTime=None):
+        """Compile the photoperiod, or the daily recipe if defined, into a transition table (see schedule.py)."""
+        # The photoperiod is compiled even with a recipe, so an invalid time is never saved
+        period = photoperiod(startTime or self.startTime, endTime or self.endTime)
+        if self.recipe:
+            return parse_recipe(self.recipe)
+        return period
+
     def is_between(self):
-        start_time = datetime.datetime.strptime(self.startTime, "%H:%M:%S").time()
-        end_time = datetime.datetime.strptime(self.endTime, "%H:%M:%S").time()
-        now = datetime.datetime.now().time()
-        if start_time < end_time:
-            return start_time <= now <= end_time
-        else:
-            return start_time <= now or now <= end_time
+        return self.schedule.state_at()
+
+    def set_control(self, on):
+        """Drive the device from the local climate control (see climate.py), None gives it back to its schedule."""
+        self.control = on
+        if self.wakeup is not None:
+            self.wakeup.set()
 
     # --- Main device methods
     def actuate(self):
         logging.debug(f"Actuating {self.sensor_id}")
-        if self.is_between():
+        on = self.is_between() if self.control is None else self.control
+        if on:
             # Turn the pump on
             self.status = "On"
-            GPIO.output(self.pin, GPIO.HIGH)
-        elif not self.is_between():
+            self.gpio.output(self.pin, self.gpio.HIGH)
+        else:
             # Turn the pump off
             self.status = "Off"
-            GPIO.output(self.pin, GPIO.LOW)
+            self.gpio.output(self.pin, self.gpio.LOW)
 
     def save_data(self):
         logging.debug(f"Saving data to sqlite {self.sensor_id}")
-        # Create table
         try:
-            conn = sqlite3.connect("/home/lab/Desktop/rasp-bottom/data-bottom.db")
-            cur = conn.cursor()
-            table_name = f"`{self.sensor_id}`"
-            cur.execute(
-                f"CREATE TABLE IF NOT EXISTS {table_name} (id INTEGER PRIMARY KEY AUTOINCREMENT, status TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)"
-            )
-            cur.execute(
-                f"INSERT INTO {table_name} (status) VALUES (?)", (self.status,)
-                )
-            conn.commit()
-            conn.close()
+            self.sqlite_writer.insert(self.sensor_id, {"status": self.status})
         except Exception as e:
             logging.error(f"Device: {self.sensor_id} | Save to SQL | Error: {e}")
 
@@ -174,16 +211,25 @@ class Cold():
                 "et": self.endTime,
                 "timestamp": time.time()
             }
-            payload = json.dumps(message)
-            self.mqtt_client.publish(self.attrs_topic, payload)
+            self.reporter.report(message)
         except Exception as e:
             logging.error(f"Device: {self.sensor_id} | Send to MQTT | Error: {e}")
 
     # --- Main Loop ---
-    def run(self):
+    async def run_async(self, runtime):
+        self.wakeup = asyncio.Event()
+        self.runtime = runtime
+        deadline = None
         while True:
+            # The commands received while waiting are applied before actuating
+            self.wakeup.clear()
+            self.apply_commands()
             logging.info(f"Cold LED object: {self.__dir__()}")
             self.actuate()
             self.save_data()
             self.send_data()
-            time.sleep(self.collectInterval)
\ No newline at end of file
+            # Woken at the next transition of the schedule too, to switch at the exact time
+            transition, _ = self.schedule.next_transition()
+            deadline = await runtime.scheduler.sleep(
+                self.collectInterval, deadline, wake=self.wakeup, until=monotonic_deadline(transition)
+            )
\ No newline at end of file
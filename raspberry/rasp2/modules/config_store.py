@@ -0,0 +1,154 @@
+"""
+Author: Rafael Gomes Alves
+Description: This script uses an object oriented programming to define the configuration store of the gateway.
+The devices save the settings received by command (Ex. the collect interval) in the .env file
+of the gateway, so they are kept after a restart. dotenv.set_key rewrites the whole file on every
+call, in the MQTT network thread, and the devices share the same file. The store instead:
+- Keeps the settings in memory, so set() only updates a dictionary and returns at once
+- Writes the file from its own thread, debounced: the updates received within `delay` seconds
+  (at most `max_delay` seconds after the first one) are merged into a single write
+- Writes atomically: the file is written to a temporary file in the same folder, then renamed,
+  so a power loss never leaves a partial .env file
+- Keeps the other lines of the file (comments, other keys) as they are
+The settings are written as dotenv.set_key does, Ex. dht22:001_collectInterval='5'.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+
+# Stores of the gateway, one per file
+_stores = {}
+_stores_lock = threading.Lock()
+
+# Key of a line of a .env file, Ex. "export dht22:001_collectInterval='5'"
+_key = re.compile(r"^\s*(?:export\s+)?([^\s=#]+)\s*=")
+
+
+def get_store(path):
+    """Return the store of a .env file, starting it on first use."""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ConfigStore(path)
+        return _stores[path]
+
+
+def close_stores():
+    """Write the settings waiting in every store and stop their threads."""
+    with _stores_lock:
+        stores = list(_stores.values())
+        _stores.clear()
+    for store in stores:
+        store.close()
+
+
+class ConfigStore:
+    def __init__(self, path, delay=1.0, max_delay=5.0):
+        self.path = path
+        self.delay = delay
+        self.max_delay = max_delay
+        self.values = {}  # Settings set since the start
+        self.pending = {}  # Settings not written yet
+        self.first_update = None
+        self.last_update = None
+        self.closed = False
+        self.writes = 0
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()  # flush() and the store thread never write at the same time
+
+        self.thread = threading.Thread(target=self.run, name=f"config-store {path}", daemon=True)
+        self.thread.start()
+
+    # --- Methods used by the devices ---
+    def get(self, key, default=None):
+        """Return a setting, from the store or from the environment."""
+        with self.condition:
+            return self.values.get(key, os.environ.get(key, default))
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, values):
+        """
+        Save settings, written to the file later by the store thread.
+
+        args:
+            values (dict): The value of each key. Ex. {"dht22:001_collectInterval": 5}
+        """
+        now = time.monotonic()
+        with self.condition:
+            values = {key: str(value) for key, value in values.items()}
+            self.values.update(values)
+            self.pending.update(values)
+            if self.first_update is None:
+                self.first_update = now
+            self.last_update = now
+            self.condition.notify()
+
+    def flush(self):
+        """Write the settings waiting, from the calling thread."""
+        self.write()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    # --- Store thread ---
+    def write(self):
+        # The settings are taken under the write lock, so an older write never follows a newer one
+        with self.write_lock:
+            with self.condition:
+                pending, self.pending = self.pending, {}
+                self.first_update = None
+            if pending:
+                self.write_file(pending)
+
+    def write_file(self, pending):
+        lines = []
+        try:
+            with open(self.path) as file:
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            pass
+
+        # Replace the lines of the keys that exist, and add the new keys at the end
+        remaining = dict(pending)
+        for index, line in enumerate(lines):
+            match = _key.match(line)
+            if match and match.group(1) in remaining:
+                key = match.group(1)
+                lines[index] = f"{key}='{remaining.pop(key)}'"
+        lines.extend(f"{key}='{value}'" for key, value in remaining.items())
+
+        temporary = f"{self.path}.tmp"
+        try:
+            with open(temporary, "w") as file:
+                file.write("\n".join(lines) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+            self.writes += 1
+        except OSError as e:
+            logging.error(f"Config store | File: {self.path} | Write of {len(pending)} settings | Error: {e}")
+
+    def run(self):
+        while True:
+            with self.condition:
+                # Wait for an update, then until no update is received for `delay` seconds
+                while not self.closed:
+                    if self.first_update is None:
+                        self.condition.wait()
+                        continue
+                    deadline = min(self.last_update + self.delay, self.first_update + self.max_delay)
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self.condition.wait(timeout)
+                closed = self.closed
+            self.write()
+            if closed:
+                return
@@ -0,0 +1,200 @@
+"""
+Author: Rafael Gomes Alves
+Description: This script uses an object oriented programming to define the hardware abstraction layer of the gateway.
+The devices do not call RPi.GPIO, Adafruit_DHT and rpi_ws281x directly, they get their hardware
+from this module, with one of two backends:
+- real: the libraries of the Raspberry Pi, imported only when the backend is used
+- simulated: hardware in memory that runs on any computer, to profile and load test the devices:
+    - GPIO records the mode and the output of each pin, and the last changes of the outputs
+    - DHT22 returns a temperature and a humidity with noise, takes SIM_DHT22_LATENCY seconds
+      per read, fails with a probability of SIM_DHT22_FAILURE_RATE, and read_retry retries like
+      Adafruit_DHT.read_retry (15 retries, 2 seconds apart)
+    - The LED strip records its pixels and takes SIM_STRIP_PIXEL_TIME seconds per pixel to show
+      them, like the 800 kHz signal of a WS2812 strip (30 us per pixel)
+The backend is chosen with set_backend() before the devices are created, Ex. `python main.py --simulate`,
+or else with the HARDWARE environment variable ("real" by default, "simulated" or "sim"), read when
+the first device is created, so it can be defined in the .env file of the gateway. The random
+numbers of the simulation are seeded with SIM_SEED, if defined.
+"""
+
+import collections
+import itertools
+import os
+import random
+import threading
+import time
+
+BACKENDS = ("real", "simulated")
+ALIASES = {"sim": "simulated"}
+
+_backend = None  # Backend chosen with set_backend(), else HARDWARE is used
+_gpio = None
+_lock = threading.Lock()
+
+
+def _check(backend):
+    backend = ALIASES.get(backend, backend)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown hardware backend '{backend}', expected one of {BACKENDS}")
+    return backend
+
+
+def set_backend(backend):
+    """Choose the backend used by the devices created from now on, 'real' or 'simulated'."""
+    global _backend, _gpio
+    backend = _check(backend)
+    with _lock:
+        _backend, _gpio = backend, None
+
+
+def get_backend():
+    """Return the backend chosen with set_backend(), or else the one of HARDWARE, read at each call."""
+    if _backend is not None:
+        return _backend
+    return _check(os.environ.get("HARDWARE", "real"))
+
+
+def get_gpio():
+    """Return the GPIO of the gateway, shared by every device."""
+    global _gpio
+    with _lock:
+        if _gpio is None:
+            if get_backend() == "real":
+                import RPi.GPIO as GPIO
+
+                _gpio = GPIO
+            else:
+                _gpio = SimulatedGPIO()
+        return _gpio
+
+
+def get_dht22(pin):
+    """Return the DHT22 sensor connected to a pin."""
+    if get_backend() == "real":
+        return RealDHT22(pin)
+    return SimulatedDHT22(pin)
+
+
+def get_strip(count, pin, frequency=800000, dma=10, invert=False, brightness=255, channel=0, strip_type="GRB"):
+    """Return the LED strip connected to a pin, with the parameters of rpi_ws281x.Adafruit_NeoPixel."""
+    if get_backend() == "real":
+        from rpi_ws281x import Adafruit_NeoPixel, ws
+
+        return Adafruit_NeoPixel(
+            count, pin, frequency, dma, invert, brightness, channel, getattr(ws, f"WS2811_STRIP_{strip_type}")
+        )
+    return SimulatedStrip(count)
+
+
+def _seed(*key):
+    seed = os.environ.get("SIM_SEED")
+    return None if seed is None else f"{seed}:{':'.join(map(str, key))}"
+
+
+# --- Real backend ---
+class RealDHT22:
+    def __init__(self, pin):
+        import Adafruit_DHT
+
+        self.library = Adafruit_DHT
+        self.pin = pin
+
+    def read(self):
+        """Read the sensor once, returning (None, None) if the read failed."""
+        return self.library.read(self.library.DHT22, self.pin)
+
+    def read_retry(self):
+        return self.library.read_retry(self.library.DHT22, self.pin)
+
+
+# --- Simulated backend ---
+class SimulatedGPIO:
+    BCM, IN, OUT, LOW, HIGH = "BCM", "IN", "OUT", 0, 1
+
+    def __init__(self):
+        self.mode = None
+        self.pins = {}  # Pin -> mode
+        self.outputs = {}  # Pin -> value
+        self.history = collections.deque(maxlen=10000)  # (time, pin, value) of the last changes
+        self.writes = 0
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, mode):
+        self.pins[pin] = mode
+
+    def output(self, pin, value):
+        if self.pins.get(pin) != self.OUT:
+            raise RuntimeError(f"The GPIO channel {pin} has not been set up as an OUTPUT")
+        self.writes += 1
+        if self.outputs.get(pin) != value:
+            self.history.append((time.time(), pin, value))
+        self.outputs[pin] = value
+
+    def input(self, pin):
+        return self.outputs.get(pin, self.LOW)
+
+
+class SimulatedDHT22:
+    instances = itertools.count()  # Each sensor has its own random numbers, even on the same pin
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.latency = float(os.environ.get("SIM_DHT22_LATENCY", "0.25"))
+        self.failure_rate = float(os.environ.get("SIM_DHT22_FAILURE_RATE", "0.1"))
+        self.retries = 15
+        self.retry_delay = 2
+        self.random = random.Random(_seed("dht22", pin, next(self.instances)))
+        self.temperature = self.random.uniform(20, 28)
+        self.humidity = self.random.uniform(45, 75)
+        self.reads = 0
+        self.failures = 0
+
+    def read(self):
+        """Read the sensor once, returning (None, None) if the read failed."""
+        time.sleep(self.latency)
+        self.reads += 1
+        if self.random.random() < self.failure_rate:
+            self.failures += 1
+            return None, None
+        # Slow drift of the room, and the noise of the sensor
+        self.temperature += self.random.gauss(0, 0.05)
+        self.humidity = min(100, max(0, self.humidity + self.random.gauss(0, 0.2)))
+        return (
+            round(self.humidity + self.random.gauss(0, 0.3), 1),
+            round(self.temperature + self.random.gauss(0, 0.1), 1),
+        )
+
+    def read_retry(self):
+        for attempt in range(self.retries):
+            humidity, temperature = self.read()
+            if humidity is not None and temperature is not None:
+                return humidity, temperature
+            time.sleep(self.retry_delay)
+        return None, None
+
+
+class SimulatedStrip:
+    def __init__(self, count):
+        self.pixels = [0] * count
+        self.pixel_time = float(os.environ.get("SIM_STRIP_PIXEL_TIME", "0.00003"))
+        self.shows = 0
+
+    def begin(self):
+        pass
+
+    def numPixels(self):
+        return len(self.pixels)
+
+    def setPixelColor(self, n, color):
+        if 0 <= n < len(self.pixels):
+            self.pixels[n] = color
+
+    def getPixelColor(self, n):
+        return self.pixels[n]
+
+    def show(self):
+        if self.pixel_time:
+            time.sleep(self.pixel_time * len(self.pixels))
+        self.shows += 1
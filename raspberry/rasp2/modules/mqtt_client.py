@@ -1,12 +1,93 @@
 """
 Author: Rafael Gomes Alves
 Description: This script uses an object oriented programming to define a MQTT client.
+The messages published while the client is disconnected are kept in an outbox, a SQLite
+file, and replayed when the client reconnects:
+- The replay runs in its own thread, so the devices never wait for it
+- The messages are written to the outbox by the same thread, in batches with one commit every
+  OUTBOX_STORE_INTERVAL seconds, so a publish while disconnected only appends the message to a
+  queue in memory
+- The messages of each device (topic) are replayed in the order they were published
+- The replay is limited to OUTBOX_RATE messages per second, so the broker is not flooded
+- New messages go to the outbox while it is not empty, so they do not overtake older ones
+- The outbox keeps at most OUTBOX_MAX_MESSAGES messages, dropping the oldest ones
+The measures of the devices are queued with publish_measures and published by flush_measures
+after each tick of the scheduler, merged in a single multi-measure message per device.
 """
 
 import paho.mqtt.client as mqtt
+import json
 import logging
 import os
+import sqlite3
+import threading
 import time
+from collections import deque
+
+
+class Outbox:
+    def __init__(self, path, max_messages=100000):
+        self.max_messages = max_messages
+        self.lock = threading.Lock()
+        self.pending = deque()  # Messages not written to the file yet, see store()
+        self.pending_lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT,
+                payload TEXT
+            )"""
+        )
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def __len__(self):
+        with self.pending_lock:
+            return self.size + len(self.pending)
+
+    def put(self, topic, payload):
+        """Queue a message, written to the file by store(). Called by the devices, it never waits for the file."""
+        with self.pending_lock:
+            self.pending.append((topic, payload))
+
+    def store(self):
+        """Write the queued messages to the file, in a single transaction, and return their number."""
+        with self.lock:
+            with self.pending_lock:
+                batch = list(self.pending)
+            if not batch:
+                return 0
+            self.conn.executemany("INSERT INTO outbox (topic, payload) VALUES (?, ?)", batch)
+            size = self.size + len(batch)
+            if size > self.max_messages:
+                dropped = size - self.max_messages
+                self.conn.execute("DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)", (dropped,))
+                size = self.max_messages
+                logging.warning(f"Outbox full | Dropped the {dropped} oldest messages")
+            self.conn.commit()
+            # The messages stay queued until they are in the file, so the outbox never looks empty in between
+            with self.pending_lock:
+                for _ in batch:
+                    self.pending.popleft()
+                self.size = size
+        return len(batch)
+
+    def take(self, limit=100):
+        """Return the next messages to replay, ordered by device (topic) and by age."""
+        self.store()
+        with self.lock:
+            return self.conn.execute("SELECT id, topic, payload FROM outbox ORDER BY topic, id LIMIT ?", (limit,)).fetchall()
+
+    def remove(self, ids):
+        with self.lock:
+            self.conn.executemany("DELETE FROM outbox WHERE id = ?", [(id,) for id in ids])
+            self.conn.commit()
+            size = self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            with self.pending_lock:
+                self.size = size
+
 
 class MqttClient:
     def __init__(self):
@@ -17,6 +98,22 @@ class MqttClient:
         
         print(f"{self.broker_address} and {self.port}")
         self.connected = False
+        self.published = 0  # Messages published or stored in the outbox
+
+        # Outbox of the messages published while disconnected
+        self.outbox = Outbox(
+            os.environ.get("OUTBOX_FILE", "/home/lab/Desktop/rasp-bottom/outbox.db"),
+            int(os.environ.get("OUTBOX_MAX_MESSAGES", "100000")),
+        )
+        self.outbox_rate = float(os.environ.get("OUTBOX_RATE", "50"))  # Messages per second
+        self.outbox_store_interval = float(os.environ.get("OUTBOX_STORE_INTERVAL", "1"))  # Seconds between writes while disconnected
+        self.replay_event = threading.Event()
+        self.replay_thread = threading.Thread(target=self.replay, daemon=True)
+        self.replay_thread.start()
+
+        # Measures waiting for the end of the tick, merged per device (topic)
+        self.measures = {}
+        self.measures_lock = threading.Lock()
         
         # Set callbacks
         self.client.on_connect = self.on_connect
@@ -27,6 +124,7 @@ class MqttClient:
         if rc == 0:
             print("Connected to MQTT broker")
             self.connected = True
+            self.replay_event.set()
         else:
             print(f"Connection failed with code {rc}")
             self.connected = False
@@ -51,10 +149,57 @@ class MqttClient:
                 time.sleep(5)
 
     def publish(self, topic, message):
-        if self.connected:
-            self.client.publish(topic, message)
-        else:
-            print("Not connected to the broker. Cannot publish message.")
+        self.published += 1
+        # Keep the order of the messages: while the outbox is not empty, new messages wait in it
+        if self.connected and not len(self.outbox):
+            result = self.client.publish(topic, message)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                return
+        if not self.connected:
+            print("Not connected to the broker. Message stored in the outbox.")
+        self.outbox.put(topic, message)
+        self.replay_event.set()
+
+    def publish_measures(self, topic, measures):
+        """Queue the measures of a device, published with its other measures of the same tick."""
+        with self.measures_lock:
+            self.measures.setdefault(topic, {}).update(measures)
+
+    def flush_measures(self):
+        """Publish the queued measures, one multi-measure message per device, and return the number of messages."""
+        with self.measures_lock:
+            measures, self.measures = self.measures, {}
+        for topic, data in measures.items():
+            self.publish(topic, json.dumps(data))
+        return len(measures)
+
+    def replay(self):
+        """Write the messages queued in the outbox, and publish them while connected, limited to outbox_rate messages per second."""
+        while True:
+            self.replay_event.wait()
+            self.replay_event.clear()
+            if not self.connected:
+                # Wait for the messages of the next ticks, so they are written in a single transaction
+                time.sleep(self.outbox_store_interval)
+            self.outbox.store()
+            next_time = time.monotonic()
+            while self.connected and len(self.outbox):
+                published = []
+                for id, topic, payload in self.outbox.take():
+                    if not self.connected:
+                        break
+                    # Pace the messages on the monotonic clock
+                    delay = next_time - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_time = max(next_time, time.monotonic() - 1) + 1 / self.outbox_rate
+                    if self.client.publish(topic, payload).rc != mqtt.MQTT_ERR_SUCCESS:
+                        break
+                    published.append(id)
+                self.outbox.remove(published)
+                logging.info(f"Outbox | Replayed: {len(published)} | Waiting: {len(self.outbox)}")
+                if not published:
+                    break
 
     def subscribe(self, topic):
         self.client.subscribe(topic)
@@ -63,6 +208,8 @@ class MqttClient:
         self.client.message_callback_add(topic, callback)
 
     def disconnect(self):
+        # The messages still queued are kept for the next start
+        self.outbox.store()
         self.client.disconnect()
         self.client.loop_stop()
         
@@ -0,0 +1,121 @@
+"""
+Author: Rafael Gomes Alves
+Description: This script uses an object oriented programming to define the schedules of the actuators.
+A schedule is compiled once, when the device starts or receives a new setting, into a table of
+transitions sorted by their offset in a period, so the devices do not parse their times on every loop:
+- photoperiod(): on between a start and an end time of the day, Ex. the light fixtures
+- duty_cycle(): on for `on` seconds, then off for `off` seconds, Ex. the pump
+- parse_recipe(): a daily recipe with several segments, Ex. "06:00=on,12:00=off,13:00=on,18:00=off"
+The state at a time and the next transition are found by binary search in the table, so the
+devices can sleep until the next transition exactly instead of waking up to check the time.
+The daily schedules follow the local time of the gateway, the duty cycles start at the Unix
+epoch, so they keep the same phase after a restart.
+"""
+
+import bisect
+import time
+
+DAY = 24 * 60 * 60
+
+
+def parse_time(text):
+    """Return the seconds since midnight of a time of the day. Ex. "08:30:00" or "08:30" -> 30600"""
+    parts = [int(part) for part in text.strip().split(":")]
+    if not 2 <= len(parts) <= 3:
+        raise ValueError(f"Invalid time '{text}', expected HH:MM:SS")
+    hours, minutes, seconds = (parts + [0])[:3]
+    if not (0 <= hours < 24 and 0 <= minutes < 60 and 0 <= seconds < 60):
+        raise ValueError(f"Invalid time '{text}', expected HH:MM:SS")
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def monotonic_deadline(wall_time):
+    """Convert a time of the wall clock (Ex. a transition) to a deadline on the monotonic clock."""
+    return time.monotonic() + wall_time - time.time()
+
+
+class Schedule:
+    def __init__(self, transitions, period=DAY, daily=True):
+        """
+        Compile a list of transitions.
+
+        args:
+            transitions (list): The (offset in seconds, state) of each transition. Ex. [(28800, True), (64800, False)]
+            period (float): The period of the schedule in seconds. Default is a day.
+            daily (bool): Offsets from the local midnight, or from the Unix epoch. Default is True.
+        """
+        self.period = period
+        self.daily = daily
+        # The last transition given for an offset wins
+        table = dict((offset % period, state) for offset, state in transitions)
+        if not table:
+            raise ValueError("A schedule needs at least one transition")
+        offsets = sorted(table)
+        states = [table[offset] for offset in offsets]
+
+        # A transition to the state already active is not a transition (the table wraps around)
+        keep = [index for index in range(len(offsets)) if states[index] != states[index - 1]] or [0]
+        self.offsets = [offsets[index] for index in keep]
+        self.states = [states[index] for index in keep]
+
+    def phase(self, t):
+        if self.daily:
+            local = time.localtime(t)
+            return local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec + t % 1
+        return t % self.period
+
+    def state_at(self, t=None):
+        """Return the state of the schedule at a time of the wall clock, now by default."""
+        t = time.time() if t is None else t
+        # The state before the first transition of the period is the last one of the previous period
+        return self.states[bisect.bisect_right(self.offsets, self.phase(t)) - 1]
+
+    def next_transition(self, t=None):
+        """
+        Return the next transition after a time of the wall clock, now by default.
+
+        Returns:
+            tuple: The (time, state) of the transition. A schedule with a single state returns the start of its next period.
+        """
+        t = time.time() if t is None else t
+        phase = self.phase(t)
+        index = bisect.bisect_right(self.offsets, phase)
+        if index < len(self.offsets):
+            offset = self.offsets[index]
+        else:
+            index, offset = 0, self.offsets[0] + self.period
+        return t + offset - phase, self.states[index]
+
+
+def photoperiod(start, end):
+    """Daily schedule on (True) from `start` to `end`, Ex. "08:00:00" and "18:00:00". The end can be after midnight."""
+    start, end = parse_time(start), parse_time(end)
+    if start == end:
+        return Schedule([(0, True)])  # Same start and end, on all day
+    return Schedule([(start, True), (end, False)])
+
+
+def duty_cycle(on, off):
+    """Schedule on (True) for `on` seconds, then off (False) for `off` seconds."""
+    if on <= 0 or off <= 0:
+        return Schedule([(0, on > 0)], period=max(on + off, 1), daily=False)
+    return Schedule([(0, True), (on, False)], period=on + off, daily=False)
+
+
+def parse_recipe(text):
+    """
+    Parse a daily recipe with several segments.
+
+    args:
+        text (str): The time and state of each transition, separated by commas. Ex. "06:00=on,12:00=off,13:00=on,18:00=off"
+
+    Returns:
+        Schedule: The daily schedule, on (True) or off (False).
+    """
+    transitions = []
+    for segment in text.split(","):
+        start, state = segment.split("=")
+        if state.strip().lower() not in ("on", "off"):
+            raise ValueError(f"Invalid state '{state}' in the recipe, expected on or off")
+        transitions.append((parse_time(start), state.strip().lower() == "on"))
+    return Schedule(transitions)
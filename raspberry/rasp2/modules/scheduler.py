@@ -0,0 +1,130 @@
+"""
+Author: Rafael Gomes Alves
+Description: This script uses an object oriented programming to define the tick scheduler of the device runtime.
+The devices do not sleep on their own: they wait for a deadline on the monotonic clock, and
+the scheduler wakes every device with the same deadline from a single timer (a tick):
+- The deadlines of a device are computed from its previous deadline, not from the end of its
+  work, so the interval does not drift with the time spent reading or publishing
+- With `align=True` the deadlines are the multiples of the interval on the monotonic clock, so
+  devices with the same interval share their ticks whenever they were started
+- Deadlines closer than `resolution` seconds are merged in the same tick
+- When every device woken by a tick is waiting again, the measures queued during the tick are
+  published, one multi-measure message per device, or after `linger` seconds at most
+- A device that missed its deadline, Ex. a long read, skips to the next tick instead of catching up
+- A device can also be woken before its deadline by an event, Ex. a command to apply at once,
+  or by an earlier deadline, Ex. the next transition of its schedule (see schedule.py), and then
+  keeps the same deadline for its next tick
+"""
+
+import asyncio
+import logging
+import math
+import time
+
+
+class TickScheduler:
+    def __init__(self, flush=None, resolution=0.01, linger=1.0):
+        self.flush_callbacks = flush or []
+        self.resolution = resolution
+        self.linger = linger
+        self.loop = asyncio.get_running_loop()
+        self.ticks = {}  # Tick key -> future shared by the devices waiting for it
+        self.awake = set()  # Tasks woken by a tick and still working
+        self.wakeups = 0
+        self.flushes = 0
+
+    def next_deadline(self, interval, previous=None, align=True):
+        """
+        Compute the next deadline of a device on the monotonic clock.
+
+        args:
+            interval (float): The interval of the device in seconds. Ex. 60
+            previous (float): The previous deadline of the device. Default is now.
+            align (bool): Put the deadline on the multiples of the interval. Default is True.
+
+        Returns:
+            float: The deadline, never in the past.
+        """
+        now = time.monotonic()
+        base = now if previous is None else previous
+        if align:
+            deadline = (math.floor(base / interval + 1e-9) + 1) * interval
+        else:
+            deadline = base + interval
+        if deadline < now:
+            logging.debug(f"Scheduler | Missed deadline by {now - deadline:.3f} seconds")
+            deadline = (math.floor(now / interval) + 1) * interval if align else now + interval
+        return deadline
+
+    async def sleep(self, interval, previous=None, align=True, wake=None, until=None):
+        """
+        Wait for the next deadline of a device and return it, to compute the following one.
+
+        args:
+            interval (float): The interval of the device in seconds. Ex. 60
+            previous (float): The previous deadline of the device. Default is now.
+            align (bool): Put the deadline on the multiples of the interval. Default is True.
+            wake (asyncio.Event): An event that wakes the device before the deadline. Default is None.
+            until (float): An earlier deadline on the monotonic clock, Ex. the next transition of a schedule. Default is None.
+
+        Returns:
+            float: The deadline, or `previous` if the device was woken before it, so the next call waits for the same deadline.
+        """
+        deadline = self.next_deadline(interval, previous, align)
+        if until is not None and until < deadline:
+            await self.sleep_until(until, wake)
+            return previous
+        return deadline if await self.sleep_until(deadline, wake) else previous
+
+    async def sleep_until(self, deadline, wake=None):
+        """
+        Wait for a deadline on the monotonic clock, or for an event.
+
+        Returns:
+            bool: True if the deadline was reached, False if the device was woken before it.
+        """
+        # Rounded up, so a device never wakes before its deadline, Ex. just before a transition
+        key = math.ceil(deadline / self.resolution - 1e-6)
+        if key not in self.ticks:
+            self.ticks[key] = self.loop.create_future()
+            self.loop.call_at(key * self.resolution, self.fire, key)
+        future = self.ticks[key]
+
+        self.leave()
+        # Shield the shared future, so a cancelled device does not cancel the tick of the others
+        tick = asyncio.shield(future)
+        if wake is None:
+            await tick
+        else:
+            woken = asyncio.ensure_future(wake.wait())
+            try:
+                await asyncio.wait({tick, woken}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                tick.cancel()
+                woken.cancel()
+        self.enter()
+        return future.done()
+
+    def fire(self, key):
+        future = self.ticks.pop(key)
+        future.set_result(None)
+        self.wakeups += 1
+        self.loop.call_later(self.linger, self.flush)
+
+    def enter(self):
+        """Mark the current device as working, Ex. when it starts."""
+        self.awake.add(asyncio.current_task())
+
+    def leave(self):
+        """Mark the current device as done with its tick, publishing the measures once every device is done."""
+        task = asyncio.current_task()
+        if task in self.awake:
+            self.awake.discard(task)
+            if not self.awake:
+                self.flush()
+
+    def flush(self):
+        published = sum(callback() for callback in self.flush_callbacks)
+        if published:
+            self.flushes += 1
+            logging.debug(f"Scheduler | Wakeups: {self.wakeups} | Published: {published} devices")
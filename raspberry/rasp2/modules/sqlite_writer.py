@@ -0,0 +1,159 @@
+"""
+Author: Rafael Gomes Alves
+Description: This script uses an object oriented programming to define a shared SQLite writer.
+Every device of the gateway saves its data through the same writer, instead of opening its
+own connection for each sample. The writer:
+- Holds a single connection to the database in WAL mode, owned by its own thread
+- Creates the table of each device once, when the device starts
+- Takes the rows to insert from a queue, so save_data returns without waiting for the SD card
+- Commits the rows in groups, when `batch_size` rows are waiting or after `flush_interval` seconds
+The timestamp of each row is taken when the row is queued, so it does not depend on the group commit.
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+# Writers of the gateway, one per database file
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(database):
+    """Return the writer of a database, starting it on first use."""
+    with _writers_lock:
+        if database not in _writers:
+            _writers[database] = SqliteWriter(database)
+        return _writers[database]
+
+
+def close_writers():
+    """Commit the rows waiting in every writer and close the connections."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+class SqliteWriter:
+    def __init__(self, database, batch_size=100, flush_interval=1.0):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.rows_written = 0
+        self.commits = 0
+
+        self.thread = threading.Thread(target=self.run, name=f"sqlite-writer {database}", daemon=True)
+        self.thread.start()
+
+    # --- Methods used by the devices ---
+    def create_table(self, table, columns):
+        """
+        Create the table of a device if it does not exist.
+
+        args:
+            table (str): The table name. Ex. the device id
+            columns (str): The columns of the table, besides id and timestamp. Ex. "temperature REAL, humidity REAL"
+        """
+        self.queue.put(
+            (
+                f"""CREATE TABLE IF NOT EXISTS `{table}` (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    {columns}
+                )""",
+                None,
+            )
+        )
+
+    def insert(self, table, row):
+        """
+        Queue a row to be inserted in a table.
+
+        args:
+            table (str): The table name. Ex. the device id
+            row (dict): The value of each column. Ex. {"temperature": 24.0, "humidity": 55.0}
+        """
+        row = {"timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()), **row}
+        columns = ",".join(row)
+        placeholders = ",".join("?" * len(row))
+        self.queue.put((f"INSERT INTO `{table}` ({columns}) VALUES ({placeholders})", tuple(row.values())))
+
+    def flush(self, timeout=None):
+        """Wait until every queued row is committed."""
+        done = threading.Event()
+        self.queue.put(("FLUSH", done))
+        return done.wait(timeout)
+
+    def close(self):
+        done = threading.Event()
+        self.queue.put(("CLOSE", done))
+        done.wait()
+        self.thread.join()
+
+    # --- Writer thread ---
+    def connect(self):
+        while True:
+            try:
+                conn = sqlite3.connect(self.database)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                return conn
+            except sqlite3.Error as e:
+                logging.error(f"SQLite writer | Database: {self.database} | Connect | Error: {e}")
+                time.sleep(5)
+
+    def commit(self, conn, pending):
+        # Group the rows by statement, so each statement runs once with executemany
+        statements = {}
+        for statement, values in pending:
+            statements.setdefault(statement, []).append(values)
+        try:
+            with conn:
+                for statement, rows in statements.items():
+                    if rows[0] is None:
+                        conn.execute(statement)
+                    else:
+                        conn.executemany(statement, rows)
+            self.rows_written += sum(len(rows) for rows in statements.values() if rows[0] is not None)
+            self.commits += 1
+        except sqlite3.Error as e:
+            logging.error(f"SQLite writer | Database: {self.database} | Commit of {len(pending)} rows | Error: {e}")
+
+    def run(self):
+        conn = self.connect()
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                statement, values = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                statement, values = None, None
+
+            if statement in ("FLUSH", "CLOSE"):
+                if pending:
+                    self.commit(conn, pending)
+                pending, deadline = [], None
+                if statement == "CLOSE":
+                    conn.close()
+                    values.set()
+                    return
+                values.set()
+                continue
+
+            if statement is not None:
+                pending.append((statement, values))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                # Tables are created before any row is inserted in them
+                if values is None or len(pending) >= self.batch_size:
+                    self.commit(conn, pending)
+                    pending, deadline = [], None
+            elif pending:
+                self.commit(conn, pending)
+                pending, deadline = [], None